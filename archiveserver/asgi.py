@@ -2,15 +2,52 @@
 ASGI config for archiveserver project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is the deployment path for the search API: the async search view runs
+on the server's event loop, sharing archive connections between requests,
+e.g.
+
+    uvicorn archiveserver.asgi:application --workers 4
+
+Set SEARCH_SHARED_FLIGHT with several workers so they coalesce searches too.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "archiveserver.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from search.async_api import close as close_sessions
+from search.workers import pool
+from searchapi.views import search_service
+
+
+async def lifespan(receive, send):
+    """
+    On shutdown, close the shared archive sessions and the Redis connection
+    pool, and stop the worker pool
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_sessions()
+            await search_service.close()
+            # Waits for running workers, so keep it off the loop
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -71,6 +71,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "archiveserver.wsgi.application"
+# The search API is async; serve it through ASGI (see asgi.py)
+ASGI_APPLICATION = "archiveserver.asgi.application"
 
 
 # Database
@@ -160,3 +162,7 @@ STATICFILES_DIRS = [
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Coalesce identical concurrent searches across worker processes through a
+# Redis lock (in-process coalescing is always on)
+SEARCH_SHARED_FLIGHT = False
@@ -1,9 +1,14 @@
 # __init__.py
 
-# Import the MoeSearcher class so it's accessible at the package level
-from .moesearcher import MoeSearcher
-from .async_api import search, thread, post
-from .utilities import Utilities
+# The package-level names are imported on first access (PEP 562), so that
+# importing one submodule doesn't load the whole package and its dependencies
+_EXPORTS = {
+    "MoeSearcher": ".moesearcher",
+    "search": ".async_api",
+    "thread": ".async_api",
+    "post": ".async_api",
+    "Utilities": ".utilities",
+}
 
 __all__ = ["MoeSearcher", "search", "thread", "post", "Utilities"]
 
@@ -12,4 +17,16 @@ __version__ = "1.0.0"
 __author__ = "Half"
 __description__ = "A package for searching and processing posts from various archives."
 
-# You can also initialize any required setup here if needed
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        from importlib import import_module
+
+        value = getattr(import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -2,33 +2,53 @@ import asyncio
 import aiohttp
 from .moesearch import *
 from .exceptions import ArchiveException
+from .sessions import sessions
+from .scheduler import scheduler
+from .store import store, thread_posts
+from .warosu import parse_search_page
+from .workers import pool
 import time
 import os
 import json
 import logging
+import weakref
 from pathlib import Path
-from bs4 import BeautifulSoup
-
-# Optional imports that may not be available
-try:
-    import undetected_chromedriver as uc
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    import browser_cookie3
-
-    CHROMEDRIVER_AVAILABLE = True
-except ImportError:
-    CHROMEDRIVER_AVAILABLE = False
-    print(
-        "Warning: undetected_chromedriver, selenium, or browser_cookie3 not available. Some functionality may be limited."
-    )
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)  # Changed from '4plebs_selenium' to module name
 
+# Optional browser stack, imported on first use by chromedriver_available()
+uc = By = WebDriverWait = EC = browser_cookie3 = None
+CHROMEDRIVER_AVAILABLE = None
+
+
+def chromedriver_available():
+    """Import undetected_chromedriver/selenium/browser_cookie3 once; True if present"""
+    global CHROMEDRIVER_AVAILABLE, uc, By, WebDriverWait, EC, browser_cookie3
+    if CHROMEDRIVER_AVAILABLE is None:
+        try:
+            import undetected_chromedriver as uc
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support.ui import WebDriverWait
+            from selenium.webdriver.support import expected_conditions as EC
+            import browser_cookie3
+
+            CHROMEDRIVER_AVAILABLE = True
+        except ImportError:
+            CHROMEDRIVER_AVAILABLE = False
+            logger.warning(
+                "undetected_chromedriver, selenium, or browser_cookie3 not available. Some functionality may be limited."
+            )
+    return CHROMEDRIVER_AVAILABLE
+
+
 FOOLFUUKA_API_URL = "%s/_/api/chan"
+PLEBS_URL = "https://archive.4plebs.org"
+PLEBS_TIMEOUT = 60
+# Seconds to wait before retrying after a connection error
+RETRY_DELAY = 2
+WAROSU_URL = "https://warosu.org"
 SHOW_WINDOW = True
 
 
@@ -37,9 +57,12 @@ class PlebsSession:
     _driver = None
     _cookies = None
     _last_init = 0
-    _session = None
     INIT_COOLDOWN = 300  # 5 minutes
 
+    def __init__(self):
+        # The cookies applied to each (loop, host) session, by session
+        self._applied_cookies = weakref.WeakKeyDictionary()
+
     @classmethod
     async def get_instance(cls):
         if not cls._instance:
@@ -48,7 +71,7 @@ class PlebsSession:
 
     def _setup_chrome_options(self):
         """Configure Chrome options for stealth operation"""
-        if not CHROMEDRIVER_AVAILABLE:
+        if not chromedriver_available():
             raise ImportError(
                 "undetected_chromedriver is not available. Please install it to use this functionality."
             )
@@ -67,7 +90,7 @@ class PlebsSession:
         return options
 
     def _get_chrome_cookies(self):
-        if not CHROMEDRIVER_AVAILABLE:
+        if not chromedriver_available():
             logger.warning("browser_cookie3 not available, cannot get Chrome cookies")
             return []
 
@@ -82,17 +105,16 @@ class PlebsSession:
             return []
 
     async def get_session(self):
-        """Get or create aiohttp session with current cookies"""
-        if not self._session:
-            timeout = aiohttp.ClientTimeout(total=60)
-            self._session = aiohttp.ClientSession(timeout=timeout)
-            if self._cookies:
-                self._session.cookie_jar.update_cookies(self.get_cookies_dict())
-        return self._session
+        """Get the shared 4plebs session with the current cookies applied"""
+        session = sessions.get(PLEBS_URL)
+        if self._cookies and self._applied_cookies.get(session) is not self._cookies:
+            session.cookie_jar.update_cookies(self.get_cookies_dict())
+            self._applied_cookies[session] = self._cookies
+        return session
 
     async def wait_for_cloudflare(self, driver):
         """Wait for Cloudflare challenge to be solved"""
-        if not CHROMEDRIVER_AVAILABLE:
+        if not chromedriver_available():
             logger.error("Selenium not available, cannot wait for Cloudflare")
             return False
 
@@ -109,7 +131,7 @@ class PlebsSession:
             return False
 
     async def init_session(self, force=False):
-        if not CHROMEDRIVER_AVAILABLE:
+        if not chromedriver_available():
             logger.warning(
                 "Chrome driver not available, cannot initialize 4plebs session"
             )
@@ -197,83 +219,90 @@ class PlebsSession:
                 self._driver = None
 
     async def close(self):
-        """Close both driver and session"""
+        """Close the driver and forget the session cookies"""
         await self.close_driver()
-        if self._session:
-            try:
-                await self._session.close()
-            except Exception as e:
-                logger.error(f"Error closing session: {e}")
-            finally:
-                self._session = None
         self._cookies = None
+        self._applied_cookies.clear()
 
 
-async def fetch_json(url, params=None, retries=2):
-    """Fetch JSON with special handling for 4plebs"""
+async def fetch_json(url, params=None, retries=2, raise_errors=False):
+    """
+    Fetch JSON with special handling for 4plebs. Returns None on failure;
+    an archive error payload is None too, or raised as ArchiveException
+    with ``raise_errors``.
+    """
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         "Accept": "application/json",
     }
 
-    # Only use PlebsSession for 4plebs
-    if "4plebs" in url:
+    # Only use PlebsSession for 4plebs, which needs its Cloudflare cookies
+    is_plebs = "4plebs" in url
+    if is_plebs:
         plebs_session = await PlebsSession.get_instance()
-        session = await plebs_session.get_session()
-    else:
-        # Use regular session for other archives
-        timeout = aiohttp.ClientTimeout(total=30)
-        session = aiohttp.ClientSession(timeout=timeout)
+        timeout = aiohttp.ClientTimeout(total=PLEBS_TIMEOUT)
 
-    try:
-        for attempt in range(retries + 1):
-            try:
-                async with session.get(url, params=params, headers=headers) as req:
+    for attempt in range(retries + 1):
+        try:
+            async with scheduler.slot(url) as ticket:
+                if is_plebs:
+                    session = await plebs_session.get_session()
+                    request = session.get(
+                        url, params=params, headers=headers, timeout=timeout
+                    )
+                else:
+                    session = sessions.get(url)
+                    request = session.get(url, params=params, headers=headers)
+                async with request as req:
+                    ticket.record(req.status, req.headers.get("Retry-After"))
                     text = await req.text()
+        except Exception as e:
+            logger.error(f"Error in fetch (attempt {attempt + 1}/{retries + 1}): {e}")
+            if attempt < retries:
+                # The limiter backed off, but its bucket may still hold tokens
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            return None
 
-                    try:
-                        res = json.loads(text)
-                        if ArchiveException.is_error(res):
-                            logger.warning(f"ArchiveException: {res}")
-                            return None
-                        return res
-                    except json.JSONDecodeError:
-                        if "4plebs" in url and any(
-                            x in text.lower()
-                            for x in ["captcha", "javascript", "cloudflare"]
-                        ):
-                            if attempt < retries:
-                                logger.info(
-                                    "4plebs protection detected - reinitializing session..."
-                                )
-                                await plebs_session.init_session(force=True)
-                                continue
-                        logger.error("Invalid JSON response")
-                        return None
+        # 429/5xx already made the scheduler back off this host
+        if ticket.throttled and attempt < retries:
+            logger.warning(f"{url} returned {ticket.status}, retrying")
+            continue
 
-            except Exception as e:
-                logger.error(
-                    f"Error in fetch (attempt {attempt + 1}/{retries + 1}): {e}"
-                )
+        try:
+            res = json.loads(text)
+            if ArchiveException.is_error(res):
+                logger.warning(f"ArchiveException: {res}")
+                if raise_errors:
+                    raise ArchiveException(res.get("error") or res)
+                return None
+            return res
+        except json.JSONDecodeError:
+            if is_plebs and any(
+                x in text.lower() for x in ["captcha", "javascript", "cloudflare"]
+            ):
                 if attempt < retries:
-                    await asyncio.sleep(2)
+                    logger.info(
+                        "4plebs protection detected - reinitializing session..."
+                    )
+                    await plebs_session.init_session(force=True)
                     continue
-                return None
-    finally:
-        # Only close non-4plebs sessions
-        if not "4plebs" in url and session:
-            await session.close()
+            logger.error("Invalid JSON response")
+            return None
 
     return None
 
 
-async def warosu_search(board, **kwargs):
-    """Search Warosu archive"""
+async def warosu_search(board, archiver_url=WAROSU_URL, retries=2, **kwargs):
+    """
+    Search Warosu archive; returns the page's posts, or None on failure
+    (so a failed page is not taken for the end of the results)
+    """
     # Clean up board name
     board = str(board).strip().lower().replace("/", "")
 
     # Construct URL with proper board and search parameters
-    url = f"https://warosu.org/{board}"
+    url = f"{archiver_url.rstrip('/')}/{board}"
 
     params = {
         "task": "search",
@@ -294,105 +323,52 @@ async def warosu_search(board, **kwargs):
         params["search_datefrom"] = kwargs["datefrom"]
     if kwargs.get("dateto"):
         params["search_dateto"] = kwargs["dateto"]
-    if kwargs.get("limit"):
-        params["limit"] = kwargs["limit"]
+    # Fuuka pages its results by post offset (24 per page)
+    if kwargs.get("offset"):
+        params["offset"] = int(kwargs["offset"])
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                logger.info(f"Warosu response status: {response.status}")
-                if response.status != 200:
-                    logger.error(f"Warosu returned status {response.status}")
-                    return []
-
-                html = await response.text()
-                if not html:
-                    logger.error("Empty response from Warosu")
-                    return []
-
-                logger.info("Parsing Warosu HTML response")
-                soup = BeautifulSoup(html, "html.parser")
-
-                posts = []
-                # Look for posts in both replies and OPs
-                for post_div in soup.select(".reply, .post-wrapper"):
-                    try:
-                        # Extract post number
-                        post_link = post_div.select_one("a.js")
-                        if not post_link:
-                            continue
-                        post_num = post_link.text.replace("No.", "")
-
-                        # Extract comment
-                        comment_elem = post_div.select_one("blockquote")
-                        comment = (
-                            comment_elem.get_text(strip=True) if comment_elem else ""
-                        )
-
-                        # Get timestamp
-                        time_elem = post_div.select_one(".posttime")
-                        timestamp = (
-                            int(time_elem["title"])
-                            if time_elem and "title" in time_elem.attrs
-                            else 0
-                        )
-
-                        # Get image if present
-                        media = None
-                        img_elem = post_div.select_one(".thumb")
-                        if img_elem and img_elem.parent.name == "a":
-                            media = {
-                                "media_link": img_elem.parent["href"],
-                                "media_orig": img_elem["src"],
-                                "media_filename": img_elem.get("alt", ""),
-                                "media_w": None,
-                                "media_h": None,
-                                "media_size": None,
-                                "media_hash": None,
-                                "media_status": "normal",
-                            }
-
-                        # Create post data dictionary in FoolFuuka format
-                        post_data = {
-                            "num": post_num,
-                            "timestamp": str(timestamp),
-                            "comment": comment,
-                            "media": media,
-                            "board": {
-                                "name": board,
-                                "shortname": board,  # Changed from short_name to shortname
-                            },
-                            "thread_num": post_num,  # For OPs this is the same as post_num
-                            "poster_country": "",
-                            "poster_country_name": "",
-                            "poster_hash": "",
-                            "name": "Anonymous",
-                            "title": "",
-                            "trip": "",
-                            "subnum": "0",
-                            "op": 0,
-                            "email": "",
-                            "sticky": 0,
-                            "locked": 0,
-                            "deleted": 0,
-                        }
-
-                        posts.append(Post(post_data))
-
-                        # Respect limit if specified
-                        if kwargs.get("limit") and len(posts) >= int(kwargs["limit"]):
-                            break
-
-                    except Exception as e:
-                        logger.error(f"Error parsing Warosu post: {e}")
-                        continue
-
-                logger.info(f"Found {len(posts)} posts on Warosu")
-                return posts
+    for attempt in range(retries + 1):
+        try:
+            async with scheduler.slot(url) as ticket:
+                session = sessions.get(url)
+                async with session.get(url, params=params) as response:
+                    ticket.record(response.status, response.headers.get("Retry-After"))
+                    logger.info(f"Warosu response status: {response.status}")
+                    html = await response.text()
+        except Exception as e:
+            logger.error(
+                f"Error searching Warosu (attempt {attempt + 1}/{retries + 1}): {e}"
+            )
+            if attempt < retries:
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            return None
+
+        # 429/5xx already made the scheduler back off this host
+        if ticket.throttled and attempt < retries:
+            logger.warning(f"Warosu returned {ticket.status}, retrying")
+            continue
+        if ticket.status != 200:
+            logger.error(f"Warosu returned status {ticket.status}")
+            return None
+        if not html:
+            logger.error("Empty response from Warosu")
+            return None
+        break
 
+    logger.info("Parsing Warosu HTML response")
+    try:
+        # Parsing is CPU-bound; keep it off the event loop
+        records = await pool.run(
+            parse_search_page, html, board, kwargs.get("limit"), kwargs.get("parser")
+        )
     except Exception as e:
-        logger.error(f"Error searching Warosu: {e}")
-        return []
+        logger.error(f"Error parsing Warosu results: {e}")
+        return None
+    posts = [Post(record) for record in records]
+
+    logger.info(f"Found {len(posts)} posts on Warosu")
+    return posts
 
 
 async def search(archiver_url, board, **kwargs):
@@ -409,14 +385,15 @@ async def search(archiver_url, board, **kwargs):
         )
         try:
             # Don't extract text parameter separately since it's already in kwargs
-            results = await warosu_search(board, **kwargs)
+            results = await warosu_search(board, archiver_url, **kwargs)
             logger.info(
                 f"Warosu search completed with {len(results) if results else 0} results"
             )
+            store.queue_posts(archiver_url, board, results)
             return results
         except Exception as e:
             logger.error(f"Error in Warosu search: {e}")
-            return []
+            return None
 
     # Handle FoolFuuka archives
     try:
@@ -434,6 +411,7 @@ async def search(archiver_url, board, **kwargs):
             return None
 
         res = res["0"]
+        store.queue_posts(archiver_url, board, res["posts"])
         return [Post(post_obj) for post_obj in res["posts"]]
     except Exception as e:
         logger.error(f"Error in FoolFuuka search: {e}")
@@ -441,6 +419,11 @@ async def search(archiver_url, board, **kwargs):
 
 
 async def thread(archiver_url, board, thread_num, latest_doc_id=-1, last_limit=-1):
+    """
+    A FoolFuuka thread, or None if the request failed. An error answer
+    (unknown thread, or no posts after ``latest_doc_id``) raises
+    ArchiveException.
+    """
     url = f"{FOOLFUUKA_API_URL % archiver_url}/thread"
     payload = {"board": str(board), "num": thread_num}
     if latest_doc_id != -1:
@@ -448,10 +431,11 @@ async def thread(archiver_url, board, thread_num, latest_doc_id=-1, last_limit=-
     if last_limit != -1:
         payload["last_limit"] = int(last_limit)
 
-    res = await fetch_json(url, params=payload)
+    res = await fetch_json(url, params=payload, raise_errors=True)
     if res is None:
         return None
 
+    store.queue_posts(archiver_url, board, thread_posts(res))
     try:
         return Thread(res)
     except Exception as e:
@@ -467,42 +451,33 @@ async def post(archiver_url, board, post_num):
     if res is None:
         return None
 
+    store.queue_posts(archiver_url, board, [res])
     return Post(res)
 
 
+async def close():
+    """Close the shared archive sessions, the 4plebs browser session and the post store"""
+    try:
+        plebs_session = await PlebsSession.get_instance()
+        await plebs_session.close()
+    except Exception as e:
+        logger.error(f"Error closing 4plebs session: {e}")
+    await sessions.close()
+    # Waits for pending post store writes, so keep it off the loop
+    await asyncio.get_running_loop().run_in_executor(None, store.close)
+
+
 # Example of how to run your async functions
 async def main():
     archiver_url = "https://desuarchive.org"
     board = "/a/"
-    results = await search(archiver_url, board, text="kson")
-    print(results)
+    try:
+        results = await search(archiver_url, board, text="kson")
+        print(results)
+    finally:
+        await close()
 
 
 # To execute the async main function
 if __name__ == "__main__":
     asyncio.run(main())
-
-# Cleanup when the program exits
-import atexit
-
-
-def cleanup():
-    async def close_session():
-        try:
-            plebs_session = await PlebsSession.get_instance()
-            await plebs_session.close()
-        except Exception as e:
-            logger.error(f"Error during cleanup: {e}")
-
-    try:
-        # Check if there's an event loop available
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(close_session())
-    except RuntimeError:
-        # No event loop in this thread, create a new one
-        asyncio.run(close_session())
-    except Exception as e:
-        logger.error(f"Error during cleanup loop: {e}")
-
-
-atexit.register(cleanup)
@@ -0,0 +1,189 @@
+"""
+Columnar batches of posts: one NumPy/pandas array per field instead of a
+list of nested post dicts
+"""
+
+from importlib.util import find_spec
+
+from .lazy import LazyModule
+from .render import post_texts
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+pyarrow = LazyModule("pyarrow")
+
+ARROW_AVAILABLE = find_spec("pyarrow") is not None
+
+# int64 columns; a missing value is stored as MISSING (no post has num 0 or
+# was posted at the epoch), which dates() and the statistics skip
+INT_COLUMNS = ("num", "subnum", "thread_num", "timestamp")
+MISSING = 0
+# Low-cardinality string columns, stored as pandas Categoricals
+CATEGORY_COLUMNS = ("board", "country", "source")
+# Free text, stored as object arrays of str/None
+STRING_COLUMNS = ("title", "name", "fourchan_date", "comment")
+COLUMNS = INT_COLUMNS + CATEGORY_COLUMNS + STRING_COLUMNS
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def _board(board):
+    if board is None or isinstance(board, str):
+        return board
+    if isinstance(board, dict):
+        return board.get("shortname") or board.get("short_name")
+    return board.shortname
+
+
+def _fields(post):
+    """The batch fields of a post dict or Post model"""
+    if isinstance(post, dict):
+        get = post.get
+        return (
+            get("num"),
+            get("subnum"),
+            get("thread_num"),
+            get("timestamp"),
+            _board(get("board")),
+            get("poster_country_name"),
+            get("title"),
+            get("name"),
+            get("fourchan_date"),
+            get("comment"),
+        )
+    return (
+        post.num,
+        post.subnum,
+        post.thread_num,
+        post.timestamp,
+        _board(post.board),
+        post.poster_country_name,
+        post.title,
+        post.name,
+        post.fourchan_date,
+        post.comment,
+    )
+
+
+def _strings(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class PostBatch:
+    """
+    Posts as columns: int64 ``num``/``subnum``/``thread_num``/``timestamp``,
+    categorical ``board``/``country``/``source`` and object-array
+    ``title``/``name``/``fourchan_date``/``comment``.
+
+    ``records`` keeps the posts the batch was built from (as given, not
+    copied) for the paths that need every field, like the JSON APIs.
+    """
+
+    __slots__ = ("columns", "records")
+
+    def __init__(self, columns, records=None):
+        self.columns = columns
+        self.records = records if records is not None else []
+
+    @classmethod
+    def empty(cls):
+        columns = {name: np.zeros(0, dtype=np.int64) for name in INT_COLUMNS}
+        columns.update({name: pd.Categorical([]) for name in CATEGORY_COLUMNS})
+        columns.update({name: _strings([]) for name in STRING_COLUMNS})
+        return cls(columns)
+
+    @classmethod
+    def from_posts(cls, posts, source=None):
+        """Build a batch from one page of post dicts or Post models"""
+        posts = list(posts or [])
+        if not posts:
+            return cls.empty()
+        rows = list(zip(*(_fields(post) for post in posts)))
+        num, subnum, thread_num, timestamp = (
+            np.fromiter((_int(v) for v in column), dtype=np.int64, count=len(posts))
+            for column in rows[:4]
+        )
+        columns = {
+            "num": num,
+            "subnum": subnum,
+            "thread_num": thread_num,
+            "timestamp": timestamp,
+            "board": pd.Categorical(rows[4]),
+            "country": pd.Categorical(rows[5]),
+            "source": pd.Categorical([source] * len(posts)),
+        }
+        for name, values in zip(STRING_COLUMNS, rows[6:]):
+            columns[name] = _strings(values)
+        return cls(columns, posts)
+
+    @classmethod
+    def concat(cls, batches):
+        """One batch from many, concatenating each column once"""
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+        columns = {}
+        for name in INT_COLUMNS + STRING_COLUMNS:
+            columns[name] = np.concatenate([b.columns[name] for b in batches])
+        for name in CATEGORY_COLUMNS:
+            columns[name] = pd.api.types.union_categoricals(
+                [b.columns[name] for b in batches], ignore_order=True
+            )
+        records = [record for b in batches for record in b.records]
+        return cls(columns, records)
+
+    def __len__(self):
+        return len(self.columns["num"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return f"PostBatch({len(self)} posts)"
+
+    def to_pandas(self):
+        """DataFrame over the batch's arrays (no column is copied)"""
+        data = {}
+        for name in COLUMNS:
+            column = self.columns[name]
+            if name in STRING_COLUMNS:
+                # Keep the object array; pandas would convert it to str dtype
+                column = pd.Series(column, dtype=object, copy=False)
+            data[name] = column
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        """pyarrow Table of the batch (requires pyarrow)"""
+        if not ARROW_AVAILABLE:
+            raise ImportError("pyarrow is not available. Please install it.")
+        return pyarrow.Table.from_pandas(self.to_pandas(), preserve_index=False)
+
+    def to_records(self):
+        """The full post dicts, with ``source`` when the batch has one"""
+        records = []
+        sources = self.columns["source"]
+        for record, source in zip(self.records, sources):
+            if not isinstance(record, dict):
+                record = record.to_dict()
+            if source is not None and source == source:
+                record = {**record, "source": source}
+            records.append(record)
+        return records
+
+    def dates(self):
+        """Post times as datetime64, from the unix timestamps; NaT if missing"""
+        timestamps = self.columns["timestamp"]
+        return pd.to_datetime(timestamps, unit="s").where(timestamps != MISSING)
+
+    def text_array(self):
+        """Posts rendered like ``MoeSearcher.getTextArray``, empty ones dropped"""
+        return post_texts(self)
@@ -0,0 +1,289 @@
+"""
+Redis cache for search results, shared by the Tornado and Django servers
+"""
+
+import asyncio
+import logging
+import time
+
+try:
+    import redis.asyncio as aioredis
+
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+from .codec import CacheCodec
+
+logger = logging.getLogger(__name__)
+
+# (soft, hard) TTLs in seconds. Past the soft TTL an entry is served stale
+# while it is refreshed in the background; at the hard TTL Redis drops it.
+DEFAULT_TTL = (3600, 6 * 3600)
+# Empty and failed searches are cached briefly so a bad query or a dead
+# archive is not re-scraped on every request
+EMPTY_TTL = (120, 300)
+ERROR_TTL = (30, 60)
+# Per-archive overrides keyed by MoeSearcher archive name, e.g. a frozen
+# archive that no longer changes: {"oldarchive": (7 * 86400, 30 * 86400)}
+ARCHIVE_TTLS = {}
+
+
+class CacheEntry:
+    """A cached search result plus its freshness and the limit it was searched with."""
+
+    __slots__ = ("value", "stale", "negative", "error", "limit")
+
+    def __init__(self, value, stale=False, negative=False, error=None, limit=None):
+        self.value = value
+        self.stale = stale
+        self.negative = negative
+        self.error = error
+        self.limit = limit
+
+
+class CircuitBreaker:
+    """
+    Tracks Redis availability from the outcome of real cache operations.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    cache operations are skipped; after ``reset_timeout`` seconds one probe
+    is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Redis unavailable, bypassing the cache")
+            self.opened_at = time.monotonic()
+
+
+class RedisCacheManager:
+    """
+    Async Redis cache with a shared connection pool.
+
+    The pool belongs to the event loop that first used it (the Tornado
+    IOLoop, or the ASGI loop for Django); a different loop gets its own.
+    """
+
+    def __init__(
+        self,
+        host="localhost",
+        port=6379,
+        db=0,
+        password=None,
+        default_ttl=DEFAULT_TTL,
+        archive_ttls=None,
+        max_connections=50,
+        socket_timeout=2,
+        codec=None,
+    ):
+        if not REDIS_AVAILABLE:
+            raise ImportError("redis is not available. Please install it to cache.")
+        self.connection_kwargs = {
+            "host": host,
+            "port": port,
+            "db": db,
+            "password": password,
+            "max_connections": max_connections,
+            "socket_timeout": socket_timeout,
+            "socket_connect_timeout": socket_timeout,
+        }
+        self.codec = codec or CacheCodec()
+        self.breaker = CircuitBreaker()
+        self._client = None
+        self._client_loop = None
+        if isinstance(default_ttl, (int, float)):
+            # A single TTL keeps the old behaviour: no stale window
+            default_ttl = (default_ttl, default_ttl)
+        self.default_ttl = default_ttl
+        self.archive_ttls = dict(ARCHIVE_TTLS if archive_ttls is None else archive_ttls)
+
+    def generate_cache_key(self, params):
+        """Generate a cache key from /api/search request parameters"""
+        from .query import SearchQuery
+
+        return SearchQuery.from_request(params).cache_key
+
+    def ttl_for(self, archives=None, result=None, error=None):
+        """Return the (soft, hard) TTL for a result from ``archives``"""
+        if error is not None:
+            return ERROR_TTL
+        if not result:
+            return EMPTY_TTL
+        policies = [
+            self.archive_ttls[a] for a in archives or [] if a in self.archive_ttls
+        ]
+        if not policies:
+            return self.default_ttl
+        # The most volatile archive decides how long the merged result lives
+        return min(p[0] for p in policies), min(p[1] for p in policies)
+
+    @property
+    def redis_client(self):
+        """The pooled client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            pool = aioredis.ConnectionPool(**self.connection_kwargs)
+            self._client = aioredis.Redis(connection_pool=pool)
+            self._client_loop = loop
+        return self._client
+
+    async def _run(self, operation, default=None):
+        """Run a Redis operation through the circuit breaker"""
+        if not self.breaker.allow():
+            return default
+        try:
+            result = await operation(self.redis_client)
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.error(f"Redis cache error: {e}")
+            return default
+        self.breaker.record_success()
+        return result
+
+    def _decode_entry(self, cached_data):
+        if cached_data is None:
+            return None
+        try:
+            data = self.codec.decode(cached_data)
+        except Exception as e:
+            logger.error(f"Error decoding cached result: {e}")
+            return None
+
+        if not isinstance(data, dict) or "v" not in data:
+            # Entry written before soft TTLs existed
+            return CacheEntry(data)
+        stale = time.time() - data.get("t", 0) > data.get("soft", 0)
+        return CacheEntry(
+            data["v"],
+            stale=stale,
+            negative=data.get("neg", False),
+            error=data.get("err"),
+            limit=data.get("lim"),
+        )
+
+    def _encode_entry(self, result, ttl=None, archives=None, error=None, limit=None):
+        if ttl is None:
+            soft, hard = self.ttl_for(archives, result, error)
+        elif isinstance(ttl, (int, float)):
+            soft, hard = ttl, ttl
+        else:
+            soft, hard = ttl
+        envelope = {
+            "v": result,
+            "t": time.time(),
+            "soft": soft,
+            "neg": error is not None or not result,
+        }
+        if error is not None:
+            envelope["err"] = str(error)
+        if limit is not None:
+            envelope["lim"] = limit
+        return self.codec.encode(envelope), int(hard)
+
+    async def get_entries(self, cache_keys):
+        """Get the entries for several keys in one round-trip (MGET)"""
+        if not cache_keys:
+            return []
+        values = await self._run(
+            lambda client: client.mget(cache_keys), [None] * len(cache_keys)
+        )
+        entries = [self._decode_entry(value) for value in values]
+
+        legacy = [
+            (key, value)
+            for key, value, entry in zip(cache_keys, values, entries)
+            if entry is not None and CacheCodec.is_legacy(value)
+        ]
+        if legacy:
+            await self._migrate(legacy)
+        return entries
+
+    async def _migrate(self, legacy):
+        """Rewrite legacy JSON entries with the current codec, keeping their TTL"""
+
+        async def write(client):
+            async with client.pipeline(transaction=False) as pipe:
+                for cache_key, value in legacy:
+                    data = self.codec.decode(value)
+                    pipe.set(cache_key, self.codec.encode(data), keepttl=True)
+                return await pipe.execute()
+
+        await self._run(write)
+
+    async def get_entry(self, cache_key):
+        """Get the cached entry for a key, or None on a miss"""
+        return (await self.get_entries([cache_key]))[0]
+
+    async def get_cached_result(self, cache_key):
+        """Get cached result by key, stale or not"""
+        entry = await self.get_entry(cache_key)
+        return entry.value if entry is not None else None
+
+    async def set_cached_results(self, items):
+        """
+        Store several ``(cache_key, result, options)`` items in one pipeline.
+
+        ``options`` holds the ``ttl``/``archives``/``error``/``limit`` arguments of
+        ``set_cached_result``. Returns the pipeline replies, or None if
+        nothing was written.
+        """
+
+        async def write(client):
+            async with client.pipeline(transaction=False) as pipe:
+                for cache_key, result, options in items:
+                    payload, hard = self._encode_entry(result, **options)
+                    pipe.setex(cache_key, hard, payload)
+                return await pipe.execute()
+
+        return await self._run(write)
+
+    async def set_cached_result(
+        self, cache_key, result, ttl=None, archives=None, error=None, limit=None
+    ):
+        """
+        Set cached result with soft/hard TTLs.
+
+        ``ttl`` is a number or (soft, hard) pair overriding the policy;
+        otherwise empty results and ``error`` get the short negative TTLs
+        and the rest the per-archive policy. ``limit`` is the per-archive
+        limit the result was searched with (None for no limit). Returns
+        whether the entry was written.
+        """
+        options = {"ttl": ttl, "archives": archives, "error": error, "limit": limit}
+        replies = await self.set_cached_results([(cache_key, result, options)])
+        return bool(replies) and all(replies)
+
+    def is_cache_warm(self):
+        """Whether Redis is considered available (no round-trip)"""
+        return self.breaker.allow()
+
+    async def close(self):
+        """Disconnect the connection pool of the running loop"""
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.connection_pool.disconnect()
+        self._client = None
+        self._client_loop = None
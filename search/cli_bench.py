@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add the server directory to Python path
+server_dir = str(Path(__file__).parent.parent)
+if server_dir not in sys.path:
+    sys.path.insert(0, server_dir)
+
+from search.batch import PostBatch
+from search.codec import CacheCodec, available_compressors, available_serializers
+from search.matcher import compile_query
+from search.moesearch import Post
+from search.moesearcher import build_frame
+from search.render import format_texts, post_texts, write_texts
+from search.warosu import available_parsers, parse_search_page
+from search.utilities import Utilities
+from search.workers import MODES, WorkerPool
+
+WORDS = (
+    "anon thread post image archive board reply bump sage green text lurk "
+    "moar based cringe kek lol what why how when source trust me"
+).split()
+
+
+def synthetic_posts(count, seed=0):
+    """FoolFuuka /search posts with every key the API returns"""
+    rng = random.Random(seed)
+    board = {"name": "Politically Incorrect", "shortname": "pol"}
+    posts = []
+    for i in range(count):
+        num = 100000000 + i
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 80)))
+        media = None
+        if rng.random() < 0.4:
+            media_hash = f"{rng.getrandbits(128):032x}=="
+            media = {
+                "media_id": str(rng.randint(10**6, 10**7)),
+                "spoiler": "0",
+                "preview_orig": f"{num}s.jpg",
+                "media": f"{num}.jpg",
+                "preview_op": None,
+                "preview_reply": f"{num}s.jpg",
+                "preview_w": "125",
+                "preview_h": "125",
+                "media_filename": f"{rng.randint(10**12, 10**13)}.jpg",
+                "media_filename_processed": f"{rng.randint(10**12, 10**13)}.jpg",
+                "media_w": str(rng.randint(200, 4000)),
+                "media_h": str(rng.randint(200, 4000)),
+                "media_size": str(rng.randint(10**4, 10**7)),
+                "media_hash": media_hash,
+                "media_orig": f"{num}.jpg",
+                "exif": None,
+                "total": "1",
+                "banned": "0",
+                "media_status": "available",
+                "safe_media_hash": media_hash.rstrip("="),
+                "remote_media_link": f"https://i.4pcdn.org/pol/{num}.jpg",
+                "media_link": f"https://i.4pcdn.org/pol/{num}.jpg",
+                "thumb_link": f"https://i.4pcdn.org/pol/{num}s.jpg",
+            }
+        comment_processed = f'<span class="greentext">&gt;{text}</span>'
+        posts.append(
+            {
+                "doc_id": str(num),
+                "num": str(num),
+                "subnum": "0",
+                "thread_num": str(num - rng.randint(0, 300)),
+                "op": "0",
+                "timestamp": 1600000000 + i * 7,
+                "timestamp_expired": "0",
+                "capcode": "N",
+                "email": None,
+                "name": "Anonymous",
+                "trip": None,
+                "title": None,
+                "comment": text,
+                "poster_hash": f"{rng.getrandbits(32):08x}",
+                "poster_country": "US",
+                "sticky": "0",
+                "locked": "0",
+                "deleted": "0",
+                "nreplies": None,
+                "nimages": None,
+                "fourchan_date": "10/18/20(Sun)12:00",
+                "comment_sanitized": text,
+                "comment_processed": comment_processed,
+                "formatted": False,
+                "title_processed": None,
+                "name_processed": "Anonymous",
+                "email_processed": None,
+                "trip_processed": None,
+                "poster_hash_processed": f"{rng.getrandbits(32):08x}",
+                "poster_country_name": "United States",
+                "poster_country_name_processed": "United States",
+                "exif": None,
+                "troll_country_code": None,
+                "troll_country_name": None,
+                "media": media,
+                "board": board,
+            }
+        )
+    return posts
+
+
+def synthetic_warosu_page(count, seed=0, board="g"):
+    """A Warosu search results page laid out like warosu.org's"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        num = 90000000 + i
+        lines = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+            for _ in range(rng.randint(1, 4))
+        ]
+        comment = '<span class="greentext">&gt;' + "<br>".join(lines) + "</span>"
+        thumb = ""
+        if rng.random() < 0.4:
+            thumb = (
+                f'<a href="//i.warosu.org/data/{board}/img/{num}.png">'
+                f'<img class="thumb" src="//i.warosu.org/data/{board}/thumb/{num}s.jpg"'
+                f' alt="{num}.png"></a>'
+            )
+        rows.append(
+            "<table><tr><td class=doubledash>&gt;&gt;</td>"
+            f'<td class="reply" id="p{num}">'
+            f'<input type="checkbox" name="delete" value="{num}">'
+            '<span class="postername">Anonymous</span> '
+            f'<span class="posttime" title="{1600000000000 + i * 7000}">'
+            "Sun Oct 18 12:00:00 2020</span> "
+            f'<a class="js" href="/{board}/thread/{num}#p{num}">No.{num}</a>'
+            f"{thumb}<blockquote><p>{comment}</p></blockquote></td></tr></table>"
+        )
+    return (
+        "<html><head><title>Search</title></head><body>"
+        f'<div class="content">{"".join(rows)}</div></body></html>'
+    )
+
+
+def time_it(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def bench_codec(value, repeat):
+    rows = []
+    baseline, encode_ms = time_it(lambda: json.dumps(value, default=str), repeat)
+    _, decode_ms = time_it(lambda: json.loads(baseline), repeat)
+    rows.append(("legacy json", len(baseline.encode("utf-8")), encode_ms, decode_ms))
+
+    for serializer in available_serializers():
+        for compressor in available_compressors():
+            codec = CacheCodec(serializer, compressor)
+            payload, encode_ms = time_it(lambda: codec.encode(value), repeat)
+            _, decode_ms = time_it(lambda: CacheCodec.decode(payload), repeat)
+            rows.append(
+                (f"{serializer}+{compressor}", len(payload), encode_ms, decode_ms)
+            )
+    return rows
+
+
+class LegacyPost:
+    """The pre-slots Post: one attribute per raw key, nested dicts kept raw"""
+
+    def __init__(self, data):
+        for key, value in data.items():
+            setattr(self, key, value)
+
+
+def bench_models(posts, repeat):
+    rows = []
+    utilities = Utilities()
+    for name, cls in (("legacy __dict__", LegacyPost), ("slotted Post", Post)):
+        objects, parse_ms = time_it(lambda: [cls(post) for post in posts], repeat)
+        _, dict_ms = time_it(lambda: utilities.process_posts(objects), repeat)
+        del objects
+        gc.collect()
+        tracemalloc.start()
+        objects = [cls(post) for post in posts]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del objects
+        rows.append((name, size, parse_ms, dict_ms))
+    return rows
+
+
+def legacy_text(df, delim="\n\n"):
+    """The iterrows getTextArray and ``text +=`` formatText they replace"""
+    result = []
+    for _, row in df.iterrows():
+        text = ""
+        if row.get("title"):
+            text += row["title"] + "\n"
+        text += f"{row.get('num')} {row.get('fourchan_date', '')}\n"
+        if row.get("comment"):
+            text += row["comment"]
+        text = text.strip()
+        if text:
+            result.append(text)
+    output = ""
+    for item in result:
+        output += f"{item}{delim}"
+    return output
+
+
+def bench_text(posts, repeat, legacy=True):
+    rows = []
+    import pandas as pd
+
+    df = pd.DataFrame(posts)
+    batch = PostBatch.from_posts(posts)
+    if legacy:
+        output, ms = time_it(lambda: legacy_text(df), repeat)
+        rows.append(("iterrows + +=", len(output), ms))
+    output, ms = time_it(lambda: format_texts(post_texts(df)), repeat)
+    rows.append(("DataFrame columns", len(output), ms))
+    output, ms = time_it(lambda: format_texts(batch.text_array()), repeat)
+    rows.append(("PostBatch columns", len(output), ms))
+    with open(os.devnull, "w", encoding="utf-8") as f:
+        size, ms = time_it(lambda: write_texts(post_texts(df), f.write), repeat)
+    rows.append(("streamed to file", size, ms))
+    return rows
+
+
+# Entry points whose import time is measured
+IMPORT_TARGETS = ("search", "search.moesearcher", "search.cli_search")
+# Dependencies only specific features need; importing a target must not load them
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "bs4", "selenium", "requests")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed * 1000, [m for m in {heavy!r} if m in sys.modules]]))
+"""
+
+
+def bench_imports(modules, repeat):
+    rows = []
+    for module in modules:
+        best = float("inf")
+        loaded = []
+        for _ in range(repeat):
+            # A fresh interpreter per run; nothing is cached in sys.modules
+            probe = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+            output = subprocess.run(
+                [sys.executable, "-c", probe],
+                cwd=server_dir,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            elapsed, loaded = json.loads(output.strip().splitlines()[-1])
+            best = min(best, elapsed)
+        rows.append((module, best, loaded))
+    return rows
+
+
+def bench_warosu(pages, repeat, limit=None):
+    rows = []
+    reference = None
+    for parser in available_parsers():
+        results, ms = time_it(
+            lambda: [parse_search_page(html, "g", limit, parser) for html in pages],
+            repeat,
+        )
+        posts = [post for page in results for post in page]
+        if reference is None:
+            reference = posts
+        rows.append((parser, len(posts), ms, posts == reference))
+    return rows
+
+
+def legacy_regex_search(array, search_terms, case_sensitive=False):
+    """Utilities.regex_search as it was, on parse_search_terms' regexes"""
+    regex_parts = []
+    for term in search_terms.split():
+        if term.startswith("-"):
+            regex_parts.append(f"(?!.*{re.escape(term[1:])})")
+        elif "&" in term:
+            and_part = "".join(f"(?=.*{re.escape(t.strip())})" for t in term.split("&"))
+            regex_parts.append(f"({and_part})")
+        elif "|" in term:
+            or_part = "|".join(f".*{re.escape(t.strip())}.*" for t in term.split("|"))
+            regex_parts.append(f"({or_part})")
+        elif '"' in term:
+            regex_parts.append(f".*\\b{re.escape(term.strip(chr(34)))}\\b.*")
+        else:
+            if "*" in term or "?" in term:
+                term = re.escape(term).replace(r"\*", ".*").replace(r"\?", ".")
+            regex_parts.append(f".*{term}.*")
+    regex = re.compile("".join(regex_parts), 0 if case_sensitive else re.IGNORECASE)
+    found_items = [item for item in array if regex.search(item)]
+    for term in search_terms.split():
+        if term.startswith("-"):
+            negated_term = re.escape(term[1:])
+            found_items = [i for i in found_items if not re.search(negated_term, i)]
+    return found_items
+
+
+MATCH_QUERIES = (
+    "kek",
+    "based -cringe",
+    "lurk&moar",
+    "source|trust",
+    '"green"',
+    "bu*p",
+)
+
+
+def bench_match(texts, queries, repeat):
+    rows = []
+    for query in queries:
+        legacy, legacy_ms = time_it(lambda: legacy_regex_search(texts, query), repeat)
+        compile_query.cache_clear()
+        found, ms = time_it(lambda: compile_query(query).filter(texts), repeat)
+        rows.append((query, len(legacy), legacy_ms, len(found), ms))
+    return rows
+
+
+async def loop_lag(pool, fn, *args):
+    """Time ``fn(*args)`` run through ``pool`` and the longest event loop stall"""
+    stalls = []
+
+    async def tick():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - start - 0.005)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    await pool.run(fn, *args)
+    elapsed = time.perf_counter() - start
+    # The ticker only wakes after an inline run returns
+    await asyncio.sleep(0.01)
+    ticker.cancel()
+    return elapsed * 1000, max(stalls) * 1000
+
+
+def bench_workers(posts, modes, workers):
+    rows = []
+    for mode in modes:
+        pool = WorkerPool(mode, workers, inline_items=0)
+        # Start the pool outside the timing
+        asyncio.run(pool.run(len, []))
+        ms, stall_ms = asyncio.run(loop_lag(pool, build_frame, posts))
+        pool.shutdown()
+        rows.append((pool.mode, ms, stall_ms))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ForArchives benchmarks")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    codec_parser = subparsers.add_parser(
+        "codec", help="Size and speed of the cache payload codecs"
+    )
+    codec_parser.add_argument(
+        "--input", help="JSON file with a cached result (default: synthetic posts)"
+    )
+    codec_parser.add_argument(
+        "--posts", type=int, default=500, help="Number of synthetic posts"
+    )
+    codec_parser.add_argument("--repeat", type=int, default=5, help="Runs per codec")
+
+    models_parser = subparsers.add_parser(
+        "models", help="Memory and parse/serialize time of the post models"
+    )
+    models_parser.add_argument(
+        "--input", help="JSON file with a list of raw posts (default: synthetic)"
+    )
+    models_parser.add_argument(
+        "--posts", type=int, default=20000, help="Number of synthetic posts"
+    )
+    models_parser.add_argument("--repeat", type=int, default=3, help="Runs per model")
+
+    text_parser = subparsers.add_parser(
+        "text", help="Plain-text rendering of search results (--format text)"
+    )
+    text_parser.add_argument(
+        "--input", help="JSON file with a list of raw posts (default: synthetic)"
+    )
+    text_parser.add_argument(
+        "--posts", type=int, default=100000, help="Number of synthetic posts"
+    )
+    text_parser.add_argument("--repeat", type=int, default=1, help="Runs per renderer")
+    text_parser.add_argument(
+        "--no-legacy", action="store_true", help="Skip the (slow) iterrows renderer"
+    )
+
+    imports_parser = subparsers.add_parser(
+        "imports", help="Import time of the package and CLIs (regression guard)"
+    )
+    imports_parser.add_argument(
+        "modules", nargs="*", default=IMPORT_TARGETS, help="Modules to import"
+    )
+    imports_parser.add_argument(
+        "--repeat", type=int, default=5, help="Fresh interpreters per module"
+    )
+    imports_parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Exit with an error if an import takes longer than this",
+    )
+
+    warosu_parser = subparsers.add_parser(
+        "warosu", help="Warosu search page parsing, per HTML backend"
+    )
+    warosu_parser.add_argument(
+        "pages", nargs="*", help="Saved Warosu search pages (default: synthetic)"
+    )
+    warosu_parser.add_argument(
+        "--posts", type=int, default=1000, help="Posts per synthetic page"
+    )
+    warosu_parser.add_argument(
+        "--limit", type=int, default=None, help="Stop parsing after this many posts"
+    )
+    warosu_parser.add_argument("--repeat", type=int, default=3, help="Runs per parser")
+
+    match_parser = subparsers.add_parser(
+        "match", help="Local query matching (Utilities.regex_search)"
+    )
+    match_parser.add_argument(
+        "--posts", type=int, default=100000, help="Number of synthetic posts"
+    )
+    match_parser.add_argument(
+        "--query", action="append", help="Query to time (default: a mixed set)"
+    )
+    match_parser.add_argument("--repeat", type=int, default=1, help="Runs per query")
+
+    workers_parser = subparsers.add_parser(
+        "workers",
+        help="Event loop stalls while a large result set is processed, per pool",
+    )
+    workers_parser.add_argument(
+        "--posts", type=int, default=10000, help="Number of synthetic posts"
+    )
+    workers_parser.add_argument(
+        "--mode", action="append", choices=MODES, help="Pool to time (default: all)"
+    )
+    workers_parser.add_argument(
+        "--workers", type=int, default=None, help="Pool size (default: CPUs, max 4)"
+    )
+
+    args = parser.parse_args()
+
+    value = None
+    if getattr(args, "input", None):
+        with open(args.input, "r", encoding="utf-8") as f:
+            value = json.load(f)
+
+    if args.bench == "codec":
+        if value is None:
+            value = {"results": synthetic_posts(args.posts)}
+        rows = bench_codec(value, args.repeat)
+        baseline_size = rows[0][1]
+        print(
+            f"{'codec':<16}{'bytes':>12}{'ratio':>8}{'encode ms':>12}{'decode ms':>12}"
+        )
+        for name, size, encode_ms, decode_ms in rows:
+            ratio = size / baseline_size
+            print(
+                f"{name:<16}{size:>12}{ratio:>8.2f}{encode_ms:>12.2f}{decode_ms:>12.2f}"
+            )
+
+    elif args.bench == "models":
+        posts = value if value is not None else synthetic_posts(args.posts)
+        # Collections of the young generation would dominate the timings
+        gc.disable()
+        rows = bench_models(posts, args.repeat)
+        gc.enable()
+        print(f"{'model':<18}{'bytes/post':>12}{'parse ms':>12}{'to dict ms':>12}")
+        for name, size, parse_ms, dict_ms in rows:
+            per_post = size / max(len(posts), 1)
+            print(f"{name:<18}{per_post:>12.0f}{parse_ms:>12.2f}{dict_ms:>12.2f}")
+
+    elif args.bench == "text":
+        posts = value if value is not None else synthetic_posts(args.posts)
+        rows = bench_text(posts, args.repeat, legacy=not args.no_legacy)
+        print(f"{'renderer':<20}{'chars':>12}{'ms':>12}")
+        for name, size, ms in rows:
+            print(f"{name:<20}{size:>12}{ms:>12.2f}")
+
+    elif args.bench == "imports":
+        rows = bench_imports(args.modules, args.repeat)
+        failed = False
+        print(f"{'module':<24}{'ms':>10}  heavy modules loaded")
+        for module, ms, loaded in rows:
+            print(f"{module:<24}{ms:>10.1f}  {', '.join(loaded) or '-'}")
+            too_slow = args.max_ms is not None and ms > args.max_ms
+            failed = failed or bool(loaded) or too_slow
+        if failed:
+            sys.exit(1)
+
+    elif args.bench == "match":
+        texts = post_texts(value if value is not None else synthetic_posts(args.posts))
+        rows = bench_match(texts, args.query or MATCH_QUERIES, args.repeat)
+        print(f"{'query':<16}{'legacy hits':>12}{'ms':>10}{'hits':>10}{'ms':>10}")
+        for query, legacy_hits, legacy_ms, hits, ms in rows:
+            print(
+                f"{query:<16}{legacy_hits:>12}{legacy_ms:>10.1f}{hits:>10}{ms:>10.1f}"
+            )
+
+    elif args.bench == "warosu":
+        pages = []
+        for path in args.pages:
+            with open(path, "r", encoding="utf-8") as f:
+                pages.append(f.read())
+        pages = pages or [synthetic_warosu_page(args.posts)]
+        rows = bench_warosu(pages, args.repeat, args.limit)
+        print(f"{'parser':<12}{'posts':>8}{'ms':>12}  same posts as {rows[0][0]}")
+        for name, count, ms, same in rows:
+            print(f"{name:<12}{count:>8}{ms:>12.2f}  {'yes' if same else 'NO'}")
+
+    elif args.bench == "workers":
+        posts = value if value is not None else synthetic_posts(args.posts)
+        rows = bench_workers(posts, args.mode or MODES, args.workers)
+        print(f"{'pool':<10}{'ms':>10}{'longest loop stall ms':>24}")
+        for mode, ms, stall_ms in rows:
+            print(f"{mode:<10}{ms:>10.1f}{stall_ms:>24.1f}")
+
+
+if __name__ == "__main__":
+    main()
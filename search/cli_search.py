@@ -12,9 +12,28 @@ if server_dir not in sys.path:
     sys.path.insert(0, server_dir)
 
 from search.moesearcher import MoeSearcher
+from search.render import write_texts
+from search.store import store
 from search.utilities import Utilities
 
 
+def read_queries(path):
+    """One query per line; blank lines and ``#`` comments are skipped"""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def posts_by_source(results):
+    """``{source: posts}`` of grouped (``{"board", "results"}``) or plain results"""
+    if not isinstance(results, dict):
+        return {"results": results}
+    return {
+        source: group["results"] if isinstance(group, dict) else group
+        for source, group in results.items()
+    }
+
+
 async def main():
     utils = Utilities()
     parser = argparse.ArgumentParser(description="ForArchives CLI Search")
@@ -31,7 +50,15 @@ async def main():
     )
     parser.add_argument("--subject", help="Search within threads with this subject")
     parser.add_argument(
-        "--delay", type=float, default=3.0, help="Delay between requests in seconds"
+        "--queries-file",
+        help="Match every query in this file (one per line) against the results "
+        "(or the --subject threads) in one pass; outputs per-query hits as JSON",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=None,
+        help="Delay between request waves in seconds (default: adaptive)",
     )
     parser.add_argument(
         "--case-sensitive", action="store_true", help="Enable case-sensitive search"
@@ -42,6 +69,16 @@ async def main():
         default="json",
         help="Output format",
     )
+    parser.add_argument(
+        "--local-first",
+        action="store_true",
+        help="Replay identical searches already run from the local post store",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Full-text search the local post store only (FTS5 query syntax)",
+    )
     parser.add_argument("--save", action="store_true", help="Save results to file")
     parser.add_argument("--output", help="Output file path")
 
@@ -49,33 +86,96 @@ async def main():
     archives = json.loads(args.archives)
 
     searcher = MoeSearcher()
+    queries = read_queries(args.queries_file) if args.queries_file else None
 
-    if args.subject:
-        results = await searcher.searchInSubject(
-            archives=archives,
-            subject=args.subject,
-            text=args.query,
-            board=args.board,
-            limit=args.limit,
-            delay=args.delay,
-            case=args.case_sensitive,
-        )
-    else:
-        results = await searcher.multiArchiveSearch(
-            archives=archives,
-            text=args.query,
-            board=args.board,
-            limit=args.limit,
-            delay=args.delay,
-        )
+    try:
+        if args.offline:
+            posts = await store.search(args.query, board=args.board, limit=args.limit)
+            results = {}
+            for post in posts:
+                results.setdefault(post.pop("source"), []).append(post)
+        elif args.subject:
+            subject_kwargs = dict(
+                subject=args.subject,
+                board=args.board,
+                limit=args.limit,
+                delay=args.delay,
+                case=args.case_sensitive,
+            )
+            if queries is not None:
+                searches = (
+                    searcher.searchInSubjectBatch(
+                        archive=archive, queries=queries, **subject_kwargs
+                    )
+                    for archive in archives
+                )
+            else:
+                searches = (
+                    searcher.searchInSubject(
+                        archive=archive, searchText=args.query, **subject_kwargs
+                    )
+                    for archive in archives
+                )
+            found = await asyncio.gather(*searches)
+            results = {
+                searcher.getArchiveName(archive): result
+                for archive, result in zip(archives, found)
+            }
+        elif args.format == "stats":
+            results = await searcher.search_batch(
+                archives=archives,
+                text=args.query,
+                board=args.board,
+                limit=args.limit,
+                delay=args.delay,
+                local_first=args.local_first,
+            )
+        else:
+            results = await searcher.multiArchiveSearch(
+                archives=archives,
+                text=args.query,
+                board=args.board,
+                limit=args.limit,
+                delay=args.delay,
+                local_first=args.local_first,
+            )
+    finally:
+        await searcher.close()
+
+    if queries is not None and not args.subject:
+        # One search, every query matched over its posts
+        sources = [
+            (source, searcher.getTextArray(posts))
+            for source, posts in posts_by_source(results).items()
+        ]
+        results = searcher.match_threads(sources, queries, args.case_sensitive)
 
-    if args.format == "json":
+    if args.format == "json" or queries is not None:
         output = json.dumps(results, indent=2)
     elif args.format == "stats":
-        stats = await searcher.calculate_statistics(results, args.query)
+        total, with_text, percentage, mean_date = await searcher.calculate_statistics(
+            results, args.query
+        )
+        stats = {
+            "total_posts": int(total),
+            "posts_with_text": int(with_text),
+            "percentage": float(percentage),
+            "mean_date": None if mean_date is None else str(mean_date),
+        }
         output = json.dumps(stats, indent=2)
     else:
-        output = searcher.formatText(results)
+        if args.subject:
+            # searchInSubject gives text already: a total, then one list per thread
+            texts = [
+                line
+                for found in results.values()
+                for entry in found or []
+                for line in ([entry] if isinstance(entry, str) else entry)
+            ]
+        else:
+            groups = posts_by_source(results).values()
+            texts = [text for posts in groups for text in searcher.getTextArray(posts)]
+        output = None
 
     if args.save:
         output_path = args.output or os.path.join(
@@ -83,8 +183,13 @@ async def main():
         )
         os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
         with open(output_path, "w", encoding="utf-8") as f:
-            f.write(output)
+            if output is None:
+                write_texts(texts, f.write)
+            else:
+                f.write(output)
         print(f"Results saved to {output_path}")
+    elif output is None:
+        write_texts(texts, sys.stdout.write)
     else:
         print(output)
 
@@ -12,6 +12,25 @@ if server_dir not in sys.path:
     sys.path.insert(0, server_dir)
 
 from search.moesearcher import MoeSearcher
+from search.watcher import ThreadWatcher
+
+
+async def watch(searcher, archive_url, args):
+    """Print the thread, then every new post until interrupted"""
+    watcher = ThreadWatcher(min_interval=args.interval)
+    watcher.watch(archive_url, args.board, args.thread)
+
+    def on_update(watched, new_posts):
+        for post in new_posts:
+            if args.format == "json":
+                print(json.dumps(post, default=str), flush=True)
+            else:
+                print(searcher.toText([post]), flush=True)
+
+    try:
+        await watcher.run(on_update)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
 
 
 async def main():
@@ -22,20 +41,36 @@ async def main():
     parser.add_argument(
         "--format", choices=["json", "text"], default="text", help="Output format"
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep polling the thread and print new posts as they arrive",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=30,
+        help="Seconds between polls while watching (backs off when quiet)",
+    )
     parser.add_argument("--save", action="store_true", help="Save to file")
     parser.add_argument("--output", help="Output file path")
 
     args = parser.parse_args()
 
     searcher = MoeSearcher()
-    thread = await searcher.fetch_thread(
-        archive=args.archive, board=args.board, thread_num=args.thread
-    )
+    archive_url = searcher.getArchive(args.archive)
+    try:
+        if args.watch:
+            await watch(searcher, archive_url, args)
+            return
+        thread = await searcher.fetch_thread(archive_url, args.board, args.thread)
+    finally:
+        await searcher.close()
 
     if args.format == "json":
-        output = json.dumps(thread, indent=2)
+        output = json.dumps(thread.to_dict(orient="records"), indent=2, default=str)
     else:
-        output = searcher.formatText(thread)
+        output = searcher.toText(thread)
 
     if args.save:
         output_path = args.output or f"thread_{args.thread}.{args.format}"
@@ -0,0 +1,160 @@
+"""
+Binary codecs for cached search results
+
+Every encoded payload starts with a 5-byte header: the magic ``FA``, the
+format version, the serializer id and the compressor id. Payloads without
+the header are entries written as plain ``json.dumps`` text before codecs
+existed; they still decode and are reported as legacy so the cache can
+rewrite them.
+"""
+
+import json
+import zlib
+
+# Optional fast serializers and compressors
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+MAGIC = b"FA"
+VERSION = 1
+# Payloads smaller than this are stored uncompressed
+COMPRESS_THRESHOLD = 1024
+
+
+class CodecError(Exception):
+    pass
+
+
+def _json_dumps(obj):
+    # default=str keeps the old json.dumps(default=str) behaviour for datetimes
+    return json.dumps(obj, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(
+        obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, default=str, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+# id: (name, dumps, loads); ids are part of the stored format, never reuse one
+SERIALIZERS = {1: ("json", _json_dumps, json.loads)}
+if orjson is not None:
+    SERIALIZERS[2] = ("orjson", _orjson_dumps, orjson.loads)
+if msgpack is not None:
+    SERIALIZERS[3] = ("msgpack", _msgpack_dumps, _msgpack_loads)
+
+COMPRESSORS = {
+    0: ("none", lambda data: data, lambda data: data),
+    1: ("zlib", lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+if zstandard is not None:
+    COMPRESSORS[2] = (
+        "zstd",
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+if lz4_frame is not None:
+    COMPRESSORS[3] = ("lz4", lz4_frame.compress, lz4_frame.decompress)
+
+
+def _id_for(table, name):
+    for codec_id, (codec_name, _, _) in table.items():
+        if codec_name == name:
+            return codec_id
+    raise CodecError(f"Codec '{name}' is not available")
+
+
+def available_serializers():
+    return [name for name, _, _ in SERIALIZERS.values()]
+
+
+def available_compressors():
+    return [name for name, _, _ in COMPRESSORS.values()]
+
+
+class CacheCodec:
+    """
+    Encode cache values with a serializer and a compressor.
+
+    Decoding reads both from the payload header, so entries written with
+    another codec configuration (or the legacy plain JSON) stay readable.
+    By default the fastest available pair is used: orjson or msgpack over
+    json, zstd or lz4 over zlib.
+    """
+
+    def __init__(self, serializer=None, compressor=None, threshold=COMPRESS_THRESHOLD):
+        if serializer is None:
+            serializer = next(
+                (s for s in ("orjson", "msgpack") if s in available_serializers()),
+                "json",
+            )
+        if compressor is None:
+            compressor = next(
+                (c for c in ("zstd", "lz4") if c in available_compressors()), "zlib"
+            )
+        self.serializer = serializer
+        self.compressor = compressor
+        self.threshold = threshold
+        self._serializer_id = _id_for(SERIALIZERS, serializer)
+        self._compressor_id = _id_for(COMPRESSORS, compressor)
+
+    def __repr__(self):
+        return f"CacheCodec({self.serializer}+{self.compressor})"
+
+    def encode(self, value):
+        data = SERIALIZERS[self._serializer_id][1](value)
+        compressor_id = self._compressor_id
+        if len(data) < self.threshold:
+            compressor_id = 0
+        data = COMPRESSORS[compressor_id][1](data)
+        header = MAGIC + bytes((VERSION, self._serializer_id, compressor_id))
+        return header + data
+
+    @staticmethod
+    def is_legacy(payload):
+        return not payload[:2] == MAGIC
+
+    @staticmethod
+    def decode(payload):
+        """Decode a payload from any codec configuration, or legacy JSON."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        if CacheCodec.is_legacy(payload):
+            return json.loads(payload)
+        version, serializer_id, compressor_id = payload[2], payload[3], payload[4]
+        if version != VERSION:
+            raise CodecError(f"Unsupported cache format version {version}")
+        try:
+            decompress = COMPRESSORS[compressor_id][2]
+            loads = SERIALIZERS[serializer_id][2]
+        except KeyError:
+            raise CodecError(
+                f"Cache entry needs codec {serializer_id}/{compressor_id}, "
+                "which is not installed"
+            )
+        return loads(decompress(payload[5:]))
@@ -0,0 +1,34 @@
+"""
+Deferred imports for heavy dependencies (pandas, numpy, ...), so importing
+the package or starting a CLI doesn't pay for them up front
+"""
+
+import importlib
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access:
+    ``pd = LazyModule("pandas")`` then ``pd.DataFrame(...)`` as usual.
+    """
+
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
@@ -0,0 +1,162 @@
+"""
+Background log writer: callers queue lines, one thread appends them to
+cached file handles and flushes once per batch
+"""
+
+import atexit
+import datetime
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds the writer waits for more lines before flushing a batch
+FLUSH_INTERVAL = 0.5
+# Lines written per batch at most
+BATCH_SIZE = 1000
+# Open file handles kept at most; the least recently used one is closed
+MAX_OPEN_FILES = 32
+
+
+class LogWriter:
+    """
+    Appends text to log files from a daemon thread.
+
+    ``write`` only queues the line, so logging from the event loop does no
+    disk I/O. Handles stay open between batches (up to ``max_open``) and
+    are all closed when the date changes, since log paths are per day.
+    ``FORARCHIVES_LOG_SYNC=1`` writes in the calling thread instead.
+    """
+
+    def __init__(
+        self,
+        flush_interval=FLUSH_INTERVAL,
+        batch_size=BATCH_SIZE,
+        max_open=MAX_OPEN_FILES,
+        synchronous=None,
+    ):
+        if synchronous is None:
+            synchronous = os.getenv("FORARCHIVES_LOG_SYNC", "") not in ("", "0")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_open = max_open
+        self.synchronous = synchronous
+        self._queue = queue.SimpleQueue()
+        self._files = {}
+        self._day = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def write(self, path, text, mode="a", encoding="utf-8"):
+        """Queue ``text`` for ``path``; mode ``"w"`` truncates the file first"""
+        if self.synchronous or self._closed:
+            with self._lock:
+                self._write_batch([(path, text, mode, encoding)])
+                self._close_files()
+            return
+        self._ensure_thread()
+        self._queue.put((path, text, mode, encoding))
+
+    def flush(self, timeout=None):
+        """Block until every line queued so far is on disk"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Flush, stop the thread and close every handle"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        self._closed = True
+        self._close_files()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="forarchives-logwriter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            events = []
+            stop = False
+            # Collect what arrives within the flush interval into one batch
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                else:
+                    batch.append(item)
+                if stop or events or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            for event in events:
+                event.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        today = datetime.date.today()
+        if today != self._day:
+            # Yesterday's paths won't be written again
+            self._close_files()
+            self._day = today
+        touched = set()
+        for path, text, mode, encoding in batch:
+            try:
+                self._file(path, mode, encoding).write(text)
+                touched.add(path)
+            except OSError as e:
+                logger.error(f"Error writing log file {path}: {e}")
+        for path in touched:
+            try:
+                self._files[path].flush()
+            except (KeyError, OSError):
+                pass
+
+    def _file(self, path, mode, encoding):
+        f = self._files.pop(path, None)
+        if f is not None and (mode == "w" or f.encoding != encoding):
+            f.close()
+            f = None
+        if f is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            f = open(path, mode=mode, encoding=encoding)
+            if len(self._files) >= self.max_open:
+                oldest = next(iter(self._files))
+                self._files.pop(oldest).close()
+        # Re-insert so dict order is least recently used first
+        self._files[path] = f
+        return f
+
+    def _close_files(self):
+        files, self._files = self._files, {}
+        for f in files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+writer = LogWriter()
+atexit.register(writer.close)
@@ -0,0 +1,416 @@
+"""
+Compiled search queries for matching post text locally
+
+A query is tokenized and parsed into an AST:
+
+- ``word``: substring match
+- ``a b``, ``a&b``, ``a AND b``: both
+- ``a|b``, ``a OR b``: either (binds tighter than AND: ``a b|c`` is
+  ``a (b|c)``)
+- ``-word``, ``NOT word``: exclusion
+- ``"some phrase"``: whole-word phrase
+- ``wild*card``, ``h?llo``: wildcard within a line
+- ``(...)``: grouping
+
+Matching is case-insensitive unless asked otherwise. Words are plain
+substring tests; phrase and wildcard regexes only run on texts containing
+their longest literal part. Queries with many literals find them all in a
+single Aho-Corasick pass when pyahocorasick is installed.
+
+A ``QuerySet`` checks many queries at once: each text is casefolded once and
+scanned once for the literals of every query, then each query's tree is
+evaluated against the literals found.
+"""
+
+import re
+from functools import lru_cache
+
+try:
+    import ahocorasick
+
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Compiled queries kept by compile_query
+CACHE_SIZE = 256
+# Queries with this many literals are scanned with Aho-Corasick when available
+SCAN_THRESHOLD = 4
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|(\|)|(&)|(-)(?=\S)|"([^"]*)"?|([^\s()|&"]+))')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class Node:
+    """AST node; ``cost`` orders children (substring checks before regexes)"""
+
+    __slots__ = ()
+    literals = ()
+    cost = 0
+
+    def match(self, text):
+        raise NotImplementedError
+
+    def match_present(self, text, present):
+        """Like ``match``, given the set of query literals found in ``text``"""
+        raise NotImplementedError
+
+
+class Literal(Node):
+    __slots__ = ("text", "literals")
+
+    def __init__(self, text):
+        self.text = text
+        self.literals = (text,)
+
+    def match(self, text):
+        return self.text in text
+
+    def match_present(self, text, present):
+        return self.text in present
+
+    def __repr__(self):
+        return f"Literal({self.text!r})"
+
+
+class Pattern(Node):
+    """A regex node (phrase or wildcard) guarded by its longest literal part"""
+
+    __slots__ = ("source", "regex", "literal", "literals")
+    cost = 1
+
+    def __init__(self, source, pattern, literal):
+        self.source = source
+        self.regex = re.compile(pattern)
+        self.literal = literal
+        self.literals = (literal,) if literal else ()
+
+    def match(self, text):
+        if self.literal and self.literal not in text:
+            return False
+        return self.regex.search(text) is not None
+
+    def match_present(self, text, present):
+        if self.literal and self.literal not in present:
+            return False
+        return self.regex.search(text) is not None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.source!r})"
+
+
+class Phrase(Pattern):
+    __slots__ = ()
+
+    def __init__(self, phrase):
+        words = phrase.split()
+        pattern = r"\b" + r"\s+".join(re.escape(word) for word in words) + r"\b"
+        super().__init__(phrase, pattern, max(words, key=len) if words else "")
+
+
+class Wildcard(Pattern):
+    __slots__ = ()
+
+    def __init__(self, term):
+        pattern = re.escape(term).replace(r"\*", r"[^\n]*").replace(r"\?", r"[^\n]")
+        parts = re.split(r"[*?]", term)
+        super().__init__(term, pattern, max(parts, key=len))
+
+
+class And(Node):
+    __slots__ = ("children", "cost")
+
+    def __init__(self, children):
+        # Cheap substring checks first, regexes last
+        self.children = sorted(children, key=lambda child: child.cost)
+        self.cost = max(child.cost for child in children)
+
+    def match(self, text):
+        return all(child.match(text) for child in self.children)
+
+    def match_present(self, text, present):
+        return all(child.match_present(text, present) for child in self.children)
+
+    def __repr__(self):
+        return f"And({self.children})"
+
+
+class Or(Node):
+    __slots__ = ("children", "cost")
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda child: child.cost)
+        self.cost = max(child.cost for child in children)
+
+    def match(self, text):
+        return any(child.match(text) for child in self.children)
+
+    def match_present(self, text, present):
+        return any(child.match_present(text, present) for child in self.children)
+
+    def __repr__(self):
+        return f"Or({self.children})"
+
+
+class Not(Node):
+    __slots__ = ("child", "cost")
+
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+
+    def match(self, text):
+        return not self.child.match(text)
+
+    def match_present(self, text, present):
+        return not self.child.match_present(text, present)
+
+    def __repr__(self):
+        return f"Not({self.child})"
+
+
+class Everything(Node):
+    """The empty query"""
+
+    __slots__ = ()
+
+    def match(self, text):
+        return True
+
+    def match_present(self, text, present):
+        return True
+
+
+def tokenize(query):
+    """``(kind, value)`` pairs; kinds are ``( ) or and not phrase word``"""
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        found = _TOKEN.match(query, position)
+        if found is None or found.end() == position:
+            raise QuerySyntaxError(f"Unexpected input at {position}: {query!r}")
+        position = found.end()
+        lparen, rparen, bar, amp, minus, phrase, word = found.groups()
+        if lparen:
+            tokens.append(("(", lparen))
+        elif rparen:
+            tokens.append((")", rparen))
+        elif bar or word == "OR":
+            tokens.append(("or", "|"))
+        elif amp or word == "AND":
+            tokens.append(("and", "&"))
+        elif minus or word == "NOT":
+            tokens.append(("not", "-"))
+        elif phrase is not None:
+            tokens.append(("phrase", phrase))
+        elif word:
+            tokens.append(("word", word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens, case_sensitive):
+        self.tokens = tokens
+        self.position = 0
+        self.case_sensitive = case_sensitive
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return Everything()
+        node = self.and_expr()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"Unexpected {self.tokens[self.position][1]!r}")
+        return node
+
+    def and_expr(self):
+        children = []
+        while self.peek() not in (None, ")"):
+            if self.peek() == "and":
+                self.take()
+                continue
+            children.append(self.or_expr())
+        if not children:
+            raise QuerySyntaxError("Empty expression")
+        return children[0] if len(children) == 1 else And(children)
+
+    def or_expr(self):
+        children = [self.unary()]
+        while self.peek() == "or":
+            self.take()
+            children.append(self.unary())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def unary(self):
+        if self.peek() == "not":
+            self.take()
+            return Not(self.unary())
+        return self.atom()
+
+    def atom(self):
+        kind = self.peek()
+        if kind is None:
+            raise QuerySyntaxError("Query ends with an operator")
+        _, value = self.take()
+        if kind == "(":
+            node = self.and_expr()
+            if self.peek() != ")":
+                raise QuerySyntaxError("Missing )")
+            self.take()
+            return node
+        if kind in ("phrase", "word"):
+            if not self.case_sensitive:
+                value = value.casefold()
+            if kind == "phrase":
+                return Phrase(value)
+            if "*" in value or "?" in value:
+                return Wildcard(value)
+            return Literal(value)
+        raise QuerySyntaxError(f"Unexpected {value!r}")
+
+
+class CompiledQuery:
+    """A parsed query; ``match(text)`` and ``filter(texts)``"""
+
+    __slots__ = ("query", "case_sensitive", "root", "literals")
+
+    def __init__(self, query, case_sensitive=False):
+        self.query = query
+        self.case_sensitive = case_sensitive
+        self.root = _Parser(tokenize(query), case_sensitive).parse()
+        self.literals = frozenset(_all_literals(self.root))
+
+    def prepare(self, text):
+        """``text`` as the nodes compare it (casefolded unless case-sensitive)"""
+        return text if self.case_sensitive else text.casefold()
+
+    def match(self, text):
+        return self.root.match(self.prepare(text))
+
+    def filter(self, texts):
+        root, prepare = self.root, self.prepare
+        if len(self.literals) < SCAN_THRESHOLD or not AHOCORASICK_AVAILABLE:
+            return [text for text in texts if root.match(prepare(text))]
+        # Many literals: find them all in one pass instead of one ``in`` each
+        scanner = scanner_for(self)
+        result = []
+        for text in texts:
+            prepared = prepare(text)
+            if root.match_present(prepared, scanner.present(prepared)):
+                result.append(text)
+        return result
+
+    def __repr__(self):
+        return f"CompiledQuery({self.query!r}, {self.root})"
+
+
+def _all_literals(node):
+    if isinstance(node, (Literal, Pattern)):
+        return list(node.literals)
+    if isinstance(node, Not):
+        return _all_literals(node.child)
+    children = getattr(node, "children", ())
+    return [lit for child in children for lit in _all_literals(child)]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_query(query, case_sensitive=False):
+    """Compile (or reuse) a query"""
+    return CompiledQuery(query, case_sensitive)
+
+
+class LiteralScanner:
+    """Which of a fixed set of substrings occur in a text"""
+
+    def __init__(self, literals):
+        self.literals = tuple(sorted(set(literals)))
+        self.automaton = None
+        if AHOCORASICK_AVAILABLE and self.literals:
+            automaton = ahocorasick.Automaton()
+            for literal in self.literals:
+                automaton.add_word(literal, literal)
+            automaton.make_automaton()
+            self.automaton = automaton
+
+    def present(self, text):
+        if self.automaton is not None:
+            return {literal for _, literal in self.automaton.iter(text)}
+        return {literal for literal in self.literals if literal in text}
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def scanner_for(query):
+    return LiteralScanner(query.literals)
+
+
+class QuerySet:
+    """
+    Many queries matched together; ``matching(text)`` gives the queries a
+    text matches. ``is_regex`` picks queries to use as raw regexes instead
+    of parsing them (as ``Utilities.regex_search`` does).
+    """
+
+    def __init__(self, queries, case_sensitive=False, is_regex=None):
+        self.case_sensitive = case_sensitive
+        self.names = list(dict.fromkeys(queries))
+        self.regexes = []
+        self.compiled = []
+        flags = 0 if case_sensitive else re.IGNORECASE
+        for name in self.names:
+            if is_regex is not None and is_regex(name):
+                self.regexes.append((name, re.compile(name, flags)))
+            else:
+                self.compiled.append((name, compile_query(name, case_sensitive)))
+        self.scanner = LiteralScanner(
+            literal for _, query in self.compiled for literal in query.literals
+        )
+
+    def matching(self, text):
+        """The queries ``text`` matches, in the order they were given"""
+        prepared = text if self.case_sensitive else text.casefold()
+        present = self.scanner.present(prepared)
+        found = {
+            name
+            for name, query in self.compiled
+            if query.root.match_present(prepared, present)
+        }
+        found.update(name for name, regex in self.regexes if regex.search(text))
+        return [name for name in self.names if name in found]
+
+    def match_all(self, texts):
+        """``{query: [texts it matches]}`` for every query"""
+        result = {name: [] for name in self.names}
+        for text in texts:
+            for name in self.matching(text):
+                result[name].append(text)
+        return result
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def query_set(queries, case_sensitive=False, regexes=frozenset()):
+    """Build (or reuse) the QuerySet of a tuple of queries"""
+    return QuerySet(queries, case_sensitive, regexes.__contains__)
+
+
+def match_texts(texts, queries, case_sensitive=False, regexes=frozenset()):
+    """
+    ``QuerySet.match_all`` taking only plain values, for worker processes:
+    ``regexes`` are the queries to use as raw regexes. Each worker keeps
+    its compiled query sets.
+    """
+    return query_set(tuple(queries), case_sensitive, frozenset(regexes)).match_all(
+        texts
+    )
@@ -0,0 +1,143 @@
+"""
+Cross-archive de-duplication: the same post mirrored by several archives
+is kept once, as its richest record
+"""
+
+import os
+
+# Source names in order of preference, e.g. "desuarchive,moe,palanq"
+SOURCE_PREFERENCE = [
+    name.strip()
+    for name in os.getenv("FORARCHIVES_SOURCE_PREFERENCE", "").split(",")
+    if name.strip()
+]
+POLICIES = ("richest", "preferred")
+
+
+def _board_name(board):
+    if isinstance(board, dict):
+        board = board.get("shortname") or board.get("short_name")
+    return str(board or "_").strip("/").lower()
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def post_identity(post, board=None):
+    """``(board, num, subnum)`` of a post dict, the same on every archive"""
+    return (
+        _board_name(post.get("board") or board),
+        _int(post.get("num")),
+        _int(post.get("subnum") or 0),
+    )
+
+
+def richness(post):
+    """How complete a record is: media first, then filled-in fields"""
+    media = post.get("media")
+    has_media = bool(media and (media.get("media_link") or media.get("media_orig")))
+    filled = sum(
+        1
+        for key, value in post.items()
+        if value not in (None, "", 0, "0") and key not in ("source", "sources")
+    )
+    return has_media, filled
+
+
+class PostMerger:
+    """
+    Merges posts from several archives as they stream in.
+
+    ``add`` keeps one record per ``(board, num, subnum)``. The ``richest``
+    policy keeps the record with media and the most filled-in fields, then
+    the most preferred source; ``preferred`` ranks by source preference
+    first. Kept records carry ``source`` (where the record came from) and
+    ``sources`` (every archive that returned the post).
+    """
+
+    def __init__(self, preference=None, policy="richest", board=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown merge policy {policy!r}, expected {POLICIES}")
+        preference = SOURCE_PREFERENCE if preference is None else preference
+        self.rank = {source: i for i, source in enumerate(preference)}
+        self.policy = policy
+        self.board = board
+        self.records = {}
+        self.counts = {}
+        self.kept_counts = {}
+        self.overlap = {}
+
+    def _score(self, post, source):
+        # Lower rank is better; unranked sources come last
+        preferred = -self.rank.get(source, len(self.rank))
+        rich = richness(post)
+        if self.policy == "preferred":
+            return (preferred,) + rich
+        return rich + (preferred,)
+
+    def add(self, post, source=None):
+        """
+        Merge one post dict; return ``(record, status)`` where ``status`` is
+        ``"new"``, ``"replaced"`` (a richer record took over; ``record`` is
+        it) or ``"duplicate"`` (the kept record is unchanged).
+        """
+        source = source if source is not None else post.get("source")
+        self.counts[source] = self.counts.get(source, 0) + 1
+        key = post_identity(post, self.board)
+        kept = self.records.get(key)
+        if kept is None:
+            record = {**post, "source": source, "sources": [source]}
+            self.records[key] = record
+            self.kept_counts[source] = self.kept_counts.get(source, 0) + 1
+            return record, "new"
+
+        sources = kept["sources"]
+        if source not in sources:
+            for other in sources:
+                pair = tuple(sorted((str(other), str(source))))
+                self.overlap[pair] = self.overlap.get(pair, 0) + 1
+            sources = sources + [source]
+        if self._score(post, source) > self._score(kept, kept["source"]):
+            self.kept_counts[kept["source"]] -= 1
+            self.kept_counts[source] = self.kept_counts.get(source, 0) + 1
+            record = {**post, "source": source, "sources": sources}
+            self.records[key] = record
+            return record, "replaced"
+        kept["sources"] = sources
+        return kept, "duplicate"
+
+    def extend(self, posts, source=None):
+        """Merge a page of posts; return the records that are new"""
+        return [
+            record
+            for record, status in (self.add(p, source) for p in posts)
+            if status == "new"
+        ]
+
+    def posts(self):
+        """Kept records, in the order their posts were first seen"""
+        return list(self.records.values())
+
+    def stats(self):
+        """Overlap statistics: totals, per-source counts and pairwise overlap"""
+        total = sum(self.counts.values())
+        unique = len(self.records)
+        return {
+            "total": total,
+            "unique": unique,
+            "duplicates": total - unique,
+            "sources": {
+                str(source): {
+                    "posts": count,
+                    "kept": self.kept_counts.get(source, 0),
+                }
+                for source, count in self.counts.items()
+            },
+            "overlap": {
+                f"{a}+{b}": count for (a, b), count in sorted(self.overlap.items())
+            },
+        }
@@ -1,23 +1,290 @@
 """
 Data classes for moesearch functionality
+
+Posts are parsed into slotted objects: the FoolFuuka fields are typed
+slots, anything else is kept (read-only) in ``extra``, and ``to_dict``
+gives back the original dict, same keys in the same order.
 """
 
+from operator import attrgetter
+from typing import Any, Dict, Optional, Tuple
 
-class Post:
-    def __init__(self, data):
-        # Initialize with data dictionary
-        for key, value in data.items():
-            setattr(self, key, value)
+
+class Model:
+    """Slotted model base: ``FIELDS`` become slots, ``NESTED`` fields are parsed"""
+
+    FIELDS: Tuple[str, ...] = ()
+    NESTED: Dict[str, Any] = {}
+    __slots__ = ("_order", "extra")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+        # Key tuple of a response dict -> its parsing plan; every post of a
+        # response has the same keys, so they all share one plan
+        cls._orders = {}
+
+    def __init__(self, data=None):
+        if data is None:
+            data = {}
+        get = data.get
+        nested = self.NESTED
+        for name in self.FIELDS:
+            value = get(name)
+            if name in nested and type(value) is dict:
+                value = nested[name](value)
+            setattr(self, name, value)
+        keys = tuple(data)
+        order = self._orders.get(keys) or self._register(keys)
+        self._order = order
+        self.extra = {k: data[k] for k in order[1]} if order[1] else None
+
+    @classmethod
+    def _register(cls, keys):
+        fields = tuple(k for k in keys if k in cls._field_set)
+        extra = tuple(k for k in keys if k not in cls._field_set)
+        nested = tuple(k for k in fields if k in cls.NESTED)
+        getter = attrgetter(*fields) if len(fields) > 1 else None
+        order = (keys, extra, fields, getter, nested)
+        cls._orders[keys] = order
+        return order
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Model":
+        return cls(data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        keys, extra, fields, getter, nested = self._order
+        if getter is not None:
+            result = dict(zip(fields, getter(self)))
+        else:
+            result = {name: getattr(self, name) for name in fields}
+        for name in nested:
+            value = result[name]
+            if isinstance(value, Model):
+                result[name] = value.to_dict()
+        if extra:
+            values = self.extra
+            result = {k: result[k] if k in result else values[k] for k in keys}
+        return result
+
+    def __getattr__(self, name):
+        # Only reached for names that are not slots: unknown response fields
+        extra = object.__getattribute__(self, "extra")
+        if extra and name in extra:
+            return extra[name]
+        raise AttributeError(f"{type(self).__name__} has no attribute '{name}'")
 
     def __repr__(self):
-        return f"Post({self.__dict__})"
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class Board(Model):
+    FIELDS = ("name", "shortname")
+    __slots__ = FIELDS
+
+    name: Optional[str]
+    shortname: Optional[str]
+
+    # Every post carries its board; posts of the same board share one object
+    _interned: Dict[Tuple, "Board"] = {}
 
+    @classmethod
+    def intern(cls, data: Dict[str, Any]) -> "Board":
+        key = tuple(data.items())
+        try:
+            board = cls._interned.get(key)
+        except TypeError:
+            return cls(data)
+        if board is None:
+            board = cls._interned[key] = cls(data)
+        return board
 
-class Thread:
-    def __init__(self, data):
-        # Initialize with data dictionary
+    @property
+    def short_name(self) -> Optional[str]:
+        return self.shortname
+
+
+class Media(Model):
+    FIELDS = (
+        "media_id",
+        "spoiler",
+        "preview_orig",
+        "media",
+        "preview_op",
+        "preview_reply",
+        "preview_w",
+        "preview_h",
+        "media_filename",
+        "media_filename_processed",
+        "media_w",
+        "media_h",
+        "media_size",
+        "media_hash",
+        "media_orig",
+        "exif",
+        "total",
+        "banned",
+        "media_status",
+        "safe_media_hash",
+        "remote_media_link",
+        "media_link",
+        "thumb_link",
+    )
+    __slots__ = FIELDS
+
+    media_id: Any
+    spoiler: Any
+    preview_orig: Optional[str]
+    media: Optional[str]
+    preview_op: Optional[str]
+    preview_reply: Optional[str]
+    preview_w: Any
+    preview_h: Any
+    media_filename: Optional[str]
+    media_filename_processed: Optional[str]
+    media_w: Any
+    media_h: Any
+    media_size: Any
+    media_hash: Optional[str]
+    media_orig: Optional[str]
+    exif: Any
+    total: Any
+    banned: Any
+    media_status: Optional[str]
+    safe_media_hash: Optional[str]
+    remote_media_link: Optional[str]
+    media_link: Optional[str]
+    thumb_link: Optional[str]
+
+
+class Post(Model):
+    FIELDS = (
+        "doc_id",
+        "num",
+        "subnum",
+        "thread_num",
+        "op",
+        "timestamp",
+        "timestamp_expired",
+        "capcode",
+        "email",
+        "name",
+        "trip",
+        "title",
+        "comment",
+        "poster_hash",
+        "poster_country",
+        "sticky",
+        "locked",
+        "deleted",
+        "nreplies",
+        "nimages",
+        "fourchan_date",
+        "comment_sanitized",
+        "comment_processed",
+        "formatted",
+        "title_processed",
+        "name_processed",
+        "email_processed",
+        "trip_processed",
+        "poster_hash_processed",
+        "poster_country_name",
+        "poster_country_name_processed",
+        "exif",
+        "troll_country_code",
+        "troll_country_name",
+        "media",
+        "board",
+    )
+    NESTED = {"media": Media, "board": Board.intern}
+    __slots__ = FIELDS
+
+    doc_id: Any
+    num: Any
+    subnum: Any
+    thread_num: Any
+    op: Any
+    timestamp: Any
+    timestamp_expired: Any
+    capcode: Optional[str]
+    email: Optional[str]
+    name: Optional[str]
+    trip: Optional[str]
+    title: Optional[str]
+    comment: Optional[str]
+    poster_hash: Optional[str]
+    poster_country: Optional[str]
+    sticky: Any
+    locked: Any
+    deleted: Any
+    nreplies: Any
+    nimages: Any
+    fourchan_date: Optional[str]
+    comment_sanitized: Optional[str]
+    comment_processed: Optional[str]
+    formatted: Any
+    title_processed: Optional[str]
+    name_processed: Optional[str]
+    email_processed: Optional[str]
+    trip_processed: Optional[str]
+    poster_hash_processed: Optional[str]
+    poster_country_name: Optional[str]
+    poster_country_name_processed: Optional[str]
+    exif: Any
+    troll_country_code: Optional[str]
+    troll_country_name: Optional[str]
+    media: Optional[Media]
+    board: Optional[Board]
+
+
+class Thread(Model):
+    """
+    A FoolFuuka /thread response: ``{thread_num: {"op": ..., "posts": {...}}}``.
+
+    ``num``, ``op`` and ``posts`` (keyed like the response) describe the
+    thread; error responses keep their ``error`` in ``extra``.
+    """
+
+    __slots__ = ("num", "op", "posts")
+
+    num: Optional[str]
+    op: Optional[Post]
+    posts: Dict[str, Post]
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.num = None
+        self.op = None
+        self.posts = {}
+        extra = {}
         for key, value in data.items():
-            setattr(self, key, value)
+            if self.num is None and isinstance(value, dict) and str(key).isdigit():
+                self.num = key
+                op = value.get("op")
+                self.op = Post(op) if isinstance(op, dict) else op
+                posts = value.get("posts") or {}
+                if isinstance(posts, list):
+                    posts = {str(p.get("num")): p for p in posts}
+                self.posts = {k: Post(p) for k, p in posts.items()}
+            else:
+                extra[key] = value
+        self.extra = extra or None
+        self._order = tuple(data)
 
-    def __repr__(self):
-        return f"Thread({self.__dict__})"
+    def all_posts(self):
+        """The op (if present) followed by the replies"""
+        return ([self.op] if self.op is not None else []) + list(self.posts.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {}
+        for key in self._order:
+            if key == self.num:
+                thread = {}
+                if self.op is not None:
+                    thread["op"] = self.op.to_dict()
+                thread["posts"] = {k: p.to_dict() for k, p in self.posts.items()}
+                result[key] = thread
+            else:
+                result[key] = self.extra[key]
+        return result
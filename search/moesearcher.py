@@ -1,12 +1,46 @@
-from .async_api import search, thread, post
+from .async_api import search, close as close_sessions
+from .batch import MISSING, PostBatch
+from .moesearch import Thread
+from .render import format_texts, post_texts, write_texts
+from .scheduler import CallThrottle, scheduler
+from .pagination import (
+    iter_pages,
+    max_pages_for,
+    page_params,
+    page_size_for,
+    post_key,
+)
+from .store import store
+from .watcher import ThreadWatcher
 from .utilities import Utilities
-import requests
+from .lazy import LazyModule
+from .logwriter import writer
+from .matcher import QuerySet, match_texts
+from .merge import PostMerger
+from .workers import pool
 import asyncio
-import aiohttp
 from datetime import datetime
-import pandas as pd
+import json
 import os
 
+# Only needed once a DataFrame is built
+pd = LazyModule("pandas")
+
+# Search arguments that control paging rather than the archive query
+PAGING_KWARGS = ("limit", "board", "delay", "semaphore", "page_size", "local_first")
+
+
+def frame_dumps(df):
+    """The JSON lines and plain text dumps log_dataframe writes for ``df``"""
+    json_lines = df.to_json(orient="records", lines=True, date_format="iso") + "\n"
+    return json_lines, df.to_string()
+
+
+def build_frame(records):
+    """A DataFrame of post dicts and its dumps, built in one worker call"""
+    df = pd.DataFrame(records)
+    return (df, *frame_dumps(df))
+
 
 class MoeSearcher:
     def __init__(self):
@@ -20,7 +54,44 @@ class MoeSearcher:
             "warosu": "https://warosu.org/",
         }
         self.utilities = Utilities()
+        # Threads fetched through fetch_thread are synced incrementally
+        self.threads = ThreadWatcher()
+        self._dump_paths = set()
+        # Overlap statistics of the last deduplicated multiArchiveSearch
+        self.merge_stats = None
         print = self.utilities.printLog
+        for archive_url in self.archivers.values():
+            scheduler.register(archive_url)
+
+    @staticmethod
+    def throttle(delay=None, semaphore=None):
+        """
+        A caller-supplied throttle for the requests of one call.
+
+        ``delay`` is the old "seconds between waves of ``semaphore`` requests"
+        knob and maps onto a rate; ``semaphore`` caps the call's requests in
+        flight. Both apply on top of the archive's scheduler and only to
+        this call: the process-wide policy is set with
+        ``scheduler.configure``.
+        """
+        rate = (semaphore or 1) / float(delay) if delay else None
+        return CallThrottle(rate, semaphore)
+
+    async def close(self):
+        """Release the shared archive connections."""
+        await close_sessions()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run_and_close(self, coro):
+        try:
+            return await coro
+        finally:
+            await self.close()
 
     async def dumpster(self, posts):
         """Extract relevant data from posts and return as a DataFrame."""
@@ -32,6 +103,7 @@ class MoeSearcher:
                 "thread_num": getattr(post, "thread_num", None),
                 "board": post.board.short_name if post.board else None,
             }
+            for post in posts
         ]
 
         # Create DataFrame from extracted data
@@ -47,20 +119,31 @@ class MoeSearcher:
         self.log_dataframe(df, query=kwargs.get("text", ""), folderName="dumpster")
         return df
 
+    def _dump_path(self, log_file):
+        """A JSON dump path next to ``log_file`` not used yet"""
+        base = log_file.replace(".log", "")
+        obj = base
+        i = 2
+        while os.path.exists(obj + ".json") or obj + ".json" in self._dump_paths:
+            obj = f'{base}-{i}-{datetime.now().strftime("%Y%m%d-%H%M%S")}'
+            i += 1
+        obj += ".json"
+        # Dumps may still be queued in the log writer, so remember them too
+        self._dump_paths.add(obj)
+        return obj
+
     def log_dataframe(self, df, query="", folderName=""):
         """Log DataFrame contents to both JSON and plain text formats."""
+        self._log_dumps(*frame_dumps(df), query=query, folderName=folderName)
+
+    def _log_dumps(self, json_lines, text, query="", folderName=""):
         query = self.utilities.clean_filename(query)
         log_file = self.utilities.get_log_file("", "", query, folderName)
-        obj = log_file.replace(".log", "")
-        i = 2
-        while os.path.exists(obj + ".json"):
-            obj = f'{obj}-{i}-{datetime.now().strftime("%Y%m%d-%H%M%S")}'
-            i += 1
-        obj += ".json"
+        obj = self._dump_path(log_file)
         # Save as JSON
-        df.to_json(obj, orient="records", lines=True, date_format="iso")
+        writer.write(obj, json_lines, mode="w")
         # Save as plain text for readability
-        self.utilities.log(df.to_string(), query=query, folderName=folderName)
+        self.utilities.log(text, query=query, folderName=folderName)
         print(f"Data logged to {log_file}")
 
     def getArchive(self, archive=0):
@@ -75,72 +158,196 @@ class MoeSearcher:
         """Convert post data to a DataFrame."""
         if not posts:
             return pd.DataFrame()
-        df = pd.DataFrame(self.utilities.process_posts(posts))
+        return self.records_to_dataframe(
+            self.utilities.process_posts(posts), folderName, **kwargs
+        )
+
+    def log_records(self, records, folderName="dumpster", **kwargs):
+        """Dump normalized post dicts as JSON lines, without building a DataFrame."""
+        if not records:
+            return
+        queries = "-".join(f"{key}-{value}" for key, value in kwargs.items())
+        query = self.utilities.clean_filename(queries)
+        log_file = self.utilities.get_log_file("", "", query, folderName)
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            for record in records
+        )
+        writer.write(self._dump_path(log_file), lines, mode="w")
+
+    def records_to_dataframe(self, records, folderName="dumpster", **kwargs):
+        """Build and log a DataFrame from already normalized post dicts."""
+        if not records:
+            return pd.DataFrame()
+        df = pd.DataFrame(records)
         queries = "-".join(f"{key}-{value}" for key, value in kwargs.items())
         self.log_dataframe(df, query=queries, folderName=folderName)
         return df
 
-    async def fetch_search_result(self, session, archive, board, page, **kwargs):
-        return await search(archive, board=board, page=page, **kwargs)
-
-    async def search(self, archive: int = 0, **kwargs) -> pd.DataFrame:
-        """Perform search across a specific archive."""
-        posts = []
-        limit = kwargs.pop("limit", None)
-        board = kwargs.pop("board", "_")
-        delay = kwargs.pop("delay", 3.0)
-        semaphore_limit = kwargs.pop("semaphore", 5)
-
-        archive_url = self.getArchive(int(archive))
-        semaphore = asyncio.Semaphore(semaphore_limit)
-
-        async with aiohttp.ClientSession() as session:
-            page = 1  # Start with page 1
-
-            while True:
-                print(page)
-                # Create new tasks within each iteration to avoid reuse errors
-                tasks = [
-                    asyncio.create_task(
-                        self.fetch_search_result(
-                            session, archive_url, board, page + i, **kwargs
-                        )
-                    )
-                    for i in range(semaphore_limit)
-                ]
-
-                # Gather the results from all tasks
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                # Collect only valid results
-                valid_results = [
-                    res for res in results if isinstance(res, list) and res
-                ]
-
-                if not valid_results:
-                    break  # Exit if no more results
+    async def build_dataframe(self, records, folderName="dumpster", **kwargs):
+        """``records_to_dataframe`` with the building and dumps in the worker pool"""
+        if not records:
+            return pd.DataFrame()
+        df, json_lines, text = await pool.run(build_frame, records, items=len(records))
+        queries = "-".join(f"{key}-{value}" for key, value in kwargs.items())
+        self._log_dumps(json_lines, text, query=queries, folderName=folderName)
+        return df
 
-                posts.extend(valid_results)
+    async def fetch_search_result(self, archive, board, page, page_size=None, **kwargs):
+        params = page_params(archive, page, page_size)
+        return await search(archive, board=board, **params, **kwargs)
 
-                if limit and len(posts) >= limit:
-                    return self.posts_to_dataframe(posts[:limit], "search", board=board)
+    async def iter_archive_pages(self, archive=0, **kwargs):
+        """
+        Yield the raw Post pages of one archive search as they arrive.
 
-                page += semaphore_limit  # Increment the page number by semaphore limit
+        With ``local_first`` a search already run upstream with the same
+        query (see ``store.covered``) replays the posts it returned from the
+        local post store: an exact-replay result cache, not a full-text
+        search of the store. Completed upstream searches are recorded in
+        the store either way.
+        """
+        limit = kwargs.pop("limit", None)
+        board = kwargs.pop("board", "_")
+        delay = kwargs.pop("delay", None)
+        semaphore_limit = kwargs.pop("semaphore", None)
+        page_size = kwargs.pop("page_size", None)
+        local_first = kwargs.pop("local_first", False)
 
-                # Introduce a non-blocking delay
-                await asyncio.sleep(delay)
+        archive_url = self.getArchive(
+            int(archive) if str(archive).isdigit() else archive
+        )
+        page_size = page_size or page_size_for(archive_url)
+
+        if local_first:
+            posts = await store.covered(archive_url, board, kwargs, limit)
+            if posts is not None:
+                print(f"Answered from the local store: {len(posts)} posts")
+                for start in range(0, len(posts), page_size):
+                    yield posts[start : start + page_size]
+                return
+
+        throttle = self.throttle(delay, semaphore_limit)
+        failed = False
+
+        async def fetch_page(page):
+            nonlocal failed
+            print(page)
+            async with throttle:
+                posts = await self.fetch_search_result(
+                    archive_url, board, page, page_size=page_size, **kwargs
+                )
+            failed = failed or posts is None
+            return posts
+
+        # Only the pages needed for ``limit`` are fetched; pacing is left to
+        # the scheduler and ``semaphore`` just bounds pages fetched ahead
+        fetched = []
+        async for page_posts in iter_pages(
+            fetch_page,
+            limit=limit,
+            page_size=page_size,
+            window=semaphore_limit,
+            max_pages=max_pages_for(archive_url),
+            key=post_key,
+        ):
+            fetched.extend(page_posts)
+            yield page_posts
+        # A failed page would make a partial result look complete
+        if not failed:
+            await store.record_search(archive_url, board, kwargs, limit, fetched)
+
+    async def iter_batches(self, archives, buffer=4, **kwargs):
+        """
+        Search ``archives`` concurrently and yield ``(source, posts)`` per page.
+
+        ``posts`` are normalized post dicts. At most ``buffer`` pages wait
+        for the consumer; archive fetchers pause until it catches up.
+        """
+        queue = asyncio.Queue(maxsize=buffer)
+        done = object()
+
+        async def produce(index):
+            try:
+                async for page in self.iter_archive_pages(index, **dict(kwargs)):
+                    await queue.put((index, page))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error searching archive {index}: {e}")
+            await queue.put((index, done))
+
+        producers = [asyncio.create_task(produce(index)) for index in archives]
+        try:
+            finished = 0
+            while finished < len(producers):
+                index, page = await queue.get()
+                if page is done:
+                    finished += 1
+                    continue
+                yield self.getArchiveName(index), self.utilities.process_posts(page)
+        finally:
+            for producer in producers:
+                producer.cancel()
+            await asyncio.gather(*producers, return_exceptions=True)
+
+    async def iter_search(self, archive=0, archives=None, buffer=4, **kwargs):
+        """
+        Yield normalized post dicts as soon as each search page arrives.
+
+        With ``archives`` the archives are searched concurrently (see
+        ``iter_batches``) and every post carries a ``source`` key with the
+        archive name.
+        """
+        if archives is None:
+            async for page in self.iter_archive_pages(archive, **kwargs):
+                for post in self.utilities.process_posts(page):
+                    yield post
+            return
+
+        async for source, posts in self.iter_batches(archives, buffer, **kwargs):
+            for post in posts:
+                post["source"] = source
+                yield post
+
+    async def search(self, archive: int = 0, **kwargs) -> "pd.DataFrame":
+        """Perform search across a specific archive."""
+        posts = [post async for post in self.iter_search(archive, **kwargs)]
+        query = {k: v for k, v in kwargs.items() if k not in PAGING_KWARGS}
+        return await self.build_dataframe(
+            posts, "search", board=kwargs.get("board", "_"), **query
+        )
 
-        return self.posts_to_dataframe(posts, "search", board=board, **kwargs)
+    async def search_batch(self, archive=0, archives=None, **kwargs) -> PostBatch:
+        """
+        Search like ``search``/``multiArchiveSearch`` but return a columnar
+        PostBatch, built page by page and concatenated once at the end.
+        """
+        batches = []
+        if archives is None:
+            source = self.getArchiveName(archive)
+            async for page in self.iter_archive_pages(archive, **kwargs):
+                batches.append(PostBatch.from_posts(page, source))
+        else:
+            async for source, posts in self.iter_batches(archives, **kwargs):
+                batches.append(PostBatch.from_posts(posts, source))
+        return PostBatch.concat(batches)
 
     async def calculate_statistics(
         self, results, text="", specific_board=None, specific_date=None
     ):
+        if isinstance(results, PostBatch):
+            results = results.to_pandas()
         if results.empty:
             return 0, 0, 0.0, None
 
-        # Convert date column to datetime
-        results["date"] = pd.to_datetime(results["fourchan_date"], errors="coerce")
-        valid_results = results.dropna(subset=["date"])
+        if pd.api.types.is_integer_dtype(results.get("timestamp")):
+            # Batches carry unix timestamps; no date string parsing needed
+            timestamps = results["timestamp"]
+            dates = pd.to_datetime(timestamps.where(timestamps != MISSING), unit="s")
+        else:
+            dates = pd.to_datetime(results["fourchan_date"], errors="coerce")
+        valid_results = results.assign(date=dates).dropna(subset=["date"])
 
         if specific_board:
             valid_results = valid_results[valid_results["board"] == specific_board]
@@ -161,55 +368,20 @@ class MoeSearcher:
 
         return total_posts, posts_with_text, percentage, mean_date
 
-    async def fetch_thread(
-        self, session, archive_url, board, thread_num, semaphore, delay, **kwargs
-    ):
-        async with semaphore:
-            await asyncio.sleep(delay)
-            thr = await thread(
-                archive_url, board=board, thread_num=thread_num, **kwargs
-            )
-            self.posts_to_dataframe(thr, board=board, thread=thread_num, **kwargs)
-            return thr
-
     def getTextArray(self, posts_df):
-        """Convert posts DataFrame to text format."""
-        if posts_df.empty:
-            return []
-
-        result = []
-
-        for _, row in posts_df.iterrows():
-            text = ""
-
-            # Add title if it exists
-            if row.get("title"):
-                text += row["title"] + "\n"
-
-            # Add thread number and date
-            text += f"{row['num']} {row['fourchan_date']}\n"
-
-            # Add comment if it exists
-            if row.get("comment"):
-                text += row["comment"]
-
-            # Strip any trailing whitespace/newlines
-            text = text.strip()
-
-            if text:  # Only add non-empty text to the result
-                result.append(text)
-
-        return result
-
-    def formatText(self, df, delim="\n\n"):
-        return delim.join(self.getTextArray(df))
+        """Convert posts (DataFrame, PostBatch or list of posts) to text format."""
+        if isinstance(posts_df, PostBatch):
+            return posts_df.text_array()
+        return post_texts(posts_df)
 
     def qSearch(self, archive=0, **kwargs):
         """Run a quick search synchronously and return results as DataFrame."""
-        return asyncio.run(self.search(archive, **kwargs))
+        return asyncio.run(self._run_and_close(self.search(archive, **kwargs)))
 
     def req(self):
         """Synchronous search request with requests library."""
+        import requests
+
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
         }
@@ -227,7 +399,7 @@ class MoeSearcher:
         try:
             result = []
             if isinstance(posts, Thread):
-                i = [posts.op, *posts.posts]
+                i = posts.all_posts()
                 return self.getTextArray(i)
             elif not isinstance(posts, list):
                 for k in posts:
@@ -259,151 +431,209 @@ class MoeSearcher:
             print(e)
             return None
 
-    async def searchInSubject(self, archive=0, subject="", searchText="", **kwargs):
+    async def subject_thread_nums(self, archive=0, subject="", **kwargs):
+        """``[(board, thread_num)]`` of the threads a subject search finds, each once"""
         archive_url = self.getArchive(archive)
         limit = kwargs.pop("limit", None)
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            tasks.append(
-                self.search(archive=archive_url, subject=subject, limit=limit, **kwargs)
+        inBoth = kwargs.pop("inBoth", False)
+        board = kwargs.pop("board", "_")
+        tasks = []
+        tasks.append(
+            self.search(
+                archive=archive_url, subject=subject, board=board, limit=limit, **kwargs
             )
+        )
 
-            inBoth = kwargs.pop("inBoth", False)
-            if inBoth:
-                kwargs.pop("text")
-                tasks.append(
-                    self.search(
-                        archive=archive_url,
-                        text=subject,
-                        type="op",
-                        limit=limit,
-                        **kwargs,
-                    )
+        if inBoth:
+            kwargs.pop("text", None)
+            tasks.append(
+                self.search(
+                    archive=archive_url,
+                    text=subject,
+                    type="op",
+                    board=board,
+                    limit=limit,
+                    **kwargs,
                 )
+            )
 
-            results = await asyncio.gather(*tasks)
-
-            # Process results
-            if len(results) == 2:
-                subjects, both_subjects = results
-                subjects.extend(both_subjects)
-            elif len(results) == 1:
-                subjects = results[0]
-                both_subjects = None
-            else:
-                subjects = []
-                both_subjects = None
+        results = await asyncio.gather(*tasks)
 
-            board = kwargs.pop("board", "_")
-            case = kwargs.pop("case", False)
-            result = []
-            searchesCount = 0
-            thread_tasks = []
-            semaphore_limit = kwargs.pop(
-                "semaphore", 5
-            )  # Default semaphore limit if not provided
-            delay = kwargs.pop("delay", 5.0)  # Default delay if not provided
-
-            semaphore = asyncio.Semaphore(semaphore_limit)  # Limit concurrent tasks
-            print(subjects.columns)
-            print(subjects.head())
-
-            si = -1
-            for index in subjects.values:
-                if index is None:
+        # Several hits in one thread still fetch it once
+        threads = {}
+        for result in results:
+            for post in result.to_dict("records"):
+                threadN = post.get("thread_num")
+                if threadN is None or threadN in threads:
                     continue
-                for index2 in index:
-                    if index2 is None:
-                        continue
-                    si += 1
-                    threadN = index2["thread_num"]
-                    print(f"{si}/{len(subjects)}: {threadN}")
-                    if threadN is None:
-                        continue
-                    board = index2["board"]
-                    if board is not None:
-                        board = board["short_name"]
-                    if board is None:
-                        board = "_"
-                    thread_tasks.append(
-                        asyncio.create_task(
-                            self.fetch_thread(
-                                session,
-                                archive_url,
-                                board,
-                                threadN,
-                                semaphore,
-                                delay,
-                                archive,
-                                subject,
-                                self.utilities.clean_filename(searchText),
-                                **kwargs,
-                            )
-                        )
+                post_board = post.get("board")
+                if isinstance(post_board, dict):
+                    post_board = post_board.get("shortname") or post_board.get(
+                        "short_name"
+                    )
+                threads[threadN] = post_board or board
+        return [(post_board, threadN) for threadN, post_board in threads.items()]
+
+    async def iter_subject_threads(self, archive=0, subject="", **kwargs):
+        """
+        Yield ``(thread_num, texts)`` for each thread a subject search finds,
+        as its fetch completes. Fetches share the archive's scheduler (which
+        paces and caps them), within the call's ``delay``/``semaphore``
+        throttle; rendering runs in the worker pool.
+        """
+        archive_url = self.getArchive(archive)
+        # The subject search throttles its pages itself
+        throttle = self.throttle(kwargs.get("delay"), kwargs.get("semaphore"))
+        threads = await self.subject_thread_nums(archive, subject, **kwargs)
+
+        async def fetch(board, threadN):
+            try:
+                async with throttle:
+                    thread = await self.fetch_thread(
+                        archive_url, board, threadN, archive, subject
                     )
+            except Exception as e:
+                print(f"Thread {threadN}: {e}")
+                return threadN, []
+            return threadN, await pool.run(post_texts, thread, items=len(thread))
 
-            threads = await asyncio.gather(*thread_tasks)
-            if threads == []:
-                return None
-
-            subjs = []
-            for i in threads:
-                print(i.columns)
-                print(i.head())
-                for thr in i.values:
-                    texts = self.formatText(thr)
-                    searched = self.utilities.regex_search(texts, searchText, case)
-                    subjs.append(texts)
-                    if searched:
-                        searchedCount = len(searched)
-                        searchesCount += searchedCount
-                        found = [
-                            f"Thread: {threadN}, Count: {searchedCount}",
-                            *searched,
-                        ]
-                        result.append(found)
-
-            if result != []:
-                result.insert(
-                    0, f"Total Count: {searchesCount} in {len(result)} threads"
-                )
-            self.utilities.log(
-                f"Search in subject '{subject}' returned {searchesCount} results.\n{self.formatText(result)}",
-                site=self.getArchiveName(archive) + "_searches",
-                board=board,
-                query=searchText + "_" + subject,
-                folderName="search-subjects",
-            )
-            self.utilities.log(
-                f"Search in subject '{subject}' returned {searchesCount} results.\n{self.formatText(subjs)}",
-                site=self.getArchiveName(archive) + "_subjects",
-                board=board,
-                query=searchText + "_" + subject,
-                folderName="subjects",
+        tasks = [asyncio.create_task(fetch(*thread)) for thread in threads]
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                threadN, texts = await task
+                print(f"{done}/{len(tasks)}: {threadN}")
+                yield threadN, texts
+        finally:
+            # The consumer stopped early: don't leave fetches running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def iter_subject_matches(
+        self, archive=0, subject="", queries=(), case=False, **kwargs
+    ):
+        """
+        Yield ``(thread_num, texts, hits)`` as each thread of a subject search
+        arrives, ``hits`` being ``{query: [matching texts]}``. Matching runs in
+        the worker pool, off the event loop.
+        """
+        queries = tuple(dict.fromkeys(queries))
+        regexes = frozenset(filter(self.utilities.is_regex, queries))
+        async for threadN, texts in self.iter_subject_threads(
+            archive, subject, **kwargs
+        ):
+            hits = await pool.run(
+                match_texts, texts, queries, case, regexes, items=len(texts)
             )
-            return result
+            yield threadN, texts, hits
+
+    @staticmethod
+    def _match_result(queries):
+        return {
+            "threads": 0,
+            "posts": 0,
+            "queries": {
+                query: {"count": 0, "threads": {}} for query in dict.fromkeys(queries)
+            },
+        }
+
+    @staticmethod
+    def _add_matches(result, threadN, texts, hits):
+        result["threads"] += 1
+        result["posts"] += len(texts)
+        for query, matched in hits.items():
+            if matched:
+                hit = result["queries"][query]
+                hit["count"] += len(matched)
+                hit["threads"][str(threadN)] = matched
+
+    def match_threads(self, threads, queries, case=False):
+        """
+        Match every query against every post of ``threads`` in one pass.
+
+        Returns ``{"threads": n, "posts": n, "queries": {query: {"count": n,
+        "threads": {thread_num: [texts]}}}}``.
+        """
+        query_set = QuerySet(queries, case, self.utilities.is_regex)
+        result = self._match_result(queries)
+        for threadN, texts in threads:
+            self._add_matches(result, threadN, texts, query_set.match_all(texts))
+        return result
+
+    async def searchInSubjectBatch(
+        self, archive=0, subject="", queries=(), case=False, **kwargs
+    ):
+        """Check many queries against the threads of one subject search"""
+        board = kwargs.get("board", "_")
+        result = self._match_result(queries)
+        async for threadN, texts, hits in self.iter_subject_matches(
+            archive, subject, queries, case, **kwargs
+        ):
+            self._add_matches(result, threadN, texts, hits)
+        self.utilities.json(
+            result,
+            site=self.getArchiveName(archive) + "_batch",
+            board=board,
+            query=subject,
+            folderName="search-subjects",
+        )
+        return result
+
+    async def searchInSubject(self, archive=0, subject="", searchText="", **kwargs):
+        case = kwargs.pop("case", False)
+        board = kwargs.get("board", "_")
+        result = []
+        subjs = []
+        searchesCount = 0
+        async for threadN, texts, hits in self.iter_subject_matches(
+            archive, subject, [searchText], case, **kwargs
+        ):
+            subjs.extend(texts)
+            searched = hits[searchText]
+            if searched:
+                searchesCount += len(searched)
+                result.append([f"Thread: {threadN}, Count: {len(searched)}", *searched])
+        if subjs == []:
+            return None
+
+        if result != []:
+            result.insert(0, f"Total Count: {searchesCount} in {len(result)} threads")
+        self.utilities.log(
+            f"Search in subject '{subject}' returned {searchesCount} results.\n{self.formatText(result)}",
+            site=self.getArchiveName(archive) + "_searches",
+            board=board,
+            query=searchText + "_" + subject,
+            folderName="search-subjects",
+        )
+        self.utilities.log(
+            f"Search in subject '{subject}' returned {searchesCount} results.\n{self.formatText(subjs)}",
+            site=self.getArchiveName(archive) + "_subjects",
+            board=board,
+            query=searchText + "_" + subject,
+            folderName="subjects",
+        )
+        return result
 
     async def fetch_thread(
         self,
-        session,
         archive_url,
         board,
         thread_num,
-        semaphore,
-        delay,
         *targs,
         **kwargs,
     ):
-        async with semaphore:
-            # Introduce a delay before each request
-            await asyncio.sleep(delay)
-            thr = await thread(
-                archive_url, board=board, thread_num=thread_num, **kwargs
-            )
-            for i, targ in enumerate(targs):
-                kwargs[str(i)] = targ
-            df = self.posts_to_dataframe(thr, "thread", board=board, **kwargs)
-            return df
+        # Only posts newer than the last sync of this thread are fetched;
+        # pacing and concurrency are handled by the archive's scheduler
+        try:
+            watched, _ = await self.threads.sync(archive_url, board, thread_num)
+        except LookupError as e:
+            print(e)
+            return pd.DataFrame()
+        for i, targ in enumerate(targs):
+            kwargs[str(i)] = targ
+        return await self.build_dataframe(
+            watched.ordered_posts(), "thread", board=board, **kwargs
+        )
 
     def getArchive(self, archive=0):
         if isinstance(archive, int):
@@ -428,50 +658,46 @@ class MoeSearcher:
     """_summary_
     """
 
-    async def multiArchiveSearch(self, archives=[0, 1, 2, 3], **query):
+    async def multiArchiveSearch(
+        self, archives=[0, 1, 2, 3], dedupe=False, merge_policy="richest", **query
+    ):
         results = []
-        tasks = []
-
-        # Create async tasks for each archive search
-        for index in archives:
-            archive_url = index  # Adjust if you have `self.getArchive(int(index))`
-            print(index, archive_url)
-            tasks.append(self.search(archive=archive_url, **query))
-
-        # Gather all search results simultaneously
-        search_results = await asyncio.gather(*tasks)
-
-        for index, search_result in enumerate(search_results):
-            # Check if search_result is a DataFrame and is not empty
-            if isinstance(search_result, pd.DataFrame) and not search_result.empty:
-                # Convert DataFrame to a list of dictionaries for JSON serialization
-                formatted_text = (
-                    self.formatText(search_result)
-                    if hasattr(self, "formatText")
-                    else []
-                )
-                results.append(
-                    {
-                        "source": self.getArchiveName(index),
-                        "board": query.get("board", "_"),
-                        "results": search_result.to_dict(
-                            orient="records"
-                        ),  # Convert DataFrame to dict
-                        "text": formatted_text,
-                    }
-                )
-            elif (
-                isinstance(search_result, dict) and search_result
-            ):  # If it's a non-empty dictionary
-                formatted_text = search_result.get("text", [])
-                results.append(
-                    {
-                        "source": self.getArchiveName(index),
-                        "board": query.get("board", "_"),
-                        "results": search_result,
-                        "text": formatted_text,
-                    }
-                )
+        board = query.get("board", "_")
+        search_query = {k: v for k, v in query.items() if k not in PAGING_KWARGS}
+
+        # Search every archive concurrently, grouping posts as they stream in.
+        # With dedupe, posts mirrored by several archives are kept once (see
+        # PostMerger) and each group only holds the posts it supplied
+        grouped_posts = {self.getArchiveName(index): [] for index in archives}
+        if dedupe:
+            merger = PostMerger(policy=merge_policy, board=board)
+            async for post in self.iter_search(archives=archives, **query):
+                merger.add(post)
+            for post in merger.posts():
+                grouped_posts[post.pop("source")].append(post)
+            self.merge_stats = merger.stats()
+            self.utilities.log(
+                f"Merged {query}: {json.dumps(self.merge_stats)}",
+                board=query.get("board", ""),
+                query=query.get("text", ""),
+                folderName="search-multi",
+            )
+        else:
+            async for post in self.iter_search(archives=archives, **query):
+                grouped_posts[post.pop("source")].append(post)
+
+        for source, posts in grouped_posts.items():
+            if not posts:
+                continue
+            self.log_records(posts, "search", board=board, **search_query)
+            results.append(
+                {
+                    "source": source,
+                    "board": board,
+                    "results": posts,
+                    "text": await pool.run(post_texts, posts, items=len(posts)),
+                }
+            )
 
         # Log summary of search results
         self.utilities.log(
@@ -527,17 +753,17 @@ class MoeSearcher:
 
     def qSearch(self, archive=0, **kwargs):
         """Run a quick search synchronously and log the results."""
-        search_results = asyncio.run(self.search(archive, **kwargs))
+        search_results = asyncio.run(
+            self._run_and_close(self.search(archive, **kwargs))
+        )
 
         return search_results
 
     def formatText(self, arr, delim="\n\n", canPrint=False):
-        text = ""
-        for i, j in enumerate(arr):
-            if canPrint:
+        if canPrint:
+            for i, j in enumerate(arr):
                 print(f"{i}: {j}{delim}")
-            text += f"{j}{delim}"
-        return text
+        return format_texts([str(j) for j in arr], delim)
 
     def toText(self, val, delim="\n\n", reverse=False, canPrint=False):
         arr = self.getTextArray(val)
@@ -545,6 +771,13 @@ class MoeSearcher:
             arr.reverse()
         return self.formatText(arr, delim, canPrint)
 
+    def writeText(self, val, write, delim="\n\n", reverse=False, encoding=None):
+        """Like ``toText`` but stream the text in chunks to ``write``."""
+        arr = self.getTextArray(val)
+        if reverse:
+            arr.reverse()
+        return write_texts(arr, write, delim, encoding=encoding)
+
 
 # Example usage
 if __name__ == "__main__":
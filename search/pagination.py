@@ -0,0 +1,138 @@
+"""
+Limit-aware pagination over archive search pages
+"""
+
+import asyncio
+import logging
+import math
+
+from .sessions import SessionRegistry
+
+logger = logging.getLogger(__name__)
+
+# FoolFuuka returns 25 posts per search page unless the instance overrides it
+FOOLFUUKA_PAGE_SIZE = 25
+# Fuuka (Warosu) search pages hold 24 posts and are addressed by ``offset``
+WAROSU_PAGE_SIZE = 24
+# Pages fetched ahead of the one being consumed when the limit is open-ended
+DEFAULT_WINDOW = 5
+
+# Per-host page sizes and page caps
+PAGE_SIZES = {"warosu.org": WAROSU_PAGE_SIZE}
+MAX_PAGES = {}
+# Hosts whose search pages are addressed by post offset; Warosu ignores
+# ``page``, so every page would return the same HTML
+OFFSET_HOSTS = {"warosu.org"}
+
+
+def page_size_for(archive_url):
+    return PAGE_SIZES.get(SessionRegistry.host_of(archive_url), FOOLFUUKA_PAGE_SIZE)
+
+
+def max_pages_for(archive_url):
+    return MAX_PAGES.get(SessionRegistry.host_of(archive_url))
+
+
+def page_params(archive_url, page, page_size=None):
+    """Request parameters selecting the 1-based ``page`` of an archive's results"""
+    if SessionRegistry.host_of(archive_url) in OFFSET_HOSTS:
+        page_size = page_size or page_size_for(archive_url)
+        return {"offset": (page - 1) * page_size}
+    return {"page": page}
+
+
+def post_key(post):
+    """Identity of a post for de-duplication across pages: ``(num, subnum)``"""
+    if isinstance(post, dict):
+        return post.get("num"), post.get("subnum")
+    return getattr(post, "num", None), getattr(post, "subnum", None)
+
+
+def pages_needed(limit, page_size, max_pages=None):
+    """Number of pages that can satisfy ``limit``, or ``max_pages`` if open-ended."""
+    if not limit:
+        return max_pages
+    pages = math.ceil(int(limit) / page_size)
+    return min(pages, max_pages) if max_pages else pages
+
+
+async def iter_pages(
+    fetch_page,
+    limit=None,
+    page_size=FOOLFUUKA_PAGE_SIZE,
+    window=None,
+    max_pages=None,
+    key=None,
+):
+    """
+    Fetch search pages and yield their posts page by page, in page order.
+
+    ``fetch_page(page)`` is awaited for 1-based page numbers and returns a
+    list of posts (``None`` on error). Only the pages needed for ``limit``
+    are requested, at most ``window`` of them in flight at once; the real
+    pacing is done by the archive scheduler. Iteration stops, cancelling any
+    in-flight pages, once ``limit`` posts were yielded, a page comes back
+    short (the last page of the results), or a page fails.
+
+    With ``key``, posts whose ``key(post)`` was already yielded are dropped:
+    new posts shift offset-addressed results, so neighbouring pages can
+    overlap. Pages lost to duplicates are made up with extra pages.
+    """
+    last_page = pages_needed(limit, page_size, max_pages)
+    window = window or DEFAULT_WINDOW
+    if last_page:
+        window = min(window, last_page)
+
+    pending = {}
+    next_page = 1
+    remaining = int(limit) if limit else None
+    seen = set()
+
+    def schedule():
+        nonlocal next_page
+        while len(pending) < window and (last_page is None or next_page <= last_page):
+            pending[next_page] = asyncio.ensure_future(fetch_page(next_page))
+            next_page += 1
+
+    try:
+        page = 1
+        schedule()
+        while page in pending:
+            task = pending.pop(page)
+            try:
+                posts = await task
+            except Exception as e:
+                logger.error(f"Error fetching page {page}: {e}")
+                posts = None
+            if not posts:
+                break
+
+            last = len(posts) < page_size
+            if key is not None:
+                fresh = []
+                for post in posts:
+                    post_id = key(post)
+                    if post_id not in seen:
+                        seen.add(post_id)
+                        fresh.append(post)
+                posts = fresh
+            if remaining is not None:
+                posts = posts[:remaining]
+                remaining -= len(posts)
+            if posts:
+                yield posts
+
+            if remaining == 0 or last:
+                break
+            if last_page is not None and page >= last_page:
+                # Only reached when duplicates were dropped before the limit
+                if not remaining or (max_pages and last_page >= max_pages):
+                    break
+                last_page += 1
+            page += 1
+            schedule()
+    finally:
+        for task in pending.values():
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending.values(), return_exceptions=True)
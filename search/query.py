@@ -0,0 +1,198 @@
+"""
+Canonical search queries, so equivalent requests share one cache entry
+"""
+
+import hashlib
+import json
+
+from .cache import CacheEntry
+
+DEFAULT_LIMIT = 50
+
+
+def normalize_board(board):
+    """``"/A/"``, ``" a "`` and ``"a"`` are the same board (as in warosu_search)"""
+    if isinstance(board, (list, tuple, set)):
+        boards = sorted({normalize_board(b) for b in board} - {"_"})
+        return ".".join(boards) or "_"
+    board = str(board or "").strip().lower().replace("/", "")
+    return board or "_"
+
+
+def normalize_text(text, use_regex=False):
+    """Collapse whitespace; archive full-text search ignores case, regexes don't"""
+    text = " ".join(str(text or "").split())
+    return text if use_regex else text.casefold()
+
+
+def normalize_archives(archives):
+    """Deduplicated, sorted archives; numeric strings become indices"""
+    if archives is None:
+        return []
+    if isinstance(archives, (int, str)):
+        archives = [archives]
+    normalized = set()
+    for archive in archives:
+        if isinstance(archive, str):
+            archive = archive.strip()
+            archive = int(archive) if archive.isdigit() else archive.lower()
+        normalized.add(archive)
+    # Indices first, then archive names/URLs
+    return sorted(normalized, key=lambda a: (isinstance(a, str), str(a).zfill(8)))
+
+
+def normalize_limit(limit):
+    """Positive int, or None for "no limit" (every page)"""
+    if limit in (None, ""):
+        return None
+    limit = int(limit)
+    return limit if limit > 0 else None
+
+
+class SearchQuery:
+    """
+    A search request in canonical form.
+
+    The cache key covers everything but ``limit``: an entry records the
+    limit it was searched with and answers any request it covers, sliced
+    per source. A cached limit=100 search therefore serves limit=50.
+    ``text`` is kept as requested and sent upstream as is; only the cache
+    key normalizes it.
+    """
+
+    __slots__ = ("text", "archives", "board", "use_regex", "subject_only", "limit")
+
+    def __init__(
+        self,
+        text="",
+        archives=None,
+        board="_",
+        use_regex=False,
+        subject_only=False,
+        limit=DEFAULT_LIMIT,
+    ):
+        self.use_regex = bool(use_regex)
+        self.subject_only = bool(subject_only)
+        self.text = str(text or "")
+        self.archives = normalize_archives(archives)
+        self.board = normalize_board(board)
+        self.limit = normalize_limit(limit)
+
+    @classmethod
+    def from_request(cls, data):
+        """Build from an /api/search request body"""
+        return cls(
+            text=data.get("query", ""),
+            archives=data.get("archives", []),
+            board=data.get("board", "_"),
+            use_regex=data.get("useRegex", False),
+            subject_only=data.get("subjectOnly", False),
+            limit=data.get("limit", DEFAULT_LIMIT),
+        )
+
+    def __repr__(self):
+        return (
+            f"SearchQuery({self.text!r}, archives={self.archives}, "
+            f"board={self.board!r}, limit={self.limit})"
+        )
+
+    def canonical(self):
+        return {
+            "text": normalize_text(self.text, self.use_regex),
+            "archives": self.archives,
+            "board": self.board,
+            "regex": self.use_regex,
+            "subject": self.subject_only,
+        }
+
+    @property
+    def cache_key(self):
+        canonical = json.dumps(self.canonical(), sort_keys=True, separators=(",", ":"))
+        return hashlib.md5(canonical.encode()).hexdigest()
+
+    @property
+    def flight_key(self):
+        """Single-flight key: only searches for the same limit can be shared"""
+        return f"{self.cache_key}:{self.limit or 'all'}"
+
+    def search_kwargs(self):
+        """MoeSearcher keyword arguments for this query"""
+        search_kwargs = {"text": self.text, "board": self.board, "limit": self.limit}
+
+        # Add regex parameter if supported by the search method
+        if self.use_regex:
+            search_kwargs["regex"] = self.text
+
+        # Add subject only parameter if needed
+        if self.subject_only:
+            search_kwargs["subject"] = self.text
+        return search_kwargs
+
+    def widen(self, limit):
+        """This query with the larger of its limit and ``limit``"""
+        query = SearchQuery.__new__(SearchQuery)
+        for name in self.__slots__:
+            setattr(query, name, getattr(self, name))
+        if query.limit is not None:
+            query.limit = None if limit is None else max(query.limit, limit)
+        return query
+
+    @staticmethod
+    def _sources(post):
+        """Every archive that returned ``post`` (merged posts list them all)"""
+        if not isinstance(post, dict):
+            return [None]
+        return post.get("sources") or [post.get("source")]
+
+    @classmethod
+    def _by_source(cls, results):
+        groups = {}
+        for post in results:
+            for source in cls._sources(post):
+                groups.setdefault(source, []).append(post)
+        return groups
+
+    def covers(self, entry):
+        """Whether a cached entry holds every post this query would return"""
+        if entry.error or not entry.value:
+            # Errors and empty results hold for any limit until they expire
+            return True
+        if entry.limit is None or (
+            self.limit is not None and entry.limit >= self.limit
+        ):
+            return True
+        # A smaller search covers a larger one when every source ran dry
+        groups = self._by_source(entry.value)
+        return len(groups) >= max(len(self.archives), 1) and all(
+            len(posts) < entry.limit for posts in groups.values()
+        )
+
+    def answer(self, entry):
+        """
+        The entry trimmed to this query's limit, or None if it does not cover
+        it. ``limit`` stays the one the entry was searched with.
+        """
+        if entry is None or not self.covers(entry):
+            return None
+        if self.limit is None or entry.error or not entry.value:
+            return entry
+        groups = self._by_source(entry.value)
+        if all(len(posts) <= self.limit for posts in groups.values()):
+            return entry
+        taken = {source: 0 for source in groups}
+        value = []
+        for post in entry.value:
+            sources = self._sources(post)
+            # A merged post is kept while any archive that returned it is
+            # under the limit, and counts against all of them
+            if any(taken[source] < self.limit for source in sources):
+                for source in sources:
+                    taken[source] += 1
+                value.append(post)
+        return CacheEntry(
+            value,
+            stale=entry.stale,
+            negative=entry.negative,
+            error=entry.error,
+            limit=entry.limit,
+        )
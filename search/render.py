@@ -0,0 +1,87 @@
+"""
+Plain-text rendering of posts, column by column: the title, number/date
+and comment columns are pulled out once and rendered in a single pass,
+then joined (or streamed in chunks) instead of growing one string.
+"""
+
+TEXT_COLUMNS = ("title", "num", "fourchan_date", "comment")
+CHUNK_SIZE = 1000
+
+
+def _column(df, name):
+    if name not in df.columns:
+        return [None] * len(df)
+    column = df[name]
+    if column.hasnans:
+        column = column.astype(object).where(column.notna(), None)
+    return column.tolist()
+
+
+def text_columns(posts):
+    """
+    ``(titles, nums, dates, comments)`` lists of a DataFrame, a PostBatch
+    (anything with a ``columns`` dict of arrays) or a list of post dicts or
+    Post models.
+    """
+    columns = getattr(posts, "columns", None)
+    if isinstance(columns, dict):
+        return tuple(columns[name].tolist() for name in TEXT_COLUMNS)
+    if columns is not None:
+        # A DataFrame; checked by duck type so rendering needs no pandas import
+        return tuple(_column(posts, name) for name in TEXT_COLUMNS)
+    posts = list(posts or [])
+    if not posts:
+        return [], [], [], []
+    return tuple(list(column) for column in zip(*map(_text_fields, posts)))
+
+
+def _text_fields(post):
+    if isinstance(post, dict):
+        return tuple(post.get(name) for name in TEXT_COLUMNS)
+    return tuple(getattr(post, name, None) for name in TEXT_COLUMNS)
+
+
+def render_texts(titles, nums, dates, comments):
+    """One text per post: optional title line, ``num date`` line, comment"""
+    texts = [
+        (
+            f"{title}\n{num} {date or ''}\n{comment or ''}"
+            if title
+            else f"{num} {date or ''}\n{comment or ''}"
+        ).strip()
+        for title, num, date, comment in zip(titles, nums, dates, comments)
+    ]
+    return [text for text in texts if text]
+
+
+def post_texts(posts):
+    """Rendered texts of ``posts``, empty ones dropped"""
+    return render_texts(*text_columns(posts))
+
+
+def iter_chunks(texts, delim="\n\n", chunk_size=CHUNK_SIZE):
+    """
+    ``texts``, each followed by ``delim``, as strings of up to ``chunk_size``
+    texts; concatenated they equal ``format_texts(texts, delim)``.
+    """
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts[start : start + chunk_size]
+        yield delim.join(chunk) + delim
+
+
+def format_texts(texts, delim="\n\n"):
+    """``texts`` as one string, each followed by ``delim``"""
+    return "".join(iter_chunks(texts, delim, max(len(texts), 1)))
+
+
+def write_texts(texts, write, delim="\n\n", chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    Stream ``texts`` chunk by chunk to ``write`` (``file.write``,
+    ``socket.sendall``, a handler's ``write``...); ``encoding`` encodes each
+    chunk first, for byte streams. Returns the number of characters written.
+    """
+    written = 0
+    for chunk in iter_chunks(texts, delim, chunk_size):
+        write(chunk.encode(encoding) if encoding else chunk)
+        written += len(chunk)
+    return written
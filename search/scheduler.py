@@ -0,0 +1,277 @@
+"""
+Per-archive request scheduling: token-bucket rate limiting plus an
+AIMD (additive-increase, multiplicative-decrease) concurrency window
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from .sessions import SessionRegistry
+
+logger = logging.getLogger(__name__)
+
+# Starting policies for the archives in MoeSearcher.archivers. Hosts that are
+# not listed fall back to DEFAULT_POLICY.
+DEFAULT_POLICY = {
+    "rate": 4.0,  # requests per second
+    "burst": 8,
+    "concurrency": 4,
+    "max_concurrency": 8,
+}
+HOST_POLICIES = {
+    # Cloudflare in front of 4plebs bans aggressive clients quickly
+    "archive.4plebs.org": {"rate": 1.0, "burst": 2, "concurrency": 2},
+    # Warosu is a single Fuuka instance serving HTML
+    "warosu.org": {"rate": 1.0, "burst": 3, "concurrency": 2, "max_concurrency": 4},
+}
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504, 520, 521, 522, 524}
+
+
+class TokenBucket:
+    """Classic token bucket; ``acquire`` waits until a token is available."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        """Hand out no tokens for ``seconds`` (e.g. from a Retry-After header)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CallThrottle:
+    """
+    One caller's own limits, applied on top of its archive's scheduler: at
+    most ``concurrency`` requests at a time and ``rate`` per second. Other
+    callers of the archive are unaffected.
+    """
+
+    def __init__(self, rate=None, concurrency=None):
+        self.bucket = TokenBucket(rate, concurrency or 1) if rate else None
+        self.semaphore = asyncio.Semaphore(int(concurrency)) if concurrency else None
+
+    async def __aenter__(self):
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                if self.semaphore is not None:
+                    self.semaphore.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+class Ticket:
+    """Handle for one scheduled request, used to report its outcome."""
+
+    __slots__ = ("started", "status", "retry_after")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.status = None
+        self.retry_after = None
+
+    def record(self, status, retry_after=None):
+        self.status = status
+        if retry_after:
+            try:
+                self.retry_after = float(retry_after)
+            except (TypeError, ValueError):
+                self.retry_after = None
+
+    @property
+    def throttled(self):
+        return self.status in RETRYABLE_STATUSES
+
+
+class HostLimiter:
+    """Token bucket and adaptive concurrency window for a single host."""
+
+    def __init__(
+        self,
+        host,
+        rate,
+        burst,
+        concurrency,
+        max_concurrency,
+        min_concurrency=1,
+        latency_target=5.0,
+    ):
+        self.host = host
+        self.base_rate = float(rate)
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._waiters = []
+        self._loop = None
+
+    def _bind_loop(self):
+        # Waiters are futures of a specific loop; a new loop starts clean
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._waiters = []
+            self.in_flight = 0
+
+    async def acquire(self):
+        self._bind_loop()
+        while self.in_flight >= int(self.concurrency):
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass a wake-up we may have consumed on to the next waiter
+                self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        try:
+            await self.bucket.acquire()
+        except asyncio.CancelledError:
+            self.in_flight -= 1
+            self._wake()
+            raise
+
+    def release(self, ticket, outcome="ok"):
+        self.in_flight = max(0, self.in_flight - 1)
+        latency = time.monotonic() - ticket.started
+        # A cancelled request says nothing about the archive's health
+        if outcome != "cancelled":
+            if outcome == "failed" or ticket.throttled:
+                self._decrease(ticket)
+            elif latency > self.latency_target:
+                self.concurrency = max(self.min_concurrency, self.concurrency - 1)
+            else:
+                self._increase()
+        self._wake()
+
+    def _increase(self):
+        # Additive increase: roughly +1 slot per full window of successes
+        self.concurrency = min(
+            self.max_concurrency, self.concurrency + 1 / max(self.concurrency, 1)
+        )
+        if self.bucket.rate < self.base_rate:
+            self.bucket.rate = min(self.base_rate, self.bucket.rate + 0.1)
+
+    def _decrease(self, ticket):
+        # Multiplicative decrease on 429/5xx and transport errors
+        self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+        self.bucket.rate = max(0.1, self.bucket.rate / 2)
+        if ticket.retry_after:
+            self.bucket.pause(ticket.retry_after)
+        logger.info(
+            f"Backing off {self.host}: status={ticket.status} "
+            f"concurrency={self.concurrency:.1f} rate={self.bucket.rate:.2f}/s"
+        )
+
+    def _wake(self):
+        free = int(self.concurrency) - self.in_flight
+        for waiter in list(self._waiters):
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def configure(self, rate=None, burst=None, concurrency=None, max_concurrency=None):
+        if rate is not None:
+            self.base_rate = self.bucket.rate = float(rate)
+        if burst is not None:
+            self.bucket.burst = float(burst)
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+            self.concurrency = min(self.concurrency, self.max_concurrency)
+        if concurrency is not None:
+            self.concurrency = float(min(concurrency, self.max_concurrency))
+
+
+class Scheduler:
+    """Routes every archive request through its host's limiter."""
+
+    def __init__(self, policies=None, default_policy=None):
+        self.policies = dict(HOST_POLICIES if policies is None else policies)
+        self.default_policy = dict(default_policy or DEFAULT_POLICY)
+        self._limiters = {}
+
+    def limiter(self, url):
+        host = SessionRegistry.host_of(url)
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            policy = {**self.default_policy, **self.policies.get(host, {})}
+            policy["max_concurrency"] = max(
+                policy["max_concurrency"], policy["concurrency"]
+            )
+            limiter = HostLimiter(host, **policy)
+            self._limiters[host] = limiter
+        return limiter
+
+    def register(self, url):
+        """Create the limiter for an archive ahead of its first request."""
+        return self.limiter(url)
+
+    def configure(self, url, **policy):
+        """Override the rate/burst/concurrency policy of an archive."""
+        self.limiter(url).configure(**policy)
+
+    @asynccontextmanager
+    async def slot(self, url):
+        limiter = self.limiter(url)
+        await limiter.acquire()
+        ticket = Ticket()
+        outcome = "failed"
+        try:
+            yield ticket
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            limiter.release(ticket, outcome)
+
+    def stats(self):
+        return {
+            host: {
+                "rate": round(limiter.bucket.rate, 2),
+                "concurrency": round(limiter.concurrency, 2),
+                "in_flight": limiter.in_flight,
+            }
+            for host, limiter in self._limiters.items()
+        }
+
+
+# Process-wide scheduler used by async_api
+scheduler = Scheduler()
@@ -0,0 +1,125 @@
+"""
+The search behind /api/search, shared by the Tornado server and the Django
+view: cache lookups, background refreshes of stale entries, coalesced
+scrapes and result caching
+"""
+
+import asyncio
+
+from .cache import RedisCacheManager
+from .moesearcher import MoeSearcher
+from .singleflight import RedisSingleFlight, SingleFlight
+
+
+def process_results(search_results):
+    """Flatten search results into the list of posts the frontend expects"""
+    if hasattr(search_results, "to_dict") and callable(search_results.to_dict):
+        # A DataFrame from a single archive search
+        return search_results.to_dict(orient="records")
+    if isinstance(search_results, dict):
+        # multiArchiveSearch results grouped by archive name
+        results = []
+        for archive_name, archive_data in search_results.items():
+            board = archive_data.get("board", "_")
+            for result in archive_data.get("results", []):
+                results.append({"source": archive_name, "board": board, **result})
+        return results
+    if isinstance(search_results, list):
+        return search_results
+    return []
+
+
+class SearchService:
+    """
+    Answers SearchQuery objects from the Redis cache or the archives.
+
+    Identical concurrent misses share one scrape through ``flight``; with
+    ``shared_flight`` a Redis lock extends that to several server
+    processes sharing the cache.
+    """
+
+    def __init__(self, cache_manager=None, shared_flight=False):
+        self.cache_manager = cache_manager or RedisCacheManager()
+        self.flight = (
+            RedisSingleFlight(self.cache_manager) if shared_flight else SingleFlight()
+        )
+        # Background refreshes, referenced until they finish
+        self._refreshes = set()
+
+    async def lookup(self, search_query):
+        """The cached entry answering ``search_query``, or None on a miss"""
+        entry = await self.cache_manager.get_entry(search_query.cache_key)
+        return search_query.answer(entry)
+
+    async def cached_results(self, search_query):
+        """Cached results answering ``search_query``, for shared single-flight"""
+        entry = await self.lookup(search_query)
+        if entry is None or entry.error:
+            return None
+        return entry.value
+
+    async def search(self, search_query, fn=None):
+        """
+        Run ``fn()`` (by default ``run_search``) as the flight of
+        ``search_query``, or join the identical search already running
+        """
+        return await self.flight.do(
+            search_query.flight_key,
+            fn or (lambda: self.run_search(search_query)),
+            cached=lambda: self.cached_results(search_query),
+        )
+
+    def refresh(self, search_query):
+        """Revalidate a stale cache entry in the background"""
+        if self.flight.in_flight(search_query.flight_key):
+            return
+        print(f"Refreshing stale cache for query: {search_query.text}")
+        task = asyncio.ensure_future(self.search(search_query))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+        # Errors are already logged and negatively cached by run_search
+        task.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def run_search(self, search_query):
+        """Search the archives, cache the processed results and return them"""
+        archives = search_query.archives
+        search_kwargs = search_query.search_kwargs()
+        moe_searcher = MoeSearcher()
+        sources = [moe_searcher.getArchiveName(archive) for archive in archives]
+
+        try:
+            if len(archives) > 1:
+                search_results = await moe_searcher.multiArchiveSearch(
+                    archives=archives, dedupe=True, **search_kwargs
+                )
+            else:
+                search_results = await moe_searcher.search(
+                    archive=archives[0], **search_kwargs
+                )
+        except Exception as e:
+            print(f"Search failed for query: {search_query.text}: {e}")
+            await self.cache_result(search_query, None, sources, error=e)
+            raise
+
+        processed_results = process_results(search_results)
+        await self.cache_result(search_query, processed_results, sources)
+        return processed_results
+
+    async def cache_result(self, search_query, result, archives=None, error=None):
+        """Cache a search result (or error) if Redis is available"""
+        if not self.cache_manager.is_cache_warm():
+            print("Redis not available, skipping cache")
+        elif await self.cache_manager.set_cached_result(
+            search_query.cache_key,
+            result,
+            archives=archives,
+            error=error,
+            limit=search_query.limit,
+        ):
+            print(f"Result cached for query: {search_query.text}")
+        else:
+            print(f"Failed to cache result for query: {search_query.text}")
+
+    async def close(self):
+        """Disconnect from Redis"""
+        await self.cache_manager.close()
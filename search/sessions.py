@@ -0,0 +1,123 @@
+"""
+Shared aiohttp session pool for archive requests
+"""
+
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30
+LIMIT_PER_HOST = 8
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+
+
+class SessionRegistry:
+    """
+    Long-lived aiohttp sessions, one per archive host.
+
+    Every session owns its own TCPConnector so keep-alive connections and the
+    DNS cache are reused across search pages, threads and posts, and each
+    archive gets its own connection limit. Sessions are bound to the event
+    loop that created them, so they are kept per ``(loop, host)``; sessions
+    of a finished loop (e.g. after ``asyncio.run``) are closed the next time
+    a session is created or the registry is closed.
+    """
+
+    def __init__(
+        self,
+        limit_per_host=LIMIT_PER_HOST,
+        dns_cache_ttl=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._sessions = {}
+        self._reaping = set()
+
+    @staticmethod
+    def host_of(url):
+        """Return the normalized host part of an archive URL."""
+        parts = urlsplit(str(url).strip())
+        return (parts.netloc or parts.path).lower().rstrip("/")
+
+    def _make_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit_per_host,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    def get(self, url):
+        """Get or create the shared session for the host of ``url``."""
+        host = self.host_of(url)
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get((loop, host))
+        if session is not None and not session.closed:
+            return session
+        self._reap(loop)
+        session = self._make_session()
+        self._sessions[(loop, host)] = session
+        return session
+
+    def _stale(self, loop):
+        """Pop the sessions of ``loop`` and of every finished loop"""
+        keys = [key for key in self._sessions if key[0] is loop or key[0].is_closed()]
+        return [(host, self._sessions.pop((key_loop, host))) for key_loop, host in keys]
+
+    def _reap(self, loop):
+        # Sessions of finished loops; their connectors close without I/O
+        for host, session in self._stale(None):
+            if session.closed:
+                continue
+            logger.debug(f"Closing session for {host} from a finished event loop")
+            task = loop.create_task(self._close_session(host, session))
+            self._reaping.add(task)
+            task.add_done_callback(self._reaping.discard)
+
+    @staticmethod
+    async def _close_session(host, session):
+        try:
+            await session.close()
+        except Exception as e:
+            logger.error(f"Error closing session for {host}: {e}")
+
+    def hosts(self):
+        """Return the hosts that currently have an open session."""
+        return list(
+            dict.fromkeys(
+                host for (_, host), s in self._sessions.items() if not s.closed
+            )
+        )
+
+    async def close(self):
+        """
+        Close the sessions of the running event loop and of finished loops;
+        sessions of loops still running in other threads are left to them.
+        """
+        for host, session in self._stale(asyncio.get_running_loop()):
+            if not session.closed:
+                await self._close_session(host, session)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+# Process-wide registry used by async_api
+sessions = SessionRegistry()
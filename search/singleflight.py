@@ -0,0 +1,115 @@
+"""
+Request coalescing: concurrent identical searches share one upstream scrape
+"""
+
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    In-process single-flight keyed by the search cache key.
+
+    The first caller for a key runs the search; callers that arrive while
+    it is in flight await the same future instead of scraping again.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    def in_flight(self, key):
+        return key in self._flights
+
+    async def do(self, key, fn, cached=None):
+        """
+        Return ``await fn()``, sharing one call among concurrent callers.
+
+        ``cached`` is only used by ``RedisSingleFlight``.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            logger.info(f"Coalescing search {key}")
+            # shield: one impatient caller must not cancel everyone's search
+            return await asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(fn())
+        self._flights[key] = flight
+        flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(flight)
+
+
+class RedisSingleFlight(SingleFlight):
+    """
+    Cross-process single-flight for several server workers sharing Redis.
+
+    Within a process calls are coalesced like ``SingleFlight``. Across
+    processes the leader takes a Redis lock (``SET NX PX``) and runs the
+    search; followers poll the cache (``cached()``, or the entry under
+    ``key``) until the leader has stored the result, and fall back to
+    searching themselves if the lock disappears or ``wait_timeout`` expires.
+    """
+
+    RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, cache_manager, lock_ttl=60, poll_interval=0.25, wait_timeout=60):
+        super().__init__()
+        self.cache_manager = cache_manager
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+
+    @staticmethod
+    def lock_key(key):
+        return f"lock:{key}"
+
+    async def do(self, key, fn, cached=None):
+        return await super().do(key, lambda: self._do_locked(key, fn, cached))
+
+    async def _do_locked(self, key, fn, cached=None):
+        if not self.cache_manager.is_cache_warm():
+            return await fn()
+        redis_client = self.cache_manager.redis_client
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis_client.set(
+                self.lock_key(key), token, nx=True, px=int(self.lock_ttl * 1000)
+            )
+        except Exception as e:
+            logger.warning(f"Redis lock unavailable, searching locally: {e}")
+            return await fn()
+
+        if acquired:
+            try:
+                return await fn()
+            finally:
+                try:
+                    await redis_client.eval(
+                        self.RELEASE_SCRIPT, 1, self.lock_key(key), token
+                    )
+                except Exception as e:
+                    logger.warning(f"Error releasing search lock {key}: {e}")
+
+        # Another worker is running this search: wait for its cached result
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            if cached is not None:
+                result = await cached()
+            else:
+                result = await self.cache_manager.get_cached_result(key)
+            if result is not None:
+                return result
+            try:
+                if not await redis_client.exists(self.lock_key(key)):
+                    break
+            except Exception:
+                break
+        logger.info(f"No shared result for {key}, searching locally")
+        return await fn()
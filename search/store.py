@@ -0,0 +1,489 @@
+"""
+Local SQLite mirror of every harvested post, with an FTS5 full-text index
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from .sessions import SessionRegistry
+
+logger = logging.getLogger(__name__)
+
+# Set FORARCHIVES_STORE to a file path to move the store, or to "off" to
+# disable it
+STORE_ENV = "FORARCHIVES_STORE"
+# Stored searches older than this are searched upstream again
+COVERAGE_MAX_AGE = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    archive TEXT NOT NULL,
+    board TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    subnum INTEGER NOT NULL DEFAULT 0,
+    thread_num INTEGER,
+    timestamp INTEGER,
+    name TEXT,
+    title TEXT,
+    comment TEXT,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (archive, board, num, subnum)
+);
+CREATE INDEX IF NOT EXISTS posts_thread ON posts (archive, board, thread_num);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    comment, title, name, content='posts', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS posts_ai AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, comment, title, name)
+    VALUES (new.id, new.comment, new.title, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, comment, title, name)
+    VALUES ('delete', old.id, old.comment, old.title, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_au AFTER UPDATE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, comment, title, name)
+    VALUES ('delete', old.id, old.comment, old.title, old.name);
+    INSERT INTO posts_fts (rowid, comment, title, name)
+    VALUES (new.id, new.comment, new.title, new.name);
+END;
+
+-- Archive searches already run upstream and the posts they returned, in
+-- order, so a repeated search can be answered locally
+CREATE TABLE IF NOT EXISTS coverage (
+    id INTEGER PRIMARY KEY,
+    archive TEXT NOT NULL,
+    board TEXT NOT NULL,
+    query TEXT NOT NULL,
+    search_limit INTEGER,
+    complete INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    UNIQUE (archive, board, query)
+);
+CREATE TABLE IF NOT EXISTS coverage_posts (
+    coverage_id INTEGER NOT NULL REFERENCES coverage (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    post_id INTEGER NOT NULL REFERENCES posts (id),
+    PRIMARY KEY (coverage_id, position)
+);
+
+-- Highest doc_id seen per thread, for incremental thread fetches
+CREATE TABLE IF NOT EXISTS threads (
+    archive TEXT NOT NULL,
+    board TEXT NOT NULL,
+    thread_num INTEGER NOT NULL,
+    latest_doc_id INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (archive, board, thread_num)
+);
+"""
+
+
+def default_path():
+    from .utilities import Utilities
+
+    path = os.getenv(STORE_ENV)
+    if path:
+        return None if path.lower() == "off" else path
+    # Next to the logs directory, e.g. ~/.local/share/forarchives/posts.db
+    return os.path.join(os.path.dirname(Utilities().log_dir), "posts.db")
+
+
+def _as_dict(post):
+    if isinstance(post, dict):
+        return post
+    if hasattr(post, "to_dict"):
+        return post.to_dict()
+    return vars(post)
+
+
+def _json_default(obj):
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return vars(obj) if hasattr(obj, "__dict__") else str(obj)
+
+
+def _int(value, default=None):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _board_of(post, board):
+    post_board = post.get("board")
+    if isinstance(post_board, dict):
+        post_board = post_board.get("shortname") or post_board.get("short_name")
+    return str(post_board or board or "_").strip("/").lower()
+
+
+def _log_write_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Error storing posts: {future.exception()}")
+
+
+def thread_posts(thread):
+    """The op and reply dicts of a FoolFuuka /thread response"""
+    data = _as_dict(thread)
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        if value.get("op"):
+            yield _as_dict(value["op"])
+        replies = value.get("posts") or {}
+        if isinstance(replies, dict):
+            replies = replies.values()
+        for reply in replies:
+            yield _as_dict(reply)
+
+
+def query_key(board, query):
+    """Canonical text of the archive query arguments of a search"""
+    from .query import normalize_board, normalize_text
+
+    query = {k: v for k, v in query.items() if v is not None}
+    if "text" in query:
+        query["text"] = normalize_text(query["text"])
+    return normalize_board(board), json.dumps(query, sort_keys=True, default=str)
+
+
+class PostStore:
+    """
+    Posts keyed by (archive, board, num, subnum), with comment, title and
+    name indexed by FTS5.
+
+    The database is opened lazily. Writes run on a single worker thread so
+    the event loop never waits on SQLite; the ``_``-prefixed methods are
+    the synchronous versions.
+    """
+
+    def __init__(self, path=None, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._conn = None
+        self._executor = None
+
+    def configure(self, path=None, enabled=True):
+        """Point the store at another database (closing the current one)"""
+        self.close()
+        self.path = path
+        self.enabled = enabled
+
+    @property
+    def available(self):
+        if self.enabled and self.path is None:
+            self.path = default_path()
+            self.enabled = self.path is not None
+        return self.enabled
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            if not self.available:
+                raise RuntimeError("The post store is disabled")
+            path = self.path
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="post-store"
+            )
+        return self._executor
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def _add_posts(self, archive_url, board, posts):
+        archive = SessionRegistry.host_of(archive_url)
+        now = time.time()
+        rows = []
+        for post in posts:
+            post = _as_dict(post)
+            num = _int(post.get("num"))
+            if num is None:
+                continue
+            rows.append(
+                (
+                    archive,
+                    _board_of(post, board),
+                    num,
+                    _int(post.get("subnum"), 0),
+                    _int(post.get("thread_num")),
+                    _int(post.get("timestamp")),
+                    post.get("name"),
+                    post.get("title"),
+                    post.get("comment"),
+                    json.dumps(post, default=_json_default),
+                    now,
+                )
+            )
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO posts (archive, board, num, subnum, thread_num,
+                    timestamp, name, title, comment, data, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (archive, board, num, subnum) DO UPDATE SET
+                    thread_num = excluded.thread_num,
+                    timestamp = excluded.timestamp,
+                    name = excluded.name,
+                    title = excluded.title,
+                    comment = excluded.comment,
+                    data = excluded.data,
+                    updated = excluded.updated
+                """,
+                rows,
+            )
+        return len(rows)
+
+    async def add_posts(self, archive_url, board, posts):
+        """Insert or update posts from a search, thread or post response"""
+        if not self.available or not posts:
+            return 0
+        try:
+            return await self._call(self._add_posts, archive_url, board, list(posts))
+        except Exception as e:
+            logger.error(f"Error storing posts: {e}")
+            return 0
+
+    def queue_posts(self, archive_url, board, posts):
+        """
+        ``add_posts`` without waiting for the write. Store calls run in
+        order on one thread, so later reads still see the posts.
+        """
+        if not self.available or not posts:
+            return
+        future = self._get_executor().submit(
+            self._add_posts, archive_url, board, list(posts)
+        )
+        future.add_done_callback(_log_write_error)
+
+    def _record_search(self, archive_url, board, query, limit, posts):
+        archive = SessionRegistry.host_of(archive_url)
+        board, query = query_key(board, query)
+        limit = _int(limit)
+        complete = limit is None or len(posts) < limit
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO coverage (archive, board, query, search_limit,
+                    complete, fetched)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (archive, board, query) DO UPDATE SET
+                    search_limit = excluded.search_limit,
+                    complete = excluded.complete,
+                    fetched = excluded.fetched
+                """,
+                (archive, board, query, limit, int(complete), time.time()),
+            )
+            coverage_id = self.conn.execute(
+                "SELECT id FROM coverage WHERE archive = ? AND board = ? AND query = ?",
+                (archive, board, query),
+            ).fetchone()[0]
+            self.conn.execute(
+                "DELETE FROM coverage_posts WHERE coverage_id = ?", (coverage_id,)
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO coverage_posts (coverage_id, position, post_id)
+                SELECT ?, ?, id FROM posts
+                WHERE archive = ? AND board = ? AND num = ? AND subnum = ?
+                """,
+                [
+                    (
+                        coverage_id,
+                        position,
+                        archive,
+                        _board_of(_as_dict(post), board),
+                        _int(_as_dict(post).get("num")),
+                        _int(_as_dict(post).get("subnum"), 0),
+                    )
+                    for position, post in enumerate(posts)
+                ],
+            )
+
+    async def record_search(self, archive_url, board, query, limit, posts):
+        """Remember which posts an upstream search returned"""
+        if not self.available:
+            return
+        try:
+            await self._call(
+                self._record_search, archive_url, board, query, limit, list(posts)
+            )
+        except Exception as e:
+            logger.error(f"Error recording search coverage: {e}")
+
+    def _covered(self, archive_url, board, query, limit, max_age):
+        archive = SessionRegistry.host_of(archive_url)
+        board, query = query_key(board, query)
+        limit = _int(limit)
+        row = self.conn.execute(
+            """
+            SELECT id, search_limit, complete, fetched FROM coverage
+            WHERE archive = ? AND board = ? AND query = ?
+            """,
+            (archive, board, query),
+        ).fetchone()
+        if row is None or time.time() - row["fetched"] > max_age:
+            return None
+        covers = row["complete"] or (
+            limit is not None
+            and row["search_limit"] is not None
+            and row["search_limit"] >= limit
+        )
+        if not covers:
+            return None
+        rows = self.conn.execute(
+            """
+            SELECT posts.data FROM coverage_posts
+            JOIN posts ON posts.id = coverage_posts.post_id
+            WHERE coverage_posts.coverage_id = ?
+            ORDER BY coverage_posts.position
+            LIMIT ?
+            """,
+            (row["id"], -1 if limit is None else limit),
+        ).fetchall()
+        return [json.loads(r["data"]) for r in rows]
+
+    async def covered(self, archive_url, board, query, limit, max_age=COVERAGE_MAX_AGE):
+        """
+        The posts of an earlier upstream search that answers this one, or
+        None when it has to go upstream (never run, too old, or run with a
+        smaller limit that did not exhaust the results).
+        """
+        if not self.available:
+            return None
+        try:
+            return await self._call(
+                self._covered, archive_url, board, query, limit, max_age
+            )
+        except Exception as e:
+            logger.error(f"Error reading search coverage: {e}")
+            return None
+
+    def _thread_key(self, archive_url, board, thread_num):
+        return (
+            SessionRegistry.host_of(archive_url),
+            str(board or "_").strip("/").lower(),
+            int(thread_num),
+        )
+
+    def _load_thread(self, archive_url, board, thread_num):
+        key = self._thread_key(archive_url, board, thread_num)
+        row = self.conn.execute(
+            """
+            SELECT latest_doc_id FROM threads
+            WHERE archive = ? AND board = ? AND thread_num = ?
+            """,
+            key,
+        ).fetchone()
+        if row is None:
+            return None, []
+        rows = self.conn.execute(
+            """
+            SELECT data FROM posts
+            WHERE archive = ? AND board = ? AND thread_num = ?
+            ORDER BY num, subnum
+            """,
+            key,
+        ).fetchall()
+        return row["latest_doc_id"], [json.loads(r["data"]) for r in rows]
+
+    async def load_thread(self, archive_url, board, thread_num):
+        """``(latest_doc_id, posts)`` of a synced thread, or ``(None, [])``"""
+        if not self.available:
+            return None, []
+        try:
+            return await self._call(self._load_thread, archive_url, board, thread_num)
+        except Exception as e:
+            logger.error(f"Error loading thread {thread_num}: {e}")
+            return None, []
+
+    def _save_thread(self, archive_url, board, thread_num, latest_doc_id):
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO threads (archive, board, thread_num, latest_doc_id,
+                    updated)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (archive, board, thread_num) DO UPDATE SET
+                    latest_doc_id = excluded.latest_doc_id,
+                    updated = excluded.updated
+                """,
+                (
+                    *self._thread_key(archive_url, board, thread_num),
+                    latest_doc_id,
+                    time.time(),
+                ),
+            )
+
+    async def save_thread(self, archive_url, board, thread_num, latest_doc_id):
+        """Remember the highest doc_id synced for a thread"""
+        if not self.available:
+            return
+        try:
+            await self._call(
+                self._save_thread, archive_url, board, thread_num, latest_doc_id
+            )
+        except Exception as e:
+            logger.error(f"Error saving thread {thread_num}: {e}")
+
+    def _search(self, text, archive_url=None, board=None, limit=50):
+        sql = """
+            SELECT posts.archive, posts.data FROM posts_fts
+            JOIN posts ON posts.id = posts_fts.rowid
+            WHERE posts_fts MATCH ?
+        """
+        params = [text]
+        if archive_url:
+            sql += " AND posts.archive = ?"
+            params.append(SessionRegistry.host_of(archive_url))
+        if board and board != "_":
+            sql += " AND posts.board = ?"
+            params.append(str(board).strip("/").lower())
+        sql += " ORDER BY posts_fts.rank LIMIT ?"
+        params.append(-1 if not limit else int(limit))
+        return [
+            {**json.loads(row["data"]), "source": row["archive"]}
+            for row in self.conn.execute(sql, params)
+        ]
+
+    async def search(self, text, archive_url=None, board=None, limit=50):
+        """
+        Full-text search (FTS5 query syntax) over every stored post, best
+        matches first. Posts carry a ``source`` key with the archive host.
+        """
+        return await self._call(self._search, text, archive_url, board, limit)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# Process-wide store fed by async_api
+store = PostStore()
@@ -1,20 +1,25 @@
 import os
 import re
 import logging
-from datetime import datetime
-import matplotlib.pyplot as plt
+from datetime import date, datetime
 import os
 import sys
 import json
 import platform
 from pathlib import Path
 
+from .logwriter import writer
+from .matcher import compile_query
+from .moesearch import Model
+
 
 class Utilities:
     def __init__(self):
         self.log_dir = self.get_log_directory()
         os.makedirs(self.log_dir, exist_ok=True)
         self.print = print
+        self._day = None
+        self._log_dirs = set()
 
     def get_log_directory(self):
         """Get platform-specific log directory."""
@@ -88,9 +93,8 @@ class Utilities:
         # Prepare the log entry
         log_entry = self.format_log_entry(message, level, include_date)
 
-        # Write to the log file
-        with open(log_file, mode=mode, encoding=encoding) as f:
-            f.write(log_entry + "\n")
+        # Queue for the background writer
+        writer.write(log_file, log_entry + "\n", mode=mode, encoding=encoding)
 
         if isJson:
             self.json(
@@ -129,10 +133,10 @@ class Utilities:
             "level": level,
             "timestamp": datetime.now().isoformat() if include_date else None,
         }
-        # Write to the log file as JSON
-        with open(log_file, mode=mode, encoding=encoding) as f:
-            json.dump(log_data, f)
-            f.write("\n")  # Ensure each log entry is on a new line
+        # Serialize now (data may change later), write in the background
+        writer.write(
+            log_file, json.dumps(log_data) + "\n", mode=mode, encoding=encoding
+        )
 
     def format_log_entry(self, message, level="INFO", include_date=True):
         # Get the current timestamp if include_date is True
@@ -150,11 +154,21 @@ class Utilities:
             filename = filename.replace(char, "_")
         return filename.strip()
 
+    def _log_day(self):
+        """Date parts of log paths, computed once per day"""
+        today = date.today()
+        if self._day is None or self._day[0] != today:
+            self._day = (
+                today,
+                today.strftime("%Y"),
+                today.strftime("%m"),
+                today.strftime("%d"),
+                today.strftime("%Y-%d-%m"),
+            )
+        return self._day
+
     def get_log_file(self, site, board="", query="", folderName="", fileType=""):
-        today = datetime.now()
-        year = today.strftime("%Y")
-        month = today.strftime("%m")
-        day = today.strftime("%d")
+        _, year, month, day, formatted_string = self._log_day()
         jsonF = "json/" in query
         if jsonF:
             query = query.replace("json/", "")
@@ -167,7 +181,9 @@ class Utilities:
         log_file_path = os.path.join(*path)
 
         # Create directories if they do not exist
-        os.makedirs(log_file_path, exist_ok=True)
+        if log_file_path not in self._log_dirs:
+            os.makedirs(log_file_path, exist_ok=True)
+            self._log_dirs.add(log_file_path)
         # Create the log file with the specified naming convention
         params = []
         if site:
@@ -179,10 +195,6 @@ class Utilities:
 
         # Join the parameters with hyphens
         params_str = "-".join(params)
-        # Get the current date and time
-        now = datetime.now()
-        # Format the string
-        formatted_string = now.strftime("%Y-%d-%m")
         # Create the full log file name
         if fileType == "":
             fileType = "json" if jsonF else "log"
@@ -235,61 +247,29 @@ class Utilities:
             print(f"Row index '{row_index}' is out of bounds.")
             return None
 
-    def parse_search_terms(self, search_terms):
-        terms = search_terms.split()
-        regex_parts = []
-
-        for term in terms:
-            if term.startswith("-"):  # Negation
-                negated_term = re.escape(term[1:])
-                regex_parts.append(f"(?!.*{negated_term})")  # Exclude this term
-            elif "&" in term:  # AND operator
-                and_terms = term.split("&")
-                and_part = "".join(f"(?=.*{re.escape(t.strip())})" for t in and_terms)
-                regex_parts.append(f"({and_part})")
-            elif "|" in term:  # OR operator
-                or_terms = term.split("|")
-                or_part = "|".join(f".*{re.escape(t.strip())}.*" for t in or_terms)
-                regex_parts.append(f"({or_part})")
-            elif '"' in term:  # Exact phrase
-                phrase = term.strip('"')
-                regex_parts.append(
-                    f".*\\b{re.escape(phrase)}\\b.*"
-                )  # Use word boundaries for exact match
-            else:  # Regular term or wildcard
-                if "*" in term or "?" in term:
-                    term = re.escape(term).replace(r"\*", ".*").replace(r"\?", ".")
-                regex_parts.append(f".*{term}.*")  # Match any part of the string
-
-        combined_regex = "".join(regex_parts)
-        return combined_regex
+    def parse_search_terms(self, search_terms, case_sensitive=False):
+        """
+        Compile ``search_terms`` as a query (see ``matcher.compile_query``).
+
+        This used to return a regex string; the compiled query has
+        ``match(text)`` and ``filter(texts)`` instead.
+        """
+        return compile_query(search_terms, case_sensitive)
 
     def is_regex(self, term):
         regex_metacharacters = r"[\.\*\?\(\)[]\\\+\^\$\{\}]"
         return bool(re.search(regex_metacharacters, term))
 
     def regex_search(self, array, search_terms, case_sensitive=False):
-        is_regex = self.is_regex(search_terms)
-        if is_regex:
-            pattern = search_terms  # Use as-is if it's regex
-        else:
-            pattern = self.parse_search_terms(search_terms)
-
-        regex_flags = 0 if case_sensitive else re.IGNORECASE
-        regex = re.compile(pattern, regex_flags)
-        found_items = [item for item in array if regex.search(item)]
-
-        if any(term.startswith("-") for term in search_terms.split()):
-            for term in search_terms.split():
-                if term.startswith("-"):
-                    negated_term = re.escape(term[1:])
-                    found_items = [
-                        item
-                        for item in found_items
-                        if not re.search(negated_term, item)
-                    ]
-
-        return found_items
+        """
+        Items of ``array`` matching ``search_terms``: a regex if it looks like
+        one, else a query (AND/OR/NOT, phrases, wildcards; see matcher).
+        """
+        if self.is_regex(search_terms):
+            regex_flags = 0 if case_sensitive else re.IGNORECASE
+            regex = re.compile(search_terms, regex_flags)  # Use as-is if it's regex
+            return [item for item in array if regex.search(item)]
+        return compile_query(search_terms, case_sensitive).filter(array)
 
     def plot_statistics(self, post_dates):
         if not post_dates:
@@ -298,13 +278,19 @@ class Utilities:
 
         # Count posts per day
         date_counts = {}
-        for date in post_dates:
-            date_str = date.date().isoformat()
+        for post_date in post_dates:
+            if post_date is None or post_date != post_date:
+                # No timestamp (None or NaT)
+                continue
+            date_str = post_date.date().isoformat()
             if date_str in date_counts:
                 date_counts[date_str] += 1
             else:
                 date_counts[date_str] = 1
 
+        # matplotlib takes longer to import than the rest of the package
+        import matplotlib.pyplot as plt
+
         # Prepare data for plotting
         dates = list(date_counts.keys())
         counts = list(date_counts.values())
@@ -320,6 +306,9 @@ class Utilities:
 
     def serialize_object(self, obj):
         """Recursively convert an object to a JSON-serializable dictionary."""
+        if isinstance(obj, Model):
+            # Post/Thread models convert themselves without walking vars()
+            return obj.to_dict()
         if isinstance(obj, dict):
             return {k: self.serialize_object(v) for k, v in obj.items()}
         elif isinstance(obj, list):
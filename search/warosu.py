@@ -0,0 +1,217 @@
+"""
+Warosu (Fuuka) search page parsing
+
+Warosu serves HTML, not the FoolFuuka JSON API. Pages are parsed with the
+fastest backend installed (selectolax, then lxml, then BeautifulSoup's
+html.parser); every backend extracts the same fields the same way, and
+parsing stops as soon as ``limit`` posts are read. The functions here are
+plain CPU-bound code meant to run in an executor, off the event loop.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from importlib.util import find_spec
+
+logger = logging.getLogger(__name__)
+
+
+def post_data(board, num, comment, timestamp, media):
+    """A parsed Warosu post as a FoolFuuka post dict"""
+    return {
+        "num": num,
+        "timestamp": str(timestamp),
+        "comment": comment,
+        "media": media,
+        "board": {
+            "name": board,
+            "shortname": board,  # Changed from short_name to shortname
+        },
+        "thread_num": num,  # For OPs this is the same as post_num
+        "poster_country": "",
+        "poster_country_name": "",
+        "poster_hash": "",
+        "name": "Anonymous",
+        "title": "",
+        "trip": "",
+        "subnum": "0",
+        "op": 0,
+        "email": "",
+        "sticky": 0,
+        "locked": 0,
+        "deleted": 0,
+    }
+
+
+def _media(href, src, alt):
+    return {
+        "media_link": href,
+        "media_orig": src,
+        "media_filename": alt or "",
+        "media_w": None,
+        "media_h": None,
+        "media_size": None,
+        "media_hash": None,
+        "media_status": "normal",
+    }
+
+
+# Each backend is (select, extract): ``select(html)`` gives the post nodes
+# (``.reply, .post-wrapper``), ``extract(node)`` gives ``(num, comment,
+# timestamp, media)`` or None for nodes without a post link.
+
+
+def _bs4_select(html):
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, "html.parser").select(".reply, .post-wrapper")
+
+
+def _bs4_extract(node):
+    post_link = node.select_one("a.js")
+    if not post_link:
+        return None
+    num = post_link.text.replace("No.", "")
+    comment_elem = node.select_one("blockquote")
+    comment = comment_elem.get_text(strip=True) if comment_elem else ""
+    time_elem = node.select_one(".posttime")
+    timestamp = (
+        int(time_elem["title"]) if time_elem and "title" in time_elem.attrs else 0
+    )
+    media = None
+    img_elem = node.select_one(".thumb")
+    if img_elem and img_elem.parent.name == "a":
+        media = _media(img_elem.parent["href"], img_elem["src"], img_elem.get("alt"))
+    return num, comment, timestamp, media
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_LXML_POSTS = f"//*[{_has_class('reply')} or {_has_class('post-wrapper')}]"
+_LXML_LINK = f"(.//a[{_has_class('js')}])[1]"
+_LXML_TIME = f"(.//*[{_has_class('posttime')}])[1]"
+_LXML_THUMB = f"(.//*[{_has_class('thumb')}])[1]"
+
+
+@lru_cache(maxsize=None)
+def _lxml_xpath(path):
+    from lxml import etree
+
+    return etree.XPath(path)
+
+
+def _lxml_select(html):
+    from lxml import html as lxml_html
+
+    return _lxml_xpath(_LXML_POSTS)(lxml_html.fromstring(html))
+
+
+def _lxml_first(node, path):
+    found = _lxml_xpath(path)(node)
+    return found[0] if found else None
+
+
+def _lxml_extract(node):
+    post_link = _lxml_first(node, _LXML_LINK)
+    if post_link is None:
+        return None
+    num = post_link.text_content().replace("No.", "")
+    comment_elem = _lxml_first(node, "(.//blockquote)[1]")
+    comment = (
+        "".join(text.strip() for text in comment_elem.itertext())
+        if comment_elem is not None
+        else ""
+    )
+    time_elem = _lxml_first(node, _LXML_TIME)
+    title = time_elem.get("title") if time_elem is not None else None
+    timestamp = int(title) if title is not None else 0
+    media = None
+    img_elem = _lxml_first(node, _LXML_THUMB)
+    if img_elem is not None:
+        parent = img_elem.getparent()
+        if parent is not None and parent.tag == "a":
+            media = _media(
+                parent.attrib["href"], img_elem.attrib["src"], img_elem.get("alt")
+            )
+    return num, comment, timestamp, media
+
+
+def _selectolax_select(html):
+    from selectolax.parser import HTMLParser
+
+    return HTMLParser(html).css(".reply, .post-wrapper")
+
+
+def _selectolax_extract(node):
+    post_link = node.css_first("a.js")
+    if post_link is None:
+        return None
+    num = post_link.text().replace("No.", "")
+    comment_elem = node.css_first("blockquote")
+    comment = (
+        comment_elem.text(separator="", strip=True) if comment_elem is not None else ""
+    )
+    time_elem = node.css_first(".posttime")
+    title = time_elem.attributes.get("title") if time_elem is not None else None
+    timestamp = int(title) if title is not None else 0
+    media = None
+    img_elem = node.css_first(".thumb")
+    if img_elem is not None:
+        parent = img_elem.parent
+        if parent is not None and parent.tag == "a":
+            attributes = img_elem.attributes
+            media = _media(
+                parent.attributes["href"], attributes["src"], attributes.get("alt")
+            )
+    return num, comment, timestamp, media
+
+
+# name: (module, select, extract), fastest first
+BACKENDS = {
+    "selectolax": ("selectolax", _selectolax_select, _selectolax_extract),
+    "lxml": ("lxml", _lxml_select, _lxml_extract),
+    "bs4": ("bs4", _bs4_select, _bs4_extract),
+}
+
+
+@lru_cache(maxsize=None)
+def available_parsers():
+    return tuple(name for name, (module, _, _) in BACKENDS.items() if find_spec(module))
+
+
+def default_parser():
+    """``FORARCHIVES_HTML_PARSER`` if set and installed, else the fastest one"""
+    available = available_parsers()
+    if not available:
+        raise ImportError("No HTML parser available. Please install lxml or bs4.")
+    configured = os.getenv("FORARCHIVES_HTML_PARSER")
+    if configured in available:
+        return configured
+    if configured:
+        logger.warning(f"HTML parser {configured} not available, using {available[0]}")
+    return available[0]
+
+
+def parse_search_page(html, board, limit=None, parser=None):
+    """
+    The posts of a Warosu search results page as FoolFuuka post dicts, at
+    most ``limit`` of them. ``parser`` picks a backend by name.
+    """
+    _, select, extract = BACKENDS[parser or default_parser()]
+    limit = int(limit) if limit else None
+    posts = []
+    for node in select(html):
+        try:
+            fields = extract(node)
+        except Exception as e:
+            logger.error(f"Error parsing Warosu post: {e}")
+            continue
+        if fields is None:
+            continue
+        posts.append(post_data(board, *fields))
+        # Respect limit if specified
+        if limit and len(posts) >= limit:
+            break
+    return posts
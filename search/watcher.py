@@ -0,0 +1,188 @@
+"""
+Incremental thread sync: only posts newer than the last seen doc_id are
+fetched (FoolFuuka ``latest_doc_id``) and merged into the known thread
+"""
+
+import asyncio
+import logging
+import time
+
+from .async_api import thread
+from .exceptions import ArchiveException
+from .store import store, thread_posts
+
+logger = logging.getLogger(__name__)
+
+# Poll interval bounds in seconds; quiet threads back off towards the max
+MIN_INTERVAL = 30
+MAX_INTERVAL = 600
+
+
+def _post_key(post):
+    return int(post.get("num") or 0), int(post.get("subnum") or 0)
+
+
+def _doc_id(post):
+    try:
+        return int(post.get("doc_id"))
+    except (TypeError, ValueError):
+        return -1
+
+
+class WatchedThread:
+    """A thread's merged posts and the highest doc_id fetched so far."""
+
+    __slots__ = (
+        "archive_url",
+        "board",
+        "thread_num",
+        "latest_doc_id",
+        "posts",
+        "interval",
+        "next_poll",
+    )
+
+    def __init__(self, archive_url, board, thread_num, interval=MIN_INTERVAL):
+        self.archive_url = archive_url
+        self.board = board
+        self.thread_num = thread_num
+        self.latest_doc_id = None
+        self.posts = {}
+        self.interval = interval
+        self.next_poll = 0.0
+
+    def merge(self, posts, advance=True):
+        """
+        Merge posts; return the ones not seen before. Only posts fetched
+        from the thread itself ``advance`` the doc_id cursor: stored posts
+        may have been harvested by searches, past gaps the sync never saw.
+        """
+        new_posts = []
+        for post in posts:
+            key = _post_key(post)
+            if key not in self.posts:
+                new_posts.append(post)
+            self.posts[key] = post
+            doc_id = _doc_id(post)
+            if advance and doc_id > (self.latest_doc_id or -1):
+                self.latest_doc_id = doc_id
+        return new_posts
+
+    def ordered_posts(self):
+        return [self.posts[key] for key in sorted(self.posts)]
+
+
+class ThreadWatcher:
+    """
+    Keeps threads in sync with their archive.
+
+    The first sync of a thread loads what the post store already has and
+    fetches the full thread only if it was never synced; later syncs pass
+    ``latest_doc_id`` so the archive returns just the new posts. ``run``
+    polls every watched thread on its own interval, doubling the interval
+    of threads with no new posts up to ``max_interval``.
+    """
+
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threads = {}
+
+    @staticmethod
+    def key(archive_url, board, thread_num):
+        return archive_url, str(board or "_").strip("/").lower(), str(thread_num)
+
+    def watch(self, archive_url, board, thread_num):
+        key = self.key(archive_url, board, thread_num)
+        if key not in self.threads:
+            self.threads[key] = WatchedThread(
+                archive_url, key[1], key[2], self.min_interval
+            )
+        return self.threads[key]
+
+    def unwatch(self, archive_url, board, thread_num):
+        self.threads.pop(self.key(archive_url, board, thread_num), None)
+
+    async def _fetch(self, watched, latest_doc_id=-1):
+        """The thread's posts after ``latest_doc_id``, or None on failure"""
+        try:
+            res = await thread(
+                watched.archive_url,
+                watched.board,
+                watched.thread_num,
+                latest_doc_id=latest_doc_id,
+            )
+        except ArchiveException as error:
+            # A delta request for a thread without new posts comes back as
+            # an error too; only a full fetch failing is a real error
+            if latest_doc_id == -1:
+                raise LookupError(f"Thread {watched.thread_num}: {error}")
+            return []
+        if res is None:
+            return None
+        return list(thread_posts(res))
+
+    async def sync(self, archive_url, board, thread_num):
+        """Bring a thread up to date; return ``(watched_thread, new_posts)``"""
+        watched = self.watch(archive_url, board, thread_num)
+
+        if watched.latest_doc_id is None:
+            latest_doc_id, posts = await store.load_thread(
+                archive_url, watched.board, watched.thread_num
+            )
+            if latest_doc_id is not None:
+                # Resume from the last sync, not from the newest stored post
+                watched.merge(posts, advance=False)
+                watched.latest_doc_id = latest_doc_id
+
+        if watched.latest_doc_id is None:
+            posts = await self._fetch(watched)
+        else:
+            posts = await self._fetch(watched, watched.latest_doc_id)
+        if posts is None:
+            return watched, []
+
+        new_posts = watched.merge(posts)
+        if watched.latest_doc_id is not None and posts:
+            await store.save_thread(
+                archive_url, watched.board, watched.thread_num, watched.latest_doc_id
+            )
+        return watched, new_posts
+
+    async def poll(self, on_update=None):
+        """Sync every watched thread that is due; return the number of new posts"""
+        now = time.monotonic()
+        due = [w for w in self.threads.values() if w.next_poll <= now]
+        results = await asyncio.gather(
+            *(self.sync(w.archive_url, w.board, w.thread_num) for w in due),
+            return_exceptions=True,
+        )
+
+        count = 0
+        for watched, result in zip(due, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error syncing thread {watched.thread_num}: {result}")
+                new_posts = []
+            else:
+                new_posts = result[1]
+
+            if new_posts:
+                watched.interval = self.min_interval
+                count += len(new_posts)
+                if on_update is not None:
+                    on_update(watched, new_posts)
+            else:
+                watched.interval = min(self.max_interval, watched.interval * 2)
+            watched.next_poll = time.monotonic() + watched.interval
+        return count
+
+    async def run(self, on_update=None, rounds=None):
+        """Poll until cancelled, or for ``rounds`` rounds"""
+        done = 0
+        while rounds is None or done < rounds:
+            await self.poll(on_update)
+            done += 1
+            if not self.threads or (rounds is not None and done >= rounds):
+                break
+            next_poll = min(w.next_poll for w in self.threads.values())
+            await asyncio.sleep(max(0, next_poll - time.monotonic()))
@@ -0,0 +1,137 @@
+"""
+Worker pool for CPU-heavy post processing
+
+HTML parsing, query matching, DataFrame building and JSON encoding of large
+result sets are submitted here instead of running on the event loop that
+also serves requests. ``FORARCHIVES_WORKERS`` picks the pool:
+
+- ``thread`` (default): no pickling, but the work shares the GIL with the
+  loop
+- ``process``: worker processes, so the loop never waits on the GIL, at
+  the cost of pickling every batch both ways; worth it for DataFrame
+  building and matching over large result sets. Callers submit
+  module-level functions and plain data (texts, HTML, post dicts), never
+  searchers
+- ``inline``: everything runs in the caller, for debugging
+
+``FORARCHIVES_WORKER_COUNT`` sets the pool size. Batches of fewer than
+``INLINE_ITEMS`` items run inline, where a round trip to a worker would
+cost more than the work itself. JSON encoding goes through
+``run_in_thread``, never to a process: pickling a payload costs about as
+much as encoding it.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+MODES = ("process", "thread", "inline")
+# Batches smaller than this run in the caller
+INLINE_ITEMS = 256
+# Default pool size cap
+MAX_WORKERS = 4
+
+
+def _start_method():
+    # Forking a process that runs an event loop and writer threads is unsafe
+    methods = multiprocessing.get_all_start_methods()
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class WorkerPool:
+    """
+    Runs functions in a process or thread pool, started on first use.
+
+    ``run(fn, *args, items=n)`` awaits ``fn(*args)``: inline when ``items``
+    is under the threshold, else in the pool; ``run_in_thread`` does the
+    same in a thread even in process mode. A process pool that cannot
+    start or whose worker died is replaced by threads (the batch that hit
+    it runs inline), so no batch is lost to the pool itself.
+    """
+
+    def __init__(self, mode=None, workers=None, inline_items=INLINE_ITEMS):
+        mode = mode or os.getenv("FORARCHIVES_WORKERS", "thread")
+        if mode not in MODES:
+            raise ValueError(f"Unknown worker mode {mode!r}, expected {MODES}")
+        workers = workers or int(os.getenv("FORARCHIVES_WORKER_COUNT", "0"))
+        self.mode = mode
+        self.workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+        self.inline_items = inline_items
+        self._executor = None
+        self._threads = None
+
+    def __repr__(self):
+        return f"WorkerPool({self.mode}, {self.workers} workers)"
+
+    def _get_executor(self):
+        if self._executor is None and self.mode == "process":
+            try:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context(_start_method()),
+                )
+            except (OSError, ValueError, NotImplementedError) as e:
+                logger.warning(f"Process pool unavailable ({e}), using threads")
+                self.mode = "thread"
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                self.workers, thread_name_prefix="post-worker"
+            )
+        return self._executor
+
+    def _get_threads(self):
+        if self.mode != "process":
+            return self._get_executor()
+        if self._threads is None:
+            self._threads = concurrent.futures.ThreadPoolExecutor(
+                self.workers, thread_name_prefix="post-worker"
+            )
+        return self._threads
+
+    def runs_inline(self, items=None):
+        """Whether a batch of ``items`` would run in the caller"""
+        return self.mode == "inline" or (
+            items is not None and items < self.inline_items
+        )
+
+    async def run(self, fn, *args, items=None):
+        """
+        ``fn(*args)`` off the event loop, or inline for batches under the
+        threshold; ``items=None`` always uses the pool.
+        """
+        if self.runs_inline(items):
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool as e:
+            # A worker died (OOM, or workers can't import __main__): restarting
+            # could break again on every batch, so keep to threads from now on
+            logger.error(f"Worker pool broke ({e}), switching to threads")
+            self.shutdown(wait=False)
+            self.mode = "thread"
+            return fn(*args)
+
+    async def run_in_thread(self, fn, *args, items=None):
+        """``run``, but in a thread rather than a worker process"""
+        if self.runs_inline(items):
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_threads(), fn, *args)
+
+    def shutdown(self, wait=True):
+        executors = self._executor, self._threads
+        self._executor = self._threads = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+
+
+pool = WorkerPool()
+atexit.register(pool.shutdown)
@@ -0,0 +1,310 @@
+"""
+Load test /api/search/ with concurrent, distinct searches
+
+    python manage.py loadtest --requests 50 --concurrency 50
+    python manage.py loadtest --url http://127.0.0.1:8000/api/search/
+
+Without --url the ASGI application is called in-process, the way an ASGI
+server (uvicorn...) calls it. It searches simulated archives: local HTTP
+servers speaking the FoolFuuka search API that answer after --latency
+seconds. Only the archives are simulated, so the searches go through the
+real archive client: the scheduler, the shared sessions, post parsing and
+the worker pool. Each simulated archive takes at most LIMIT_PER_HOST
+requests at a time (the session's connection limit), so 50 searches of
+one archive should take about ceil(50 / 8) latencies, not 50 of them.
+"""
+
+import asyncio
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def asgi_post(app, path, body):
+    """POST ``body`` to an ASGI app; return ``(status, response body)``"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = None
+    chunks = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # The client stays connected until the response is sent
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+class SimulatedArchive:
+    """
+    A local FoolFuuka search API that answers every search with ``posts``
+    posts after ``latency`` seconds
+    """
+
+    def __init__(self, latency, posts=20):
+        self.latency = latency
+        self.posts = posts
+        self.searches = 0
+        self.url = None
+        self._runner = None
+
+    async def search(self, request):
+        from aiohttp import web
+
+        self.searches += 1
+        await asyncio.sleep(self.latency)
+        board = request.query.get("boards", "_")
+        text = request.query.get("text", "")
+        now = int(time.time())
+        posts = [
+            {
+                "num": num,
+                "subnum": 0,
+                "thread_num": num,
+                "timestamp": now,
+                "comment": f"{text} {num}",
+                "board": {"shortname": board},
+            }
+            for num in range(1, self.posts + 1)
+        ]
+        return web.json_response({"0": {"posts": posts}})
+
+    async def start(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/_/api/chan/search", self.search)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class HttpClient:
+    """POSTs request bodies to a running server"""
+
+    def __init__(self, url):
+        self.url = url
+        self.session = None
+
+    async def __call__(self, body):
+        import aiohttp
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=300)
+            )
+        async with self.session.post(
+            self.url, data=body, headers={"Content-Type": "application/json"}
+        ) as response:
+            return response.status, await response.read()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class Command(BaseCommand):
+    help = "Fire concurrent searches at /api/search/ and report latency and throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Searches to send")
+        parser.add_argument(
+            "--concurrency", type=int, default=50, help="Searches in flight at once"
+        )
+        parser.add_argument(
+            "--url",
+            help="Search endpoint of a running server (default: in-process ASGI)",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=1.0,
+            help="Simulated archive latency in seconds (in-process only)",
+        )
+        parser.add_argument(
+            "--archives",
+            default="[0]",
+            help="JSON array of archive indices; in-process, one simulated "
+            "archive is started per entry",
+        )
+        parser.add_argument("--board", default="_", help="Board to search in")
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            default=None,
+            help="Fail if the run takes longer than this",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            archives = json.loads(options["archives"])
+        except ValueError as e:
+            raise CommandError(f"--archives: {e}")
+        if not isinstance(archives, list) or not archives:
+            raise CommandError("--archives: expected a non-empty JSON array")
+
+        if options["url"]:
+            elapsed, rows = asyncio.run(self.run_remote(archives, options))
+        else:
+            elapsed, rows = asyncio.run(self.run_in_process(len(archives), options))
+
+        self.report(elapsed, rows, options)
+        if options["max_seconds"] is not None and elapsed > options["max_seconds"]:
+            raise CommandError(
+                f"Took {elapsed:.2f}s, more than {options['max_seconds']}s"
+            )
+
+    @staticmethod
+    def bodies(archives, options):
+        # A fresh prefix per run, so earlier runs' cache entries don't answer
+        run_id = uuid.uuid4().hex[:8]
+        return [
+            json.dumps(
+                {
+                    "query": f"loadtest {run_id} {i}",
+                    "archives": archives,
+                    "board": options["board"],
+                    "limit": 20,
+                }
+            ).encode()
+            for i in range(options["requests"])
+        ]
+
+    async def run_remote(self, archives, options):
+        post = HttpClient(options["url"])
+        try:
+            return await self.run(
+                post, self.bodies(archives, options), options["concurrency"]
+            )
+        finally:
+            await post.close()
+
+    async def run_in_process(self, archive_count, options):
+        from archiveserver.asgi import application
+        from search.async_api import close as close_sessions
+        from search.scheduler import scheduler
+        from search.sessions import LIMIT_PER_HOST
+        from search.store import store
+
+        async def post(body):
+            return await asgi_post(application, "/api/search/", body)
+
+        self.simulated = [
+            SimulatedArchive(options["latency"]) for _ in range(archive_count)
+        ]
+        with tempfile.TemporaryDirectory() as store_dir:
+            # Posts from the simulated archives must not land in the real store
+            store.configure(path=os.path.join(store_dir, "posts.db"))
+            try:
+                urls = [await archive.start() for archive in self.simulated]
+                for url in urls:
+                    # No rate limit: the run measures the server, while the
+                    # in-flight cap stays the connection limit of a session
+                    scheduler.configure(
+                        url,
+                        rate=float(options["requests"]),
+                        burst=options["requests"],
+                        max_concurrency=LIMIT_PER_HOST,
+                        concurrency=LIMIT_PER_HOST,
+                    )
+                return await self.run(
+                    post, self.bodies(urls, options), options["concurrency"]
+                )
+            finally:
+                await close_sessions()
+                for archive in self.simulated:
+                    await archive.close()
+                store.configure()
+
+    async def run(self, post, bodies, concurrency):
+        """Send ``bodies`` with ``concurrency`` in flight; return (seconds, rows)"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(body):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    status, content = await post(body)
+                    payload = json.loads(content)
+                    if status == 200:
+                        error = payload.get("error")
+                    else:
+                        error = payload.get("error", status)
+                except Exception as e:
+                    error = str(e)
+                return time.perf_counter() - start, error
+
+        start = time.perf_counter()
+        rows = await asyncio.gather(*(one(body) for body in bodies))
+        return time.perf_counter() - start, rows
+
+    def report(self, elapsed, rows, options):
+        from search.sessions import LIMIT_PER_HOST
+
+        latencies = sorted(latency for latency, _ in rows)
+        errors = [error for _, error in rows if error]
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        first_error = f" (first: {errors[0]})" if errors else ""
+        self.stdout.write(
+            f"requests      {len(rows)} ({options['concurrency']} concurrent)"
+        )
+        self.stdout.write(f"errors        {len(errors)}{first_error}")
+        self.stdout.write(f"wall time     {elapsed:.2f}s")
+        self.stdout.write(f"throughput    {len(rows) / elapsed:.1f} req/s")
+        self.stdout.write(
+            f"latency p50   {statistics.median(latencies):.3f}s  "
+            f"p95 {p95:.3f}s  max {latencies[-1]:.3f}s"
+        )
+        if not options["url"]:
+            rounds = math.ceil(len(rows) / min(LIMIT_PER_HOST, options["concurrency"]))
+            self.stdout.write(
+                f"upstream      {sum(a.searches for a in self.simulated)} archive searches"
+            )
+            self.stdout.write(
+                f"floor         {rounds * options['latency']:.2f}s with "
+                f"{LIMIT_PER_HOST} requests per archive at a time"
+            )
+            serial = len(rows) * options["latency"]
+            self.stdout.write(
+                f"serial        {serial:.2f}s if the searches ran one at a time"
+            )
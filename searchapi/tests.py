@@ -1,3 +1,279 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
 
-# Create your tests here.
+from aiohttp import web
+from django.test import SimpleTestCase
+
+from search.async_api import PLEBS_URL, PlebsSession
+from search.async_api import close as close_sessions
+from search.batch import PostBatch
+from search.moesearcher import MoeSearcher
+from search.query import SearchQuery
+from search.scheduler import Scheduler, scheduler
+from search.service import SearchService, process_results
+from search.store import store
+from search.watcher import ThreadWatcher
+
+
+class FakeArchive:
+    """
+    A local FoolFuuka archive: ``threads`` maps thread numbers to their
+    posts and every request's query is kept in ``requests``. It also
+    serves Warosu search pages under ``/warosu``, answering in turn with
+    the ``(status, post numbers)`` of ``warosu_pages``.
+    """
+
+    def __init__(self):
+        self.threads = {}
+        self.warosu_pages = []
+        self.requests = []
+        self.url = None
+        self._runner = None
+
+    @property
+    def warosu_url(self):
+        return f"{self.url}/warosu"
+
+    async def thread(self, request):
+        self.requests.append(dict(request.query))
+        num = int(request.query["num"])
+        latest_doc_id = int(request.query.get("latest_doc_id", -1))
+        posts = [p for p in self.threads.get(num, []) if p["doc_id"] > latest_doc_id]
+        if not posts:
+            return web.json_response({"error": "Thread not found."})
+        op = next((p for p in posts if p["num"] == num), None)
+        replies = {str(p["num"]): p for p in posts if p is not op}
+        return web.json_response({str(num): {"op": op, "posts": replies}})
+
+    async def warosu_search(self, request):
+        self.requests.append(dict(request.query))
+        status, nums = self.warosu_pages.pop(0)
+        posts = "".join(
+            f'<div class="reply"><a class="js">No.{num}</a>'
+            f'<span class="posttime" title="1700000000"></span>'
+            f"<blockquote>post {num}</blockquote></div>"
+            for num in nums
+        )
+        return web.Response(
+            text=f"<html><body>{posts}</body></html>",
+            status=status,
+            content_type="text/html",
+        )
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/_/api/chan/thread", self.thread)
+        app.router.add_get("/warosu/{board}", self.warosu_search)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await close_sessions()
+        await self._runner.cleanup()
+
+
+def make_post(thread_num, num, doc_id, comment=""):
+    return {
+        "doc_id": doc_id,
+        "num": num,
+        "subnum": 0,
+        "thread_num": thread_num,
+        "comment": comment,
+        "board": {"shortname": "a"},
+    }
+
+
+class StoreTestCase(SimpleTestCase):
+    """Runs against a post store in a temporary directory"""
+
+    def setUp(self):
+        self.store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.store_dir.cleanup)
+        self.addCleanup(store.configure, store.path, store.enabled)
+        store.configure(path=os.path.join(self.store_dir.name, "posts.db"))
+
+
+class ThreadWatcherTests(StoreTestCase):
+    async def test_resumes_from_last_sync_not_newest_stored_post(self):
+        async with FakeArchive() as archive:
+            archive.threads[100] = [make_post(100, 100 + i, i) for i in range(1, 4)]
+            await ThreadWatcher().sync(archive.url, "a", 100)
+
+            # A search harvests a post newer than the last sync
+            later = [make_post(100, 100 + i, i) for i in range(4, 7)]
+            archive.threads[100] += later
+            await store.add_posts(archive.url, "a", later[-1:])
+
+            # A fresh watcher resumes from the store
+            watched, new_posts = await ThreadWatcher().sync(archive.url, "a", 100)
+
+        self.assertEqual(archive.requests[-1]["latest_doc_id"], "3")
+        self.assertEqual([p["num"] for p in new_posts], [104, 105])
+        self.assertEqual(len(watched.posts), 6)
+        self.assertEqual(watched.latest_doc_id, 6)
+
+    async def test_unknown_thread_is_an_error(self):
+        async with FakeArchive() as archive:
+            with self.assertRaisesMessage(LookupError, "Thread not found."):
+                await ThreadWatcher().sync(archive.url, "a", 404)
+
+    async def test_thread_without_new_posts(self):
+        async with FakeArchive() as archive:
+            archive.threads[100] = [make_post(100, 100 + i, i) for i in range(1, 4)]
+            watcher = ThreadWatcher()
+            await watcher.sync(archive.url, "a", 100)
+            watched, new_posts = await watcher.sync(archive.url, "a", 100)
+
+        self.assertEqual(archive.requests[-1]["latest_doc_id"], "3")
+        self.assertEqual(new_posts, [])
+        self.assertEqual(len(watched.posts), 3)
+
+
+class WarosuSearchTests(StoreTestCase):
+    async def search(self, archive, limit=6):
+        pages = MoeSearcher().iter_archive_pages(
+            archive.warosu_url,
+            board="a",
+            text="x",
+            limit=limit,
+            page_size=2,
+            semaphore=1,
+        )
+        return [post.num async for page in pages for post in page]
+
+    async def test_complete_search_is_recorded(self):
+        async with FakeArchive() as archive:
+            archive.warosu_pages = [(200, [1, 2]), (200, [3, 4]), (200, [5])]
+            nums = await self.search(archive)
+            covered = await store.covered(archive.warosu_url, "a", {"text": "x"}, 6)
+
+        self.assertEqual(nums, ["1", "2", "3", "4", "5"])
+        self.assertEqual([post["num"] for post in covered], nums)
+
+    async def test_throttled_page_is_retried(self):
+        async with FakeArchive() as archive:
+            archive.warosu_pages = [(200, [1, 2]), (503, []), (200, [3])]
+            nums = await self.search(archive)
+
+        self.assertEqual(nums, ["1", "2", "3"])
+        self.assertEqual(len(archive.requests), 3)
+
+    async def test_call_throttle_leaves_the_archive_policy_alone(self):
+        async with FakeArchive() as archive:
+            archive.warosu_pages = [(200, [1, 2]), (200, [3])]
+            limiter = scheduler.limiter(archive.warosu_url)
+            policy = (limiter.max_concurrency, limiter.base_rate)
+            pages = MoeSearcher().iter_archive_pages(
+                archive.warosu_url,
+                board="a",
+                text="x",
+                page_size=2,
+                semaphore=1,
+                delay=0.01,
+            )
+            nums = [post.num async for page in pages for post in page]
+
+        self.assertEqual(nums, ["1", "2", "3"])
+        self.assertEqual((limiter.max_concurrency, limiter.base_rate), policy)
+
+    async def test_failed_page_is_not_recorded_as_complete(self):
+        async with FakeArchive() as archive:
+            archive.warosu_pages = [(200, [1, 2])] + [(503, [])] * 3
+            nums = await self.search(archive)
+            covered = await store.covered(archive.warosu_url, "a", {"text": "x"}, 6)
+
+        # The results stop at the failed page, which is not taken for the
+        # end of the results: nothing is replayed from the store
+        self.assertEqual(nums, ["1", "2"])
+        self.assertIsNone(covered)
+
+
+class SearchQueryTests(SimpleTestCase):
+    def test_text_is_normalized_only_in_the_cache_key(self):
+        query = SearchQuery("  Straße\tFOO ", ["desuarchive"])
+        self.assertEqual(query.search_kwargs()["text"], "  Straße\tFOO ")
+        self.assertEqual(
+            query.cache_key, SearchQuery("strasse foo", ["desuarchive"]).cache_key
+        )
+
+    def test_regex_text_keeps_its_case(self):
+        self.assertNotEqual(
+            SearchQuery("Foo", use_regex=True).cache_key,
+            SearchQuery("foo", use_regex=True).cache_key,
+        )
+
+
+class PlebsSessionTests(SimpleTestCase):
+    def test_cookies_reach_every_session(self):
+        plebs = PlebsSession()
+        plebs._cookies = [{"name": "cf_clearance", "value": "token"}]
+
+        async def session_cookies():
+            try:
+                session = await plebs.get_session()
+                return {c.key: c.value for c in session.cookie_jar}
+            finally:
+                await close_sessions()
+
+        # Each event loop gets its own session, which needs the cookies too
+        for _ in range(2):
+            self.assertEqual(asyncio.run(session_cookies()), {"cf_clearance": "token"})
+
+
+class PostBatchTests(SimpleTestCase):
+    def setUp(self):
+        posts = [make_post(100, 100 + i, i, "x") for i in range(1, 4)]
+        posts[0]["timestamp"] = 1700000000
+        posts[1]["timestamp"] = 1700000100
+        self.batch = PostBatch.from_posts(posts, "desuarchive")
+
+    def test_missing_timestamp_is_not_a_date(self):
+        dates = self.batch.dates()
+        self.assertEqual(dates.isna().tolist(), [False, False, True])
+
+    async def test_statistics_skip_missing_timestamps(self):
+        total, with_text, _, mean_date = await MoeSearcher().calculate_statistics(
+            self.batch, "x"
+        )
+        self.assertEqual((total, with_text), (2, 2))
+        self.assertEqual(str(mean_date), "2023-11-14 22:14:10")
+
+
+class SchedulerTests(SimpleTestCase):
+    def test_lowering_max_concurrency_clamps_concurrency(self):
+        scheduler = Scheduler(
+            default_policy={
+                "rate": 4.0,
+                "burst": 8,
+                "concurrency": 8,
+                "max_concurrency": 8,
+            }
+        )
+        limiter = scheduler.limiter("http://archive.test/")
+        limiter.configure(max_concurrency=2)
+        self.assertEqual(limiter.concurrency, 2)
+
+
+class SearchServiceTests(StoreTestCase):
+    async def test_refresh_is_referenced_until_done(self):
+        service = SearchService()
+        async with FakeArchive() as archive:
+            archive.warosu_pages = [(200, [1, 2])]
+            search_query = SearchQuery("x", [archive.warosu_url], "a", limit=6)
+            service.refresh(search_query)
+            (task,) = service._refreshes
+            results = await task
+
+        self.assertEqual([post["num"] for post in results], ["1", "2"])
+        self.assertEqual(service._refreshes, set())
+
+    def test_process_results_flattens_archives(self):
+        results = process_results(
+            {"desuarchive": {"board": "a", "results": [{"num": 1}]}}
+        )
+        self.assertEqual(results, [{"source": "desuarchive", "board": "a", "num": 1}])
@@ -1,16 +1,21 @@
 import tornado.ioloop
 import tornado.web
+import tornado.iostream
+from tornado.escape import json_encode
 import asyncio
-import pandas as pd
 from bs4 import BeautifulSoup
 from search.moesearcher import MoeSearcher
+from search.merge import PostMerger
+from search.async_api import close as close_sessions
+from search.query import SearchQuery
+from search.service import SearchService
+from search.workers import pool
 import json
+import functools
 import requests
 from config import ANGULAR_DIST, STATIC_PATH, TEMPLATE_PATH
 import os
 import sys
-import redis
-import hashlib
 import time
 
 
@@ -22,65 +27,24 @@ class AngularHandler(tornado.web.StaticFileHandler):
         return url_path
 
 
-class RedisCacheManager:
-    def __init__(
-        self, host="localhost", port=6379, db=0, password=None, default_ttl=3600
-    ):
-        self.redis_client = redis.Redis(
-            host=host, port=port, db=db, password=password, decode_responses=True
-        )
-        self.default_ttl = default_ttl  # Default TTL in seconds (1 hour)
-
-    def generate_cache_key(self, params):
-        """Generate a cache key based on search parameters"""
-        # Create a string representation of the parameters
-        param_str = f"{params.get('query', '')}_{params.get('archives', [])}_{params.get('board', '_')}_{params.get('useRegex', False)}_{params.get('limit', 50)}_{params.get('subjectOnly', False)}"
-        # Create a hash of the parameters to ensure consistent key format
-        return hashlib.md5(param_str.encode()).hexdigest()
-
-    def get_cached_result(self, cache_key):
-        """Get cached result by key"""
-        try:
-            cached_data = self.redis_client.get(cache_key)
-            if cached_data:
-                return json.loads(cached_data)
-            return None
-        except Exception as e:
-            print(f"Error getting cached result: {e}")
-            return None
-
-    def set_cached_result(self, cache_key, result, ttl=None):
-        """Set cached result with TTL"""
-        try:
-            ttl = ttl or self.default_ttl
-            self.redis_client.setex(
-                cache_key,
-                ttl,
-                json.dumps(
-                    result, default=str
-                ),  # Use default=str to handle datetime objects
-            )
-        except Exception as e:
-            print(f"Error setting cached result: {e}")
+# Cache and coalesced searches; replaced by one coalescing through a Redis
+# lock when several server processes share the cache (--shared-flight)
+search_service = SearchService()
 
-    def is_cache_warm(self):
-        """Check if Redis is available"""
-        try:
-            self.redis_client.ping()
-            return True
-        except Exception:
-            return False
+# Encodes stream events; anything else json can't encode is sent as a string
+dumps = functools.partial(json.dumps, default=str)
 
 
-# Initialize the cache manager
-cache_manager = RedisCacheManager()
+def parse_search_request(data):
+    """Return the canonical SearchQuery for a search request body"""
+    return SearchQuery.from_request(data)
 
 
 class SearchHandler(tornado.web.RequestHandler):
     def set_default_headers(self):
         self.set_header("Content-Type", "application/json")
         self.set_header("Access-Control-Allow-Origin", "*")
-        self.set_header("Access-Control-Allow-Headers", "Content-Type")
+        self.set_header("Access-Control-Allow-Headers", "Content-Type, Accept")
         self.set_header("Access-Control-Allow-Methods", "POST, OPTIONS")
 
     def options(self):
@@ -91,80 +55,163 @@ class SearchHandler(tornado.web.RequestHandler):
         try:
             data = json.loads(self.request.body)
             query = data.get("query", "")
-            archives = data.get("archives", [])
-            board = data.get("board", "_")  # Default to all boards
-            use_regex = data.get("useRegex", False)
-            limit = data.get("limit", 50)
-            subject_only = data.get("subjectOnly", False)
-
-            # Generate cache key based on search parameters
-            cache_key = cache_manager.generate_cache_key(
-                {
-                    "query": query,
-                    "archives": archives,
-                    "board": board,
-                    "useRegex": use_regex,
-                    "limit": limit,
-                    "subjectOnly": subject_only,
-                }
-            )
+            search_query = parse_search_request(data)
 
-            # Try to get cached result first
-            cached_result = cache_manager.get_cached_result(cache_key)
-            if cached_result:
+            # Try to get cached result first, stale or not; a cached search
+            # with a larger limit answers this one too
+            entry = await search_service.lookup(search_query)
+            if entry is not None:
                 print(f"Cache hit for query: {query}")
-                self.write({"results": cached_result, "cached": True})
+                if entry.stale:
+                    search_service.refresh(search_query.widen(entry.limit))
+                if entry.error:
+                    self.write({"error": entry.error, "cached": True})
+                else:
+                    await self.write_json({"results": entry.value, "cached": True})
                 return
 
-            # If not in cache, perform the search
-            moe_searcher = MoeSearcher()
+            # If not in cache, perform the search; identical concurrent
+            # misses share the one in flight
+            processed_results = await search_service.search(search_query)
 
-            # Prepare search parameters
-            search_kwargs = {"text": query, "board": board, "limit": limit}
+            await self.write_json({"results": processed_results, "cached": False})
+        except Exception as e:
+            self.write({"error": str(e)})
 
-            # Add regex parameter if supported by the search method
-            if use_regex:
-                search_kwargs["regex"] = (
-                    query  # This would need to be handled by the backend
-                )
+    async def write_json(self, payload):
+        """Write a results payload, encoded in a worker thread when large"""
+        body = await pool.run_in_thread(
+            json_encode, payload, items=len(payload["results"])
+        )
+        self.write(body)
+
+
+class SearchStreamHandler(SearchHandler):
+    """
+    Streaming variant of /api/search.
+
+    Every archive page is written and flushed as soon as it arrives, so the
+    fastest archives render first. The body is NDJSON (one JSON object per
+    line) by default, or Server-Sent Events when the client sends
+    ``Accept: text/event-stream`` or ``?format=sse``. Result lines carry
+    ``source``, ``board`` and ``results`` in the /api/search result format;
+    the last line is ``{"done": true, ...}`` with the cross-archive overlap
+    statistics under ``merge``. The scrape is a ``search_service`` flight:
+    a request that joins one already running (streamed or not) gets its
+    results as one line once it finishes.
+    """
+
+    def prepare(self):
+        self.sse = self.get_argument(
+            "format", ""
+        ) == "sse" or "text/event-stream" in self.request.headers.get("Accept", "")
+        if self.sse:
+            self.set_header("Content-Type", "text/event-stream")
+        else:
+            self.set_header("Content-Type", "application/x-ndjson")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")
+
+    async def send(self, event, payload):
+        body = await pool.run_in_thread(
+            dumps, payload, items=len(payload.get("results", ()))
+        )
+        if self.sse:
+            self.write(f"event: {event}\ndata: {body}\n\n")
+        else:
+            self.write(body + "\n")
+        await self.flush()
 
-            # Add subject only parameter if needed
-            if subject_only:
-                search_kwargs["subject"] = query  # Search in subject field
+    async def post(self):
+        try:
+            data = json.loads(self.request.body)
+            query = data.get("query", "")
+            search_query = parse_search_request(data)
+        except Exception as e:
+            self.set_status(400)
+            await self.send("error", {"error": str(e)})
+            return
 
-            if len(archives) > 1:
-                search_results = await moe_searcher.multiArchiveSearch(
-                    archives=archives, **search_kwargs
-                )
-            else:
-                search_results = await moe_searcher.search(
-                    archive=archives[0], **search_kwargs
+        try:
+            entry = await search_service.lookup(search_query)
+            if entry is not None:
+                print(f"Cache hit for query: {query}")
+                if entry.stale:
+                    search_service.refresh(search_query.widen(entry.limit))
+                if entry.error:
+                    await self.send("error", {"error": entry.error, "cached": True})
+                    return
+                await self.send("results", {"results": entry.value, "cached": True})
+                await self.send(
+                    "done", {"done": True, "count": len(entry.value), "cached": True}
                 )
+                return
 
-            # Process the results
-            processed_results = self.process_results(search_results)
+            # The scrape runs as a flight, so identical streams and plain
+            # searches arriving meanwhile join it instead of scraping again.
+            # Batches reach this handler through the queue only when it leads
+            batches = asyncio.Queue()
+            finished = object()
+            merge_stats = {}
+
+            async def stream_search():
+                moe_searcher = MoeSearcher()
+                archives = search_query.archives
+                board = search_query.board
+                # Posts mirrored by several archives are sent once; a richer
+                # record arriving later is sent again under "updated"
+                merger = PostMerger(board=board)
+                async for source, posts in moe_searcher.iter_batches(
+                    archives, **search_query.search_kwargs()
+                ):
+                    batch, updated = [], []
+                    for post in posts:
+                        record, status = merger.add({"board": board, **post}, source)
+                        if status == "new":
+                            batch.append(record)
+                        elif status == "replaced":
+                            updated.append(record)
+                    if not batch and not updated:
+                        continue
+                    payload = {"source": source, "board": board, "results": batch}
+                    if updated:
+                        payload["updated"] = updated
+                    batches.put_nowait(payload)
+                processed_results = merger.posts()
+                merge_stats.update(merger.stats())
+
+                # Cache the complete result set once the stream has finished
+                sources = [moe_searcher.getArchiveName(archive) for archive in archives]
+                await search_service.cache_result(
+                    search_query, processed_results, sources
+                )
+                return processed_results
 
-            # Cache the results (only if caching is available)
-            if cache_manager.is_cache_warm():
-                cache_manager.set_cached_result(cache_key, processed_results)
-                print(f"Result cached for query: {query}")
+            flight = asyncio.ensure_future(
+                search_service.search(search_query, stream_search)
+            )
+            flight.add_done_callback(lambda _: batches.put_nowait(finished))
+            # The search goes on for the flight if this client disconnects
+            flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+            while True:
+                payload = await batches.get()
+                if payload is finished:
+                    break
+                await self.send("results", payload)
+            processed_results = flight.result()
+
+            done = {"done": True, "count": len(processed_results), "cached": False}
+            if merge_stats:
+                done["merge"] = merge_stats
             else:
-                print("Redis not available, skipping cache")
-
-            self.write({"results": processed_results, "cached": False})
+                # Another request ran the search: its results arrive whole
+                await self.send("results", {"results": processed_results})
+            await self.send("done", done)
+        except tornado.iostream.StreamClosedError:
+            print(f"Client disconnected from stream for query: {query}")
         except Exception as e:
-            self.write({"error": str(e)})
-
-    def process_results(self, search_results):
-        results = []
-        if isinstance(search_results, pd.DataFrame):
-            results = search_results.to_dict(orient="records")
-        elif isinstance(search_results, dict):
-            for archive_name, archive_data in search_results.items():
-                board = archive_data.get("board", "_")
-                for result in archive_data.get("results", []):
-                    results.append({"source": archive_name, "board": board, **result})
-        return results
+            await self.send("error", {"error": str(e)})
 
 
 def make_app(is_desktop=False):
@@ -179,6 +226,7 @@ def make_app(is_desktop=False):
 
     handlers = [
         (r"/api/search", SearchHandler),
+        (r"/api/search/stream", SearchStreamHandler),
         (
             r"/manifest\.webmanifest",
             tornado.web.StaticFileHandler,
@@ -200,8 +248,19 @@ def make_app(is_desktop=False):
 
 if __name__ == "__main__":
     is_desktop = "--desktop" in sys.argv
+    if "--shared-flight" in sys.argv:
+        search_service = SearchService(shared_flight=True)
     app = make_app(is_desktop)
     port = 8888
     app.listen(port)
     print(f"Server running on http://localhost:{port}")
-    tornado.ioloop.IOLoop.current().start()
+    io_loop = tornado.ioloop.IOLoop.current()
+    try:
+        io_loop.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Release the pooled archive and Redis connections and the workers
+        io_loop.run_sync(close_sessions)
+        io_loop.run_sync(search_service.close)
+        pool.shutdown()